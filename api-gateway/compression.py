@@ -0,0 +1,234 @@
+# File: /api-gateway/compression.py
+# Nén response ở API Gateway (middleware ASGI) - chỉ nén 1 lần, tại biên:
+# - Service luôn trả body chưa nén (gateway gửi Accept-Encoding: identity tới service)
+# - Chọn brotli hoặc gzip theo Accept-Encoding của client (có q-value); brotli là tùy chọn (pip install brotli)
+# - Chỉ nén kiểu nội dung dạng chữ (JSON, HTML, JS, CSS...) và body >= GATEWAY_COMPRESSION_MIN_BYTES
+# - Response có ETag (VD: /clinics từ cache của gateway): bản nén được nhớ theo (ETag, kiểu nén)
+#   -> response giống hệt nhau không bị nén lại ở mỗi request
+# - Body đã nén có ETag yếu (W/"...") vì khác byte với bản gốc; If-None-Match so sánh yếu nên vẫn ra 304
+
+import os
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Không cài brotli -> chỉ dùng gzip
+    brotli = None
+
+GATEWAY_COMPRESSION_ENABLED = os.getenv("GATEWAY_COMPRESSION_ENABLED", "1") == "1"
+GATEWAY_COMPRESSION_MIN_BYTES = int(os.getenv("GATEWAY_COMPRESSION_MIN_BYTES", "1024"))
+GATEWAY_GZIP_LEVEL = int(os.getenv("GATEWAY_GZIP_LEVEL", "6"))
+GATEWAY_BROTLI_QUALITY = int(os.getenv("GATEWAY_BROTLI_QUALITY", "5"))
+GATEWAY_COMPRESSION_MEMO_ENTRIES = int(os.getenv("GATEWAY_COMPRESSION_MEMO_ENTRIES", "512"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "text/", "application/javascript", "application/xml", "image/svg+xml",
+)
+
+
+def supported_encodings() -> list[str]:
+    """Theo thứ tự ưu tiên khi client chấp nhận ngang nhau"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate(accept_encoding: str, encodings: list[str] | None = None) -> str | None:
+    """
+    'gzip;q=0.8, br' -> 'br'. None nếu client không nhận kiểu nén nào gateway hỗ trợ.
+    encodings: các kiểu nén có sẵn (VD: bản nén sẵn của file tĩnh), mặc định là các kiểu gateway nén được.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for encoding in (supported_encodings() if encodings is None else encodings):
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=GATEWAY_BROTLI_QUALITY)
+            self.compress, self._finish = self._compressor.process, self._compressor.finish
+        else:
+            # wbits = 16 + MAX_WBITS -> định dạng gzip (có header / CRC)
+            self._compressor = zlib.compressobj(GATEWAY_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self._finish = self._compressor.compress, self._compressor.flush
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    encoder = _Encoder(encoding)
+    return encoder.compress(body) + encoder.finish()
+
+
+class CompressionStats:
+    """Số liệu + bộ nhớ bản nén theo ETag (dùng chung cho mọi instance của middleware)"""
+
+    def __init__(self, memo_entries: int):
+        self.memo_entries = memo_entries
+        self._memo: OrderedDict[tuple[str, str], bytes] = OrderedDict()  # (ETag, kiểu nén) -> body đã nén
+        self.compressed = 0
+        self.memo_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def memo_get(self, key):
+        body = self._memo.get(key)
+        if body is not None:
+            self._memo.move_to_end(key)
+            self.memo_hits += 1
+        return body
+
+    def memo_put(self, key, body: bytes):
+        self._memo[key] = body
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_entries:
+            self._memo.popitem(last=False)
+
+    def record(self, size_in: int, size_out: int):
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+
+    def stats(self) -> dict:
+        return {
+            "enabled": GATEWAY_COMPRESSION_ENABLED,
+            "encodings": supported_encodings(),
+            "min_bytes": GATEWAY_COMPRESSION_MIN_BYTES,
+            "compressed_responses": self.compressed,
+            "memo_entries": len(self._memo),
+            "memo_hits": self.memo_hits,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+        }
+
+
+compression_stats = CompressionStats(GATEWAY_COMPRESSION_MEMO_ENTRIES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = GATEWAY_COMPRESSION_MIN_BYTES,
+                 stats: CompressionStats = compression_stats):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.stats = stats
+
+    def _eligible(self, headers: list[tuple[bytes, bytes]], status: int) -> bool:
+        if status < 200 or status in (204, 206, 304):
+            return False
+        values = {name.decode("latin-1"): value.decode("latin-1").lower() for name, value in headers}
+        if "content-encoding" in values or "no-transform" in values.get("cache-control", ""):
+            return False
+        if not values.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = values.get("content-length")
+        return length is None or int(length) >= self.minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not GATEWAY_COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+        accept = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value
+        encoding = negotiate(accept.decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None       # None: chưa có; False: chuyển tiếp nguyên trạng
+        pending: list[bytes] = []  # Body giữ lại cho tới khi đủ ngưỡng để quyết định có nén không
+        encoder: _Encoder | None = None
+
+        def compressed_headers(headers, length: int | None):
+            result, vary = [], None
+            for name, value in headers:
+                if name == b"content-length":
+                    continue
+                if name == b"vary":
+                    vary = value
+                    continue
+                if name == b"etag" and not value.startswith(b"W/"):
+                    value = b"W/" + value
+                result.append((name, value))
+            if vary is None:
+                vary = b"Accept-Encoding"
+            elif b"accept-encoding" not in vary.lower() and vary != b"*":
+                vary += b", Accept-Encoding"
+            result += [(b"vary", vary), (b"content-encoding", encoding.encode("latin-1"))]
+            if length is not None:
+                result.append((b"content-length", str(length).encode("latin-1")))
+            return result
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                headers = [(name.lower(), value) for name, value in message.get("headers", [])]
+                if self._eligible(headers, message["status"]):
+                    start_message = {**message, "headers": headers}
+                else:
+                    start_message = False
+                    await send(message)
+                return
+            if start_message is False or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if encoder is not None:
+                # Đang nén dạng stream
+                chunk = encoder.compress(body) + (b"" if more else encoder.finish())
+                self.stats.record(len(body), len(chunk))
+                await send({"type": "http.response.body", "body": chunk, "more_body": more})
+                return
+
+            pending.append(body)
+            size = sum(len(part) for part in pending)
+            if more and size < self.minimum_size:
+                return
+            data = b"".join(pending)
+            pending.clear()
+            headers = start_message["headers"]
+            if not more:
+                # Có đủ body -> nén 1 lần (hoặc lấy bản đã nén theo ETag), gửi kèm Content-Length
+                if size < self.minimum_size:
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                etag = dict(headers).get(b"etag")
+                key = (etag.decode("latin-1"), encoding) if etag and not etag.startswith(b"W/") else None
+                compressed = self.stats.memo_get(key) if key else None
+                if compressed is None:
+                    compressed = compress(data, encoding)
+                    if key:
+                        self.stats.memo_put(key, compressed)
+                self.stats.compressed += 1
+                self.stats.record(size, len(compressed))
+                await send({**start_message, "headers": compressed_headers(headers, len(compressed))})
+                await send({"type": "http.response.body", "body": compressed})
+                return
+            # Body dài và còn tiếp -> nén dạng stream (không biết trước Content-Length)
+            encoder = _Encoder(encoding)
+            self.stats.compressed += 1
+            await send({**start_message, "headers": compressed_headers(headers, None)})
+            chunk = encoder.compress(data)
+            self.stats.record(size, len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,294 @@
+# File: /api-gateway/frontend_build.py
+# Build frontend (src/Frontend) thành bản phát hành cho API Gateway phục vụ (static_files.py):
+# - CSS / JS / ảnh được đặt tên theo nội dung: find.css -> find.3f2a1b4c5d.css
+#   -> gateway trả Cache-Control: immutable (1 năm); nội dung đổi thì tên đổi, không cần xóa cache trình duyệt
+# - Trang HTML giữ nguyên tên (là địa chỉ người dùng mở / liên kết tới nhau) và được kiểm tra lại mỗi lần (no-cache + ETag)
+# - Tham chiếu trong HTML (src/href, url(...) trong style) và CSS (url(...)) được viết lại sang tên đã băm;
+#   tham chiếu tới file không tồn tại / URL tuyệt đối / CDN giữ nguyên
+# - File dạng chữ có sẵn bản nén .gz (gzip mức 9) và .br (brotli mức 11, cần pip install brotli)
+#   -> gateway không phải nén lại ở mỗi request
+# - Ảnh PNG/JPEG (cần pip install Pillow): bản WebP (gateway trả khi trình duyệt gửi Accept: image/webp)
+#   và bản thu nhỏ theo FRONTEND_IMAGE_WIDTHS (thêm srcset cho thẻ <img>)
+# - manifest.json mô tả toàn bộ file (đường dẫn, kiểu nội dung, băm, các biến thể)
+#
+# Cách dùng: python api-gateway/frontend_build.py   (chạy lại mỗi khi sửa src/Frontend)
+
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import time
+from urllib.parse import quote, unquote
+
+try:
+    import brotli
+except ImportError:  # Không cài brotli -> chỉ có bản .gz
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # Không cài Pillow -> không có bản WebP / thu nhỏ
+    Image = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRONTEND_SRC = os.getenv("FRONTEND_SRC", os.path.join(ROOT_DIR, "src", "Frontend"))
+FRONTEND_DIST = os.getenv("FRONTEND_DIST", os.path.join(FRONTEND_SRC, "dist"))
+FRONTEND_IMAGE_WIDTHS = tuple(
+    int(width) for width in os.getenv("FRONTEND_IMAGE_WIDTHS", "480,960,1600").split(",") if width.strip()
+)
+FRONTEND_WEBP_QUALITY = int(os.getenv("FRONTEND_WEBP_QUALITY", "80"))
+
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 10
+# Bản nén chỉ được giữ nếu nhỏ hơn bản gốc ít nhất 10%
+MIN_COMPRESSION_GAIN = 0.9
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/xml", "image/svg+xml",
+)
+RESIZABLE_IMAGES = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+# Thứ tự build: ảnh trước (CSS tham chiếu ảnh), rồi CSS, JS; HTML sau cùng
+_ORDER = {".css": 1, ".js": 2, ".html": 3}
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("application/javascript", ".js")
+
+_ATTR_RE = re.compile(r"""(\b(?:src|href|poster)\s*=\s*)(["'])([^"']*)\2""", re.IGNORECASE)
+_CSS_URL_RE = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""", re.IGNORECASE)
+_IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+
+
+# === 1. TIỆN ÍCH ===
+
+def content_type(path: str) -> str:
+    kind = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if kind.startswith("text/") or kind in ("application/javascript", "application/json"):
+        kind += "; charset=utf-8"
+    return kind
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(rel: str, digest: str, variant: str = "", ext: str | None = None) -> str:
+    """'css/find.css' -> 'css/find.3f2a1b4c5d.css' (variant: 'css/x.480w.<hash>.png')"""
+    stem, original_ext = posixpath.splitext(rel)
+    return f"{stem}{'.' + variant if variant else ''}.{digest}{ext or original_ext}"
+
+
+def _resolve(reference: str, from_rel: str) -> tuple[str, str] | None:
+    """Tham chiếu tương đối trong file from_rel -> (đường dẫn trong src, phần ?query/#hash) hoặc None"""
+    if not reference or reference.startswith(("/", "#", "data:", "mailto:", "tel:", "javascript:")):
+        return None
+    if re.match(r"^[a-zA-Z][a-zA-Z0-9+.\-]*:", reference):  # http:, https:...
+        return None
+    cut = min((i for i in (reference.find("?"), reference.find("#")) if i >= 0), default=len(reference))
+    path, suffix = reference[:cut], reference[cut:]
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(from_rel), unquote(path)))
+    if target.startswith(".."):
+        return None
+    return target, suffix
+
+
+def _relative(target: str, from_rel: str) -> str:
+    return quote(posixpath.relpath(target, posixpath.dirname(from_rel) or "."))
+
+
+# === 2. BUILD ===
+
+class FrontendBuild:
+    def __init__(self, src: str = FRONTEND_SRC, dist: str = FRONTEND_DIST):
+        self.src = src
+        self.dist = dist
+        self.renamed: dict[str, str] = {}   # đường dẫn gốc -> đường dẫn đã băm
+        self.files: dict[str, dict] = {}    # đường dẫn phục vụ -> mô tả (ghi vào manifest)
+
+    def _sources(self) -> list[str]:
+        dist = os.path.abspath(self.dist)
+        result = []
+        for directory, dirnames, filenames in os.walk(self.src):
+            if os.path.abspath(directory) == dist or os.path.abspath(directory).startswith(dist + os.sep):
+                dirnames[:] = []
+                continue
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            for filename in filenames:
+                if not filename.startswith("."):
+                    rel = os.path.relpath(os.path.join(directory, filename), self.src)
+                    result.append(rel.replace(os.sep, "/"))
+        return sorted(result, key=lambda rel: (_ORDER.get(posixpath.splitext(rel)[1].lower(), 0), rel))
+
+    def _write(self, rel: str, data: bytes, immutable: bool, **extra) -> dict:
+        path = os.path.join(self.dist, *rel.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        entry = {
+            "path": rel,
+            "type": content_type(rel),
+            "size": len(data),
+            "hash": content_hash(data),
+            "immutable": immutable,
+            "encodings": self._precompress(rel, path, data),
+            **extra,
+        }
+        self.files[rel] = entry
+        return entry
+
+    def _precompress(self, rel: str, path: str, data: bytes) -> dict[str, str]:
+        if not content_type(rel).startswith(COMPRESSIBLE_TYPES):
+            return {}
+        variants = {"gzip": (".gz", gzip.compress(data, compresslevel=9, mtime=0))}
+        if brotli is not None:
+            variants["br"] = (".br", brotli.compress(data, quality=11))
+        encodings = {}
+        for encoding, (suffix, compressed) in variants.items():
+            if len(compressed) <= len(data) * MIN_COMPRESSION_GAIN:
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+                encodings[encoding] = rel + suffix
+        return encodings
+
+    # --- Ảnh ---
+
+    def _image_variants(self, rel: str, data: bytes, hashed: str) -> dict:
+        """Bản WebP + bản thu nhỏ (cần Pillow). Trả về thông tin thêm cho mục manifest của ảnh gốc."""
+        fmt = RESIZABLE_IMAGES.get(posixpath.splitext(rel)[1].lower())
+        if Image is None or fmt is None:
+            return {}
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except Exception as e:
+            print(f"  Bỏ qua biến thể ảnh {rel}: {e}")
+            return {}
+        extra = {"width": image.width}
+        webp = self._write_webp(rel, image, len(data))
+        if webp:
+            extra["webp"] = webp
+        widths = {}
+        for width in sorted(set(FRONTEND_IMAGE_WIDTHS)):
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            if fmt == "JPEG":
+                resized.convert("RGB").save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+            else:
+                resized.save(buffer, "PNG", optimize=True)
+            variant = buffer.getvalue()
+            if len(variant) >= len(data):
+                continue
+            variant_rel = hashed_name(rel, content_hash(variant), f"{width}w")
+            self._write(variant_rel, variant, True, **self._webp_extra(variant_rel, resized, len(variant)))
+            widths[str(width)] = variant_rel
+        if widths:
+            extra["widths"] = {**widths, str(image.width): hashed}
+        return extra
+
+    def _write_webp(self, rel: str, image, original_size: int) -> str | None:
+        buffer = io.BytesIO()
+        try:
+            image.save(buffer, "WEBP", quality=FRONTEND_WEBP_QUALITY, method=6)
+        except Exception as e:  # Pillow build không có libwebp
+            print(f"  Không tạo được WebP cho {rel}: {e}")
+            return None
+        webp = buffer.getvalue()
+        if len(webp) >= original_size:
+            return None
+        webp_rel = hashed_name(rel, content_hash(webp), ext=".webp")
+        self._write(webp_rel, webp, True)
+        return webp_rel
+
+    def _webp_extra(self, rel: str, image, size: int) -> dict:
+        webp = self._write_webp(rel, image, size)
+        return {"webp": webp} if webp else {}
+
+    # --- Viết lại tham chiếu ---
+
+    def _rewrite_reference(self, reference: str, from_rel: str) -> str:
+        resolved = _resolve(reference, from_rel)
+        if resolved is None or resolved[0] not in self.renamed:
+            return reference
+        target, suffix = resolved
+        return _relative(self.renamed[target], from_rel) + suffix
+
+    def _rewrite_css(self, text: str, from_rel: str) -> str:
+        return _CSS_URL_RE.sub(
+            lambda m: f"url({m.group(1)}{self._rewrite_reference(m.group(2).strip(), from_rel)}{m.group(1)})", text,
+        )
+
+    def _add_srcset(self, tag: str, from_rel: str) -> str:
+        """<img src="a.png"> -> thêm srcset các bản thu nhỏ (trình duyệt không bao giờ tải bản lớn hơn bản gốc)"""
+        if re.search(r"\bsrcset\s*=", tag, re.IGNORECASE):
+            return tag
+        match = re.search(r"""\bsrc\s*=\s*(["'])([^"']*)\1""", tag, re.IGNORECASE)
+        resolved = _resolve(match.group(2), from_rel) if match else None
+        entry = self.files.get(self.renamed.get(resolved[0], "")) if resolved else None
+        if not entry or "widths" not in entry:
+            return tag
+        srcset = ", ".join(
+            f"{_relative(path, from_rel)} {width}w"
+            for width, path in sorted(entry["widths"].items(), key=lambda item: int(item[0]))
+        )
+        sizes = "" if re.search(r"\bsizes\s*=", tag, re.IGNORECASE) else ' sizes="100vw"'
+        end = -2 if tag.endswith("/>") else -1
+        return f'{tag[:end].rstrip()} srcset="{srcset}"{sizes}{" />" if end == -2 else ">"}'
+
+    def _rewrite_html(self, text: str, from_rel: str) -> str:
+        text = _IMG_TAG_RE.sub(lambda m: self._add_srcset(m.group(0), from_rel), text)
+        text = _ATTR_RE.sub(
+            lambda m: f"{m.group(1)}{m.group(2)}{self._rewrite_reference(m.group(3), from_rel)}{m.group(2)}", text,
+        )
+        return self._rewrite_css(text, from_rel)  # url(...) trong style="..." / <style>
+
+    # --- Chạy ---
+
+    def run(self) -> dict:
+        if os.path.isdir(self.dist):
+            shutil.rmtree(self.dist)
+        os.makedirs(self.dist)
+        for rel in self._sources():
+            with open(os.path.join(self.src, *rel.split("/")), "rb") as f:
+                data = f.read()
+            ext = posixpath.splitext(rel)[1].lower()
+            if ext == ".html":
+                # Trang: giữ nguyên tên, luôn kiểm tra lại
+                self._write(rel, self._rewrite_html(data.decode("utf-8"), rel).encode("utf-8"), False)
+                continue
+            if ext == ".css":
+                data = self._rewrite_css(data.decode("utf-8"), rel).encode("utf-8")
+            hashed = hashed_name(rel, content_hash(data))
+            self.renamed[rel] = hashed
+            entry = self._write(hashed, data, True)
+            entry.update(self._image_variants(rel, data, hashed))
+            # Tên gốc vẫn dùng được (VD: link cũ) nhưng không được cache lâu
+            self.files[rel] = {**entry, "immutable": False}
+
+        manifest = {
+            "version": 1,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "encodings": ["br", "gzip"] if brotli is not None else ["gzip"],
+            "images": Image is not None,
+            "files": dict(sorted(self.files.items())),
+        }
+        with open(os.path.join(self.dist, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+
+def build(src: str = FRONTEND_SRC, dist: str = FRONTEND_DIST) -> dict:
+    return FrontendBuild(src, dist).run()
+
+
+if __name__ == "__main__":
+    manifest = build()
+    print(f"Đã build {len(manifest['files'])} đường dẫn -> {FRONTEND_DIST}")
+    print(f"Bản nén: {', '.join(manifest['encodings'])}; biến thể ảnh (WebP / thu nhỏ): "
+          f"{'có' if manifest['images'] else 'không (pip install Pillow)'}")
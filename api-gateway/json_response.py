@@ -0,0 +1,16 @@
+# File: /api-gateway/json_response.py
+# Response JSON mã hóa bằng orjson cho API Gateway (bản tương ứng của services/_shared/json_response.py;
+# gateway chạy như 1 script riêng nên không import được package services).
+# Gateway chỉ tự tạo JSON cho lỗi / số liệu; body từ service được chuyển tiếp nguyên byte.
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,11 +1,38 @@
-import uvicorn
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, HTMLResponse 
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
+import asyncio
 import logging
+import math
 import os 
+import time
+from contextlib import asynccontextmanager
 from fastapi.templating import Jinja2Templates 
+from response_cache import (
+    gateway_cache,
+    shared_max_age,
+    etag_matches,
+    CACHED_HEADERS,
+    GATEWAY_CACHE_ENABLED,
+    GATEWAY_CACHE_MAX_BODY_BYTES,
+)
+from upstream import Upstream, UpstreamConfig, CircuitOpenError
+from json_response import ORJSONResponse
+from compression import CompressionMiddleware, compression_stats
+from openapi_docs import OpenAPIDocs
+from static_files import static_site, GATEWAY_STATIC_PREFIX
+from metrics import MetricsMiddleware, metrics_response, request_id_var, upstream_duration
+from rate_limit import rate_limiter, retry_after_header, PayloadTooLargeError, GATEWAY_RATE_LIMIT_ENABLED
+from token_auth import (
+    token_verifier,
+    revocation_feed,
+    TokenError,
+    UnknownKeyError,
+    COOKIE_NAME,
+    GATEWAY_AUTH_FAST_PATH,
+)
 
 # --- Cấu hình (Mới) ---
 logging.basicConfig(level=logging.INFO)
@@ -14,11 +41,74 @@ logger = logging.getLogger(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
+# --- Ánh xạ Service ---
+# Mỗi service có thể chạy nhiều instance (nhiều tiến trình uvicorn).
+# Ghi đè bằng biến môi trường, VD: GATEWAY_SEARCH_URLS=http://localhost:8002,http://localhost:8012
+def _service_urls(name: str, default: str) -> list[str]:
+    raw = os.getenv(f"GATEWAY_{name.upper()}_URLS", default)
+    return [url.strip() for url in raw.split(",") if url.strip()]
+
+SERVICE_URLS = {
+    "auth": _service_urls("auth", "http://localhost:8001"),
+    "search": _service_urls("search", "http://localhost:8002"),
+    "booking": _service_urls("booking", "http://localhost:8003"),
+}
+
+# Mở sẵn kết nối tới các service trước khi nhận request (launcher bật mặc định)
+GATEWAY_STARTUP_WARM_UP = os.getenv("GATEWAY_STARTUP_WARM_UP", "0") == "1"
+
+# Cookie service đặt sau khi user ghi dữ liệu (xem services/_shared/db.py: RW_COOKIE)
+READ_YOUR_WRITES_COOKIE = "findmydentist_rw"
+
+# --- (MỚI) Cấu hình kết nối riêng cho từng service ---
+# Ghi đè bằng biến môi trường, VD: GATEWAY_AUTH_READ_TIMEOUT=5, GATEWAY_SEARCH_MAX_CONNECTIONS=200
+upstreams = {
+    # Auth: bcrypt chậm -> cho phép đọc lâu hơn
+    "auth": Upstream("auth", SERVICE_URLS["auth"], UpstreamConfig.from_env(
+        "auth", read_timeout=10.0, failure_threshold=5,
+    )),
+    # Search: chỉ đọc, nên phản hồi nhanh -> timeout ngắn, retry được
+    "search": Upstream("search", SERVICE_URLS["search"], UpstreamConfig.from_env(
+        "search", read_timeout=5.0, max_connections=200,
+    )),
+    # Booking: đặt lịch là POST (không retry); tra lịch trống chỉ đọc bitmap trong bộ nhớ
+    "booking": Upstream("booking", SERVICE_URLS["booking"], UpstreamConfig.from_env(
+        "booking", read_timeout=5.0,
+    )),
+}
+
+# Tài liệu OpenAPI gộp của các service (path có tiền tố như khi gọi qua gateway)
+openapi_docs = OpenAPIDocs({service: f"/api/{service}" for service in SERVICE_URLS})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Health check chủ động cho từng instance của mỗi service
+    for upstream in upstreams.values():
+        upstream.start_health_checks()
+    # Danh sách token bị thu hồi (để tự trả lời /api/auth/me)
+    revocation_feed.start(upstreams["auth"])
+    rate_limiter.start()
+    # Lấy + gộp spec OpenAPI ở nền (trước đó phục vụ từ bản lưu trong .cache/ hoặc merged_openapi.json)
+    openapi_docs.start(upstreams)
+    # Frontend đã build (python api-gateway/frontend_build.py) -> nạp vào bộ nhớ
+    static_site.load()
+    if GATEWAY_STARTUP_WARM_UP:
+        await asyncio.gather(*(upstream.warm_up() for upstream in upstreams.values()))
+    yield
+    await openapi_docs.stop()
+    await rate_limiter.stop()
+    await revocation_feed.stop()
+    # Đóng các pool kết nối tới service khi gateway tắt
+    for upstream in upstreams.values():
+        await upstream.aclose()
+
 # ===== (QUAN TRỌNG) TẮT SWAGGER TỰ ĐỘNG =====
 app = FastAPI(
     title="FindMyDentist API Gateway",
     docs_url=None,  # Tắt /docs mặc định
-    redoc_url=None  # Tắt /redoc mặc định
+    redoc_url=None, # Tắt /redoc mặc định
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 # =================================================
 
@@ -31,12 +121,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- Ánh xạ Service (Giữ nguyên) ---
-SERVICE_URLS = {
-    "auth": "http://localhost:8001",
-    "search": "http://localhost:8002",
-}
-client = httpx.AsyncClient()
+# --- Nén gzip/brotli: chỉ làm ở đây (service luôn trả body chưa nén) ---
+app.add_middleware(CompressionMiddleware)
+
+# --- Đo thời gian request + X-Request-ID: ngoài cùng nên thêm sau cùng ---
+app.add_middleware(MetricsMiddleware)
+
 
 # ===== (MỚI) ENDPOINT HIỂN THỊ SWAGGER TỔNG =====
 # Chúng ta chiếm lại đường dẫn /docs bằng trang tùy chỉnh
@@ -46,69 +136,291 @@ async def get_unified_swagger_ui(request: Request):
     Hiển thị trang HTML Swagger UI tùy chỉnh (có dropdown).
     """
     # Đảm bảo bạn đã tạo file /api-gateway/templates/swagger_ui.html
-    return templates.TemplateResponse("swagger_ui.html", {
-        "request": request,
+    return templates.TemplateResponse(request, "swagger_ui.html", {
         "service_urls": [
+            {"name": "Tất cả (đã gộp)", "url": "/docs-specs/all.json"},
             {"name": "Auth Service", "url": "/docs-specs/auth.json"},
             {"name": "Search Service", "url": "/docs-specs/search.json"},
+            {"name": "Booking Service", "url": "/docs-specs/booking.json"},
         ]
     })
 
-# ===== (MỚI) CÁC ENDPOINT FETCHER (LẤY TÀI LIỆU) =====
-@app.get("/docs-specs/auth.json")
-async def get_auth_openapi():
-    """Lấy schema OpenAPI từ Auth service (Port 8001)"""
-    try:
-        response = await client.get(f"{SERVICE_URLS['auth']}/openapi.json")
-        return JSONResponse(content=response.json(), status_code=response.status_code)
-    except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+# ===== (MỚI) TÀI LIỆU OPENAPI (PHỤC VỤ TỪ BỘ NHỚ) =====
+# Spec được lấy từ service khi khởi động + định kỳ rồi gộp sẵn (openapi_docs.py);
+# mở trang /docs không tạo request nào tới service.
+@app.get("/docs-specs/{name}.json")
+async def get_openapi_spec(name: str, request: Request):
+    """Spec gộp ("all") hoặc spec của 1 service (path đã có tiền tố /api/<service>)"""
+    document = openapi_docs.document(name)
+    if document is None:
+        if name != "all" and name not in openapi_docs.prefixes:
+            return ORJSONResponse(content={"error": "Không có tài liệu này"}, status_code=404)
+        return ORJSONResponse(content={"error": "Tài liệu API chưa sẵn sàng"}, status_code=503)
+    body, etag = document
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-@app.get("/docs-specs/search.json")
-async def get_search_openapi():
-    """Lấy schema OpenAPI từ Search service (Port 8002)"""
-    try:
-        response = await client.get(f"{SERVICE_URLS['search']}/openapi.json")
-        return JSONResponse(content=response.json(), status_code=response.status_code)
-    except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
 
+# ===== HÀM PROXY VÀ ĐỊNH TUYẾN =====
+# Header chỉ có ý nghĩa trên 1 chặng kết nối (hop-by-hop, RFC 9110 7.6.1) -> không chuyển tiếp
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "proxy-connection",
+}
+
+def _strip_hop_by_hop(items) -> list[tuple[str, str]]:
+    """Bỏ header hop-by-hop (kể cả các header được liệt kê trong 'Connection'), giữ header lặp lại"""
+    items = list(items)
+    listed = set()
+    for name, value in items:
+        if name.lower() == "connection":
+            listed.update(token.strip().lower() for token in value.split(","))
+    return [
+        (name, value) for name, value in items
+        if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() not in listed
+    ]
+
+def _cache_headers(headers) -> dict:
+    """Các header cache (ETag, Cache-Control...) của service được chuyển tiếp cho client"""
+    return {
+        name: headers[name] for name in CACHED_HEADERS
+        if name in headers and name not in ("content-type", "content-encoding")
+    }
+
+def _from_cache(entry, if_none_match: str | None) -> Response:
+    """Trả response từ cache của gateway (304 nếu client đã có bản này)"""
+    if if_none_match and entry.etag and etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=_cache_headers(entry.headers))
+    return Response(content=entry.body, status_code=200, headers=entry.headers)
+
+def _streaming_response(r: httpx.Response, content) -> StreamingResponse:
+    """Chuyển tiếp nguyên status + header của service (giữ cả Set-Cookie lặp lại)"""
+    response = StreamingResponse(content, status_code=r.status_code, background=BackgroundTask(r.aclose))
+    response.raw_headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in _strip_hop_by_hop(r.headers.multi_items())
+    ]
+    return response
 
-# ===== HÀM PROXY VÀ ĐỊNH TUYẾN (Giữ nguyên) =====
-async def _proxy(request: Request, target_url: str):
+async def _proxy(request: Request, service: str, path: str):
+    """
+    Proxy dạng stream: body request/response đi thẳng qua gateway theo từng chunk,
+    không đọc hết vào bộ nhớ và không bao giờ parse/encode lại JSON.
+    """
+    upstream = upstreams[service]
+    target_path = f"/{path}"
     method = request.method
-    body = await request.body()
-    headers = dict(request.headers)
-    headers.pop("host", None)
+    # X-Internal-Token: chỉ gateway tự gửi cho API nội bộ, không nhận từ client
+    headers = _strip_hop_by_hop(
+        (name, value) for name, value in request.headers.items()
+        if name not in ("host", "accept-encoding", "x-internal-token")
+    )
+    # Nén chỉ làm 1 lần ở gateway (CompressionMiddleware) -> yêu cầu service trả body chưa nén
+    headers.append(("accept-encoding", "identity"))
+    if request.client:
+        forwarded = request.headers.get("x-forwarded-for")
+        headers = [(n, v) for n, v in headers if n != "x-forwarded-for"]
+        headers.append(("x-forwarded-for", f"{forwarded}, {request.client.host}" if forwarded else request.client.host))
+    # Cùng 1 mã request ở gateway và service -> ghép log / số liệu của 1 request
+    headers = [(n, v) for n, v in headers if n != "x-request-id"]
+    headers.append(("x-request-id", request_id_var.get() or ""))
+    if request.url.query:
+        target_path = f"{target_path}?{request.url.query}"
+
+    # Cache dùng chung của gateway cho GET: key = service + đường dẫn (gồm cả query string)
+    cache_key = None
+    entry = None
+    revalidating = False  # Gateway tự gửi If-None-Match = ETag của entry đã lưu
+    # User vừa ghi (cookie read-your-writes của services/_shared/db.py) -> không dùng cache, hỏi thẳng service
+    if GATEWAY_CACHE_ENABLED and method == "GET" and READ_YOUR_WRITES_COOKIE not in request.cookies:
+        cache_key = f"{service}:{target_path}"
+        entry = gateway_cache.get(cache_key)
+        if entry is not None and entry.fresh:
+            gateway_cache.hits += 1
+            return _from_cache(entry, request.headers.get("if-none-match"))
+        gateway_cache.misses += 1
+        if entry is not None and entry.etag:
+            # Entry hết hạn -> hỏi lại service bằng ETag đã lưu (revalidate)
+            headers = [(n, v) for n, v in headers if n != "if-none-match"]
+            headers.append(("if-none-match", entry.etag))
+            revalidating = True
 
+    # GET/DELETE không có body thì không mở stream request
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    started = time.perf_counter()
+    upstream_status = "error"
     try:
-        r = await client.request(
-            method=method,
-            url=target_url,
+        # Pool kết nối, timeout, retry và circuit breaker riêng của từng service (xem upstream.py)
+        r = await upstream.send(
+            method,
+            target_path,
             headers=headers,
-            content=body,
-            timeout=10.0
+            content=request.stream() if has_body else None,
+        )
+        upstream_status = str(r.status_code)
+    except CircuitOpenError as e:
+        upstream_status = "circuit_open"
+        return ORJSONResponse(
+            content={"error": "Microservice tạm thời không khả dụng"},
+            status_code=503,
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
         )
-        return JSONResponse(content=r.json(), status_code=r.status_code)
     except httpx.ConnectError as e:
-        return JSONResponse(content={"error": "Microservice không khả dụng"}, status_code=503)
+        return ORJSONResponse(content={"error": "Microservice không khả dụng"}, status_code=503)
+    except httpx.TimeoutException as e:
+        upstream_status = "timeout"
+        return ORJSONResponse(content={"error": "Microservice phản hồi quá chậm"}, status_code=504)
     except Exception as e:
-        return JSONResponse(content={"error": "Lỗi API Gateway"}, status_code=500)
+        return ORJSONResponse(content={"error": "Lỗi API Gateway"}, status_code=500)
+    finally:
+        upstream_duration.observe(time.perf_counter() - started, (service, upstream_status))
+
+    # 304 chỉ xác nhận entry khi chính gateway hỏi bằng ETag của entry; 304 trả lời ETag của client
+    # (entry không có ETag) thì chuyển thẳng cho client, giữ nguyên entry
+    if r.status_code == 304 and revalidating:
+        await r.aclose()
+        gateway_cache.refresh(cache_key, r.headers, shared_max_age(r.headers) or 0)
+        return _from_cache(entry, request.headers.get("if-none-match"))
+
+    if cache_key is not None and r.status_code == 200:
+        max_age = shared_max_age(r.headers)
+        length = r.headers.get("content-length")
+        if max_age and length is not None and int(length) <= GATEWAY_CACHE_MAX_BODY_BYTES:
+            # Response được phép cache và đủ nhỏ: đọc nguyên byte (không giải nén) để lưu
+            try:
+                body = b"".join([chunk async for chunk in r.aiter_raw()])
+            except httpx.HTTPError:
+                return ORJSONResponse(content={"error": "Lỗi API Gateway"}, status_code=502)
+            finally:
+                await r.aclose()
+            gateway_cache.store(cache_key, body, r.headers, max_age)
+            return _streaming_response(r, iter([body]))
+
+    return _streaming_response(r, r.aiter_raw())
+
+async def _rate_limited(request: Request) -> Response | None:
+    """429 nếu request vượt giới hạn (theo IP / route / email), chặn trước khi tới service"""
+    if not GATEWAY_RATE_LIMIT_ENABLED:
+        return None
+    try:
+        retry_after = await rate_limiter.check(request)
+    except PayloadTooLargeError:
+        # Body quá lớn (hoặc chunked quá lớn) ở API đăng nhập/OTP -> không lấy được email để giới hạn
+        return ORJSONResponse(content={"error": "Dữ liệu gửi lên quá lớn"}, status_code=413)
+    if retry_after <= 0:
+        return None
+    return ORJSONResponse(
+        content={"error": "Quá nhiều yêu cầu, vui lòng thử lại sau"},
+        status_code=429,
+        headers={"Retry-After": retry_after_header(retry_after)},
+    )
+
+@app.get("/api/auth/me")
+async def auth_me(request: Request):
+    """
+    Fast path: gateway tự xác thực cookie JWT và trả lời giống auth_service,
+    không tốn 1 chặng mạng. Chưa đồng bộ được danh sách thu hồi thì chuyển tiếp như cũ.
+    """
+    if (limited := await _rate_limited(request)) is not None:
+        return limited
+    if not GATEWAY_AUTH_FAST_PATH or not token_verifier.ready():
+        return await _proxy(request, "auth", "me")
+    token = request.cookies.get(COOKIE_NAME)
+    if not token:
+        return ORJSONResponse(content={"detail": "Chưa đăng nhập (Không tìm thấy cookie)"}, status_code=401)
+    try:
+        claims = token_verifier.verify(token)
+    except UnknownKeyError:
+        # Có thể auth_service vừa xoay khóa -> để auth_service trả lời, tải lại JWKS ở nền
+        revocation_feed.sync_soon(jwks=True)
+        return await _proxy(request, "auth", "me")
+    except TokenError as e:
+        return ORJSONResponse(content={"detail": e.detail}, status_code=401)
+    return {"user_id": claims["sub"], "role": claims["role"]}
 
 @app.api_route("/api/auth/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def proxy_auth(request: Request, path: str):
-    target_url = f"{SERVICE_URLS['auth']}/{path}"
-    return await _proxy(request, target_url)
+    if (limited := await _rate_limited(request)) is not None:
+        return limited
+    response = await _proxy(request, "auth", path)
+    if request.method == "POST" and response.status_code < 400:
+        if path == "logout":
+            token_verifier.revoke_local(request.cookies.get(COOKIE_NAME))
+        elif path == "reset-password":
+            revocation_feed.sync_soon()
+    return response
 
 @app.api_route("/api/search/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def proxy_search(request: Request, path: str):
-    target_url = f"{SERVICE_URLS['search']}/{path}"
-    return await _proxy(request, target_url)
+    if (limited := await _rate_limited(request)) is not None:
+        return limited
+    return await _proxy(request, "search", path)
+
+@app.api_route("/api/booking/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def proxy_booking(request: Request, path: str):
+    if (limited := await _rate_limited(request)) is not None:
+        return limited
+    return await _proxy(request, "booking", path)
+
+# ===== FRONTEND (FILE TĨNH ĐÃ BĂM TÊN + NÉN SẴN) =====
+@app.get(GATEWAY_STATIC_PREFIX, include_in_schema=False)
+@app.get(GATEWAY_STATIC_PREFIX + "/", include_in_schema=False)
+def redirect_frontend_index():
+    return static_site.index_redirect()
+
+@app.api_route(GATEWAY_STATIC_PREFIX + "/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_frontend_file(path: str, request: Request):
+    """VD: /app/pages/find.html, /app/css/find.1f75a6b6f5.css (xem static_files.py)"""
+    return static_site.response(path, request)
 
 @app.get("/")
 def read_root():
     return {"message": "API Gateway (FastAPI) đang chạy"}
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Số liệu dạng Prometheus (độ trễ theo route, thời gian chờ từng service)"""
+    return metrics_response()
+
+@app.get("/gateway/upstreams")
+def read_upstream_status():
+    """Trạng thái từng service: các instance (health, circuit breaker, request dở dang), số request/retry/lỗi"""
+    return {name: upstream.status() for name, upstream in upstreams.items()}
+
+@app.get("/gateway/cache-stats")
+def read_gateway_cache_stats():
+    """Số liệu cache dùng chung của gateway"""
+    return gateway_cache.stats()
+
+@app.get("/gateway/compression")
+def read_compression_stats():
+    """Số liệu nén response: số response đã nén, byte trước / sau khi nén"""
+    return compression_stats.stats()
+
+@app.get("/gateway/static")
+def read_static_stats():
+    """Số liệu frontend: số file (trong bộ nhớ), lượt tải theo kiểu nén, số 304"""
+    return static_site.stats()
+
+@app.get("/gateway/docs")
+def read_openapi_docs_status():
+    """Trạng thái tài liệu OpenAPI: nguồn của từng service (live / snapshot), tuổi, lỗi gần nhất"""
+    return openapi_docs.status()
+
+@app.get("/gateway/rate-limit")
+def read_rate_limit_stats():
+    """Số liệu rate limit: số request bị chặn theo từng quy tắc"""
+    return rate_limiter.stats()
+
+@app.get("/gateway/token-cache")
+def read_gateway_token_cache_stats():
+    """Số liệu xác thực token tại gateway (cache, danh sách thu hồi, trạng thái đồng bộ)"""
+    return token_verifier.stats()
+
 if __name__ == "__main__":
+    import uvicorn  # Chỉ cần khi chạy trực tiếp (launcher / uvicorn CLI tự import)
     logger.info("Khởi động API Gateway trên port 8000")
     uvicorn.run(app, host="127.0.0.1", port=8000) # Đổi sang 127.0.0.1 cho dễ click
\ No newline at end of file
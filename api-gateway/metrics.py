@@ -0,0 +1,139 @@
+# File: /api-gateway/metrics.py
+# Đo đạc của API Gateway, xuất định dạng Prometheus tại GET /metrics
+# (cùng logic với services/_shared/metrics.py - gateway chạy riêng nên không import được):
+# - http_request_duration_seconds{method, route, status}: toàn bộ thời gian ở gateway (route = mẫu đường dẫn)
+# - gateway_upstream_duration_seconds{service, status}: từ lúc gửi tới service tới khi nhận header (trong _proxy)
+#   -> thời gian của riêng chặng gateway = http_request_duration - upstream
+# - X-Request-ID: nhận từ client nếu hợp lệ, không thì tự tạo; chuyển tiếp cho service và trả lại cho client
+#   (traceparent / tracestate của W3C được chuyển tiếp nguyên trạng như mọi header khác)
+
+import os
+import re
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from fastapi.responses import Response
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._\-]{1,64}$")
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # nhãn -> [số mẫu theo từng bucket..., số mẫu > bucket cuối, tổng]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request ở gateway (tới khi gửi xong body)",
+    ("method", "route", "status"),
+))
+upstream_duration = registry.register(Histogram(
+    "gateway_upstream_duration_seconds", "Thời gian chờ service trả header (status = error nếu lỗi kết nối)",
+    ("service", "status"),
+))
+
+
+def metrics_response() -> Response:
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """Đặt ngoài cùng (add_middleware sau cùng); gắn X-Request-ID vào response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))],
+                }
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if METRICS_ENABLED:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                http_request_duration.observe(time.perf_counter() - started, (scope["method"], route, str(status_code)))
+            request_id_var.reset(token)
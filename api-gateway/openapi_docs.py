@@ -0,0 +1,287 @@
+# File: /api-gateway/openapi_docs.py
+# Tài liệu OpenAPI tổng hợp, phục vụ từ bộ nhớ của gateway:
+# - Lấy openapi.json của từng service khi khởi động và định kỳ (GATEWAY_DOCS_REFRESH_INTERVAL),
+#   không phải mỗi lần mở trang /docs -> traffic tài liệu không bao giờ tới service
+# - Gộp thành 1 spec: path thêm tiền tố /api/<service>, schema trùng tên nhưng khác nội dung được đổi tên,
+#   operationId trùng được thêm tiền tố service, operation không có tag được gắn tag theo service
+# - Mỗi tài liệu (bản gộp "all" và từng service) được mã hóa sẵn 1 lần, kèm ETag -> trả 304 khi không đổi
+# - Service không trả lời: giữ bản tốt gần nhất trong bộ nhớ; lúc khởi động thì lấy từ file
+#   GATEWAY_DOCS_SNAPSHOT (.cache/, không commit; ghi lại mỗi khi lấy đủ spec của mọi service),
+#   chưa có thì từ merged_openapi.json của repo (chỉ đọc)
+
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+import time
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GATEWAY_DOCS_REFRESH_INTERVAL = float(os.getenv("GATEWAY_DOCS_REFRESH_INTERVAL", "300"))
+# Còn service chưa lấy được spec -> thử lại sớm hơn
+GATEWAY_DOCS_RETRY_INTERVAL = float(os.getenv("GATEWAY_DOCS_RETRY_INTERVAL", "15"))
+GATEWAY_DOCS_SNAPSHOT = os.getenv(
+    "GATEWAY_DOCS_SNAPSHOT", os.path.join(os.path.dirname(BASE_DIR), ".cache", "merged_openapi.json")
+)
+# Bản gộp đi kèm repo: dùng khi chưa có snapshot (không bao giờ ghi đè)
+DOCS_SEED = os.path.join(os.path.dirname(BASE_DIR), "merged_openapi.json")
+
+MERGED_TITLE = "FindMyDentist - API Tổng Hợp (Đã gộp)"
+SCHEMA_REF_PREFIX = "#/components/schemas/"
+
+
+def _rewrite_refs(value, renames: dict[str, str]):
+    """Đổi "$ref": "#/components/schemas/<tên cũ>" -> tên mới (đệ quy, sửa tại chỗ)"""
+    if isinstance(value, dict):
+        ref = value.get("$ref")
+        if isinstance(ref, str) and ref.startswith(SCHEMA_REF_PREFIX):
+            name = ref[len(SCHEMA_REF_PREFIX):]
+            if name in renames:
+                value["$ref"] = SCHEMA_REF_PREFIX + renames[name]
+        for item in value.values():
+            _rewrite_refs(item, renames)
+    elif isinstance(value, list):
+        for item in value:
+            _rewrite_refs(item, renames)
+
+
+def _referenced_schemas(value, schemas: dict, found: set[str] | None = None) -> set[str]:
+    """Tên các schema được tham chiếu (kể cả gián tiếp qua schema khác)"""
+    found = set() if found is None else found
+    if isinstance(value, dict):
+        ref = value.get("$ref")
+        if isinstance(ref, str) and ref.startswith(SCHEMA_REF_PREFIX):
+            name = ref[len(SCHEMA_REF_PREFIX):]
+            if name not in found and name in schemas:
+                found.add(name)
+                _referenced_schemas(schemas[name], schemas, found)
+        for item in value.values():
+            _referenced_schemas(item, schemas, found)
+    elif isinstance(value, list):
+        for item in value:
+            _referenced_schemas(item, schemas, found)
+    return found
+
+
+def merge_specs(specs: dict[str, dict], prefixes: dict[str, str], title: str = MERGED_TITLE) -> dict:
+    """
+    Gộp spec của các service ({service: spec}) thành 1 spec.
+    prefixes: {service: "/api/<service>"}
+    """
+    merged = {
+        "openapi": next((spec.get("openapi") for spec in specs.values() if spec.get("openapi")), "3.1.0"),
+        "info": {"title": title, "version": "1.0.0"},
+        "paths": {},
+        "components": {},
+    }
+    components = merged["components"]
+    operation_ids: set[str] = set()
+
+    for service, spec in specs.items():
+        spec = copy.deepcopy(spec)
+        own_components = spec.get("components", {})
+
+        # Schema trùng tên nhưng khác nội dung -> đổi tên theo service (VD: Search_ClinicOut)
+        schemas = components.setdefault("schemas", {})
+        renames = {
+            name: f"{service.capitalize()}_{name}"
+            for name, schema in own_components.get("schemas", {}).items()
+            if name in schemas and schemas[name] != schema
+        }
+        if renames:
+            _rewrite_refs(spec, renames)
+            own_components["schemas"] = {
+                renames.get(name, name): schema for name, schema in own_components["schemas"].items()
+            }
+        for section, items in own_components.items():
+            target = components.setdefault(section, {})
+            for name, item in items.items():
+                target.setdefault(name, item)
+
+        prefix = prefixes[service]
+        tag = service.capitalize()
+        for path, operations in spec.get("paths", {}).items():
+            for method, operation in operations.items():
+                if not isinstance(operation, dict) or "responses" not in operation:
+                    continue  # "parameters", "summary"... ở cấp path
+                operation.setdefault("tags", [tag])
+                operation_id = operation.get("operationId")
+                if operation_id:
+                    if operation_id in operation_ids:
+                        operation_id = operation["operationId"] = f"{service}_{operation_id}"
+                    operation_ids.add(operation_id)
+            merged["paths"][prefix + path] = operations
+
+    if not components.get("schemas"):
+        components.pop("schemas", None)
+    return merged
+
+
+def _encode(document: dict) -> tuple[bytes, str]:
+    body = orjson.dumps(document)
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+class OpenAPIDocs:
+    """Spec của từng service (bản tốt gần nhất) + các tài liệu đã gộp, mã hóa sẵn"""
+
+    def __init__(self, prefixes: dict[str, str], snapshot_path: str | None = GATEWAY_DOCS_SNAPSHOT):
+        self.prefixes = prefixes
+        self.snapshot_path = snapshot_path
+        self._specs: dict[str, dict] = {}         # service -> openapi.json gốc (bản tốt gần nhất)
+        self._fetched_at: dict[str, float] = {}
+        self._errors: dict[str, str] = {}
+        self._snapshot: dict | None = None        # Bản gộp đọc từ file (dùng khi service chưa trả lời)
+        self._documents: dict[str, tuple[bytes, str]] = {}  # "all" / service -> (body, ETag)
+        self.refreshes = 0
+        self.rebuilds = 0
+        self._task: asyncio.Task | None = None
+
+    # --- Nguồn spec ---
+
+    def load_snapshot(self):
+        path = self.snapshot_path if self.snapshot_path and os.path.exists(self.snapshot_path) else DOCS_SEED
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                self._snapshot = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.warning(f"Không đọc được {path}: {e}")
+            return
+        self._rebuild()
+
+    def _from_snapshot(self, service: str) -> dict | None:
+        """Tách phần của 1 service ra khỏi bản gộp trên file (bỏ tiền tố path, chỉ giữ schema được dùng)"""
+        if self._snapshot is None:
+            return None
+        prefix = self.prefixes[service]
+        paths = {
+            path[len(prefix):]: operations
+            for path, operations in self._snapshot.get("paths", {}).items()
+            if path.startswith(prefix + "/")
+        }
+        if not paths:
+            return None
+        schemas = self._snapshot.get("components", {}).get("schemas", {})
+        used = _referenced_schemas(paths, schemas)
+        spec = {"openapi": self._snapshot.get("openapi"), "paths": paths}
+        if used:
+            spec["components"] = {"schemas": {name: schemas[name] for name in sorted(used)}}
+        return spec
+
+    async def fetch(self, service: str, upstream) -> bool:
+        """Lấy openapi.json của 1 service. True nếu spec thay đổi."""
+        try:
+            response = await upstream.send("GET", "/openapi.json", headers={}, stream=False)
+            response.raise_for_status()
+            spec = response.json()
+        except Exception as e:
+            # Giữ bản tốt gần nhất
+            self._errors[service] = str(e) or type(e).__name__
+            logger.warning(f"Không lấy được OpenAPI của {service}: {self._errors[service]}")
+            return False
+        self._errors.pop(service, None)
+        self._fetched_at[service] = time.time()
+        changed = self._specs.get(service) != spec
+        self._specs[service] = spec
+        return changed
+
+    async def refresh(self, upstreams: dict):
+        self.refreshes += 1
+        results = await asyncio.gather(*(
+            self.fetch(service, upstreams[service]) for service in self.prefixes
+        ))
+        if any(results) or not self._documents:
+            self._rebuild()
+            if self.complete:
+                self._write_snapshot()
+
+    # --- Tài liệu đã gộp ---
+
+    @property
+    def complete(self) -> bool:
+        """Đã có spec thật (không phải từ file) của mọi service"""
+        return all(service in self._specs for service in self.prefixes)
+
+    def _rebuild(self):
+        specs = {}
+        for service in self.prefixes:
+            spec = self._specs.get(service) or self._from_snapshot(service)
+            if spec is not None:
+                specs[service] = spec
+        if not specs:
+            return
+        documents = {"all": _encode(merge_specs(specs, self.prefixes))}
+        for service, spec in specs.items():
+            documents[service] = _encode(merge_specs(
+                {service: spec}, self.prefixes, title=f"FindMyDentist - {service.capitalize()} Service"
+            ))
+        self._documents = documents
+        self.rebuilds += 1
+
+    def _write_snapshot(self):
+        if not self.snapshot_path:
+            return
+        merged = orjson.loads(self._documents["all"][0])
+        # Tên file tạm riêng cho từng tiến trình (nhiều worker gateway cùng ghi)
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(merged, option=orjson.OPT_INDENT_2))
+            os.replace(tmp_path, self.snapshot_path)  # Thay file 1 lần, không để lại file ghi dở
+        except OSError as e:
+            logger.warning(f"Không ghi được {self.snapshot_path}: {e}")
+
+    def document(self, name: str) -> tuple[bytes, str] | None:
+        """(body, ETag) của tài liệu "all" hoặc của 1 service; None nếu chưa có"""
+        return self._documents.get(name)
+
+    # --- Tác vụ nền ---
+
+    async def _run(self, upstreams: dict):
+        while True:
+            try:
+                await self.refresh(upstreams)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Làm mới tài liệu OpenAPI thất bại: {e}")
+            await asyncio.sleep(GATEWAY_DOCS_REFRESH_INTERVAL if self.complete else GATEWAY_DOCS_RETRY_INTERVAL)
+
+    def start(self, upstreams: dict):
+        if self._task is None:
+            self.load_snapshot()
+            self._task = asyncio.create_task(self._run(upstreams))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        now = time.time()
+        return {
+            "documents": {name: {"bytes": len(body), "etag": etag} for name, (body, etag) in self._documents.items()},
+            "services": {
+                service: {
+                    "source": "live" if service in self._specs else ("snapshot" if self._from_snapshot(service) else None),
+                    "age_seconds": round(now - self._fetched_at[service], 1) if service in self._fetched_at else None,
+                    "last_error": self._errors.get(service),
+                }
+                for service in self.prefixes
+            },
+            "refreshes": self.refreshes,
+            "rebuilds": self.rebuilds,
+            "refresh_interval": GATEWAY_DOCS_REFRESH_INTERVAL,
+        }
@@ -0,0 +1,351 @@
+# File: /api-gateway/rate_limit.py
+# Giới hạn tần suất request (rate limit) tại gateway, chặn trước khi request tới service:
+# - Theo IP (toàn bộ /api), theo IP + route và theo email tài khoản cho các API đăng nhập/OTP
+#   (mỗi lần đăng nhập sai tốn 1 lần bcrypt ở auth_service -> rất dễ bị làm cạn CPU)
+# - Backend "memory": token bucket, mỗi key chỉ giữ (số token, thời điểm cập nhật) -> O(1) bộ nhớ;
+#   key không dùng nữa bị dọn định kỳ
+# - Backend "redis" (nhiều instance gateway dùng chung): sliding window xấp xỉ bằng 2 bộ đếm
+#   (cửa sổ hiện tại + cửa sổ trước), chỉ cần INCR/DECR/PEXPIRE/GET. Cache server lỗi -> cho qua (fail-open)
+# - Request chỉ được tính khi qua được mọi rule; vượt giới hạn -> 429 kèm Retry-After
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_RATE_LIMIT_ENABLED = os.getenv("GATEWAY_RATE_LIMIT_ENABLED", "1") == "1"
+GATEWAY_RATE_LIMIT_BACKEND = os.getenv("GATEWAY_RATE_LIMIT_BACKEND", "memory")  # "memory" hoặc "redis"
+GATEWAY_RATE_LIMIT_REDIS_URL = os.getenv("GATEWAY_RATE_LIMIT_REDIS_URL", "redis://127.0.0.1:6379/0")
+GATEWAY_RATE_LIMIT_MAX_KEYS = int(os.getenv("GATEWAY_RATE_LIMIT_MAX_KEYS", "100000"))
+GATEWAY_RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("GATEWAY_RATE_LIMIT_SWEEP_INTERVAL", "60"))
+# Body tối đa của các API có giới hạn theo email (đăng nhập/OTP chỉ vài trăm byte); lớn hơn -> 413
+MAX_BODY_FOR_EMAIL = 16 * 1024
+
+
+@dataclass
+class RateLimitRule:
+    name: str
+    path: str                # Đường dẫn tại gateway (khớp chính xác, hoặc tiền tố nếu kết thúc bằng "/")
+    key: str                 # "ip" hoặc "email" (email lấy từ body JSON)
+    limit: int               # Số request ...
+    period: float            # ... trong bao nhiêu giây
+    methods: tuple = ("POST",)
+
+    def matches(self, method: str, path: str) -> bool:
+        if method not in self.methods:
+            return False
+        return path.startswith(self.path) if self.path.endswith("/") else path == self.path
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "RateLimitRule":
+        """Ghi đè bằng biến môi trường GATEWAY_RATE_LIMIT_<TÊN>=<số request>/<giây>, VD: =5/60"""
+        rule = cls(name=name, **defaults)
+        raw = os.getenv(f"GATEWAY_RATE_LIMIT_{name.upper()}")
+        if raw:
+            limit, _, period = raw.partition("/")
+            rule.limit, rule.period = int(limit), float(period or rule.period)
+        return rule
+
+
+ALL_METHODS = ("GET", "POST", "PUT", "DELETE")
+
+RULES = [
+    RateLimitRule.from_env("ip", path="/api/", key="ip", limit=600, period=60, methods=ALL_METHODS),
+    RateLimitRule.from_env("login_ip", path="/api/auth/login", key="ip", limit=20, period=60),
+    RateLimitRule.from_env("login_email", path="/api/auth/login", key="email", limit=5, period=60),
+    RateLimitRule.from_env("register_ip", path="/api/auth/register", key="ip", limit=10, period=600),
+    RateLimitRule.from_env("reset_ip", path="/api/auth/request-reset", key="ip", limit=5, period=300),
+    RateLimitRule.from_env("reset_email", path="/api/auth/request-reset", key="email", limit=3, period=600),
+    RateLimitRule.from_env("otp_ip", path="/api/auth/verify-otp", key="ip", limit=10, period=300),
+    RateLimitRule.from_env("otp_email", path="/api/auth/verify-otp", key="email", limit=5, period=600),
+]
+
+
+# === 1. BACKEND TRONG PROCESS: TOKEN BUCKET ===
+class MemoryBackend:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list] = OrderedDict()  # key -> [số token còn lại, thời điểm cập nhật]
+        self.evictions = 0
+
+    def _refill(self, key: str, limit: int, period: float, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(limit), now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            bucket[0] = min(float(limit), bucket[0] + (now - bucket[1]) * limit / period)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def hit_all(self, limits: list[tuple[str, int, float]]) -> list[float]:
+        """
+        Lấy 1 token ở mọi bucket (key, limit, period), hoặc không lấy ở bucket nào nếu có bucket đã hết.
+        Trả về số giây phải chờ của từng bucket (0 = còn token)
+        """
+        now = time.monotonic()
+        buckets = [self._refill(key, limit, period, now) for key, limit, period in limits]
+        waits = [
+            0.0 if bucket[0] >= 1 else (1 - bucket[0]) * period / limit
+            for bucket, (_, limit, period) in zip(buckets, limits)
+        ]
+        if not any(waits):
+            for bucket in buckets:
+                bucket[0] -= 1
+        return waits
+
+    def sweep(self, max_period: float) -> int:
+        """Bỏ bucket không được dùng lâu hơn max_period (đã đầy lại -> giống như chưa từng có)"""
+        cutoff = time.monotonic() - max_period
+        stale = [key for key, (_, updated) in self._buckets.items() if updated < cutoff]
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets), "evictions": self.evictions}
+
+
+# === 2. BACKEND DÙNG CHUNG (GIAO THỨC REDIS): SLIDING WINDOW ===
+class RedisBackend:
+    """
+    Mỗi key có 2 bộ đếm: cửa sổ hiện tại và cửa sổ trước (tự hết hạn sau 2 chu kỳ).
+    Ước lượng số request trong `period` giây gần nhất = trước * (phần còn lại) + hiện tại.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+        self.errors = 0
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Kết nối tới cache server bị đóng")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise ConnectionError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            if int(rest) == -1:
+                return None
+            return (await self._reader.readexactly(int(rest) + 2))[:-2]
+        if kind == b"*":
+            return [await self._read_reply() for _ in range(int(rest))]
+        raise ConnectionError(f"Phản hồi không hợp lệ: {line!r}")
+
+    async def _pipeline(self, *commands):
+        """Gửi nhiều lệnh trong 1 lần ghi (1 round-trip), trả về danh sách kết quả"""
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout
+                    )
+                    prelude = []
+                    if self.password:
+                        prelude.append(("AUTH", self.password))
+                    if self.db:
+                        prelude.append(("SELECT", self.db))
+                    commands = (*prelude, *commands)
+                    skip = len(prelude)
+                else:
+                    skip = 0
+                self._writer.write(b"".join(self._encode(*command) for command in commands))
+                await self._writer.drain()
+                replies = [await asyncio.wait_for(self._read_reply(), self.timeout) for _ in commands]
+                return replies[skip:]
+            except BaseException as e:
+                # Lỗi kết nối, hoặc bị hủy (CancelledError/timeout) khi còn phản hồi chưa đọc:
+                # phản hồi đó sẽ bị đọc nhầm cho lệnh sau -> luôn bỏ kết nối, lần sau kết nối lại
+                if isinstance(e, Exception):
+                    self.errors += 1
+                if self._writer is not None:
+                    self._writer.close()
+                self._reader = self._writer = None
+                raise
+
+    async def hit_all(self, limits: list[tuple[str, int, float]]) -> list[float]:
+        """Giống MemoryBackend.hit_all: tăng mọi bộ đếm trong 1 round-trip, có key vượt thì trả lại tất cả"""
+        now = time.time()
+        commands, windows = [], []
+        for key, limit, period in limits:
+            window = int(now // period)
+            current_key, previous_key = f"{key}:{window}", f"{key}:{window - 1}"
+            commands += [("INCR", current_key), ("PEXPIRE", current_key, int(period * 2000)), ("GET", previous_key)]
+            windows.append((current_key, now / period - window))  # Phần đã trôi qua của cửa sổ hiện tại (0..1)
+        replies = await self._pipeline(*commands)
+
+        estimates = []
+        for i, (_, limit, period) in enumerate(limits):
+            count, _, previous = replies[3 * i:3 * i + 3]
+            previous = int(previous or 0)
+            estimates.append((count, previous, previous * (1 - windows[i][1]) + count))
+        if all(estimated <= limit for (_, _, estimated), (_, limit, _) in zip(estimates, limits)):
+            return [0.0] * len(limits)
+
+        # Request bị từ chối không được tính ở key nào (giống token bucket: bị chặn thì không tốn token)
+        await self._pipeline(*(("DECR", current_key) for current_key, _ in windows))
+        waits = []
+        for (count, previous, estimated), (_, limit, period), (_, elapsed) in zip(estimates, limits, windows):
+            count -= 1
+            if estimated <= limit:
+                waits.append(0.0)
+            elif count > limit or previous == 0:
+                # Chờ hết cửa sổ hiện tại (riêng cửa sổ này đã vượt)
+                waits.append((1 - elapsed) * period)
+            else:
+                # Chờ tới khi phần của cửa sổ trước giảm đủ
+                waits.append(min((1 - elapsed) * period, (estimated - limit) / previous * period))
+        return waits
+
+    def sweep(self, max_period: float) -> int:
+        return 0  # Key tự hết hạn phía server
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "server": f"{self.host}:{self.port}/{self.db}", "errors": self.errors}
+
+
+# === 3. BỘ GIỚI HẠN DÙNG TRONG main.py ===
+class PayloadTooLargeError(Exception):
+    """Body của API có giới hạn theo email vượt MAX_BODY_FOR_EMAIL (main.py trả 413)"""
+
+
+class RateLimiter:
+    def __init__(self, backend, rules: list[RateLimitRule]):
+        self.backend = backend
+        self.rules = rules
+        self.allowed = 0
+        self.limited: dict[str, int] = {rule.name: 0 for rule in rules}
+        self.backend_errors = 0
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    async def _email(request) -> str | None:
+        """
+        Đọc email trong body JSON, tối đa MAX_BODY_FOR_EMAIL byte dù body có Content-Length hay chunked
+        (vượt -> PayloadTooLargeError). Body đọc được giữ lại trong request nên vẫn chuyển tiếp bình thường.
+        """
+        length = request.headers.get("content-length")
+        if length is not None and (not length.isdigit() or int(length) > MAX_BODY_FOR_EMAIL):
+            raise PayloadTooLargeError()
+        chunks, size = [], 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_BODY_FOR_EMAIL:
+                raise PayloadTooLargeError()
+            chunks.append(chunk)
+        body = request._body = b"".join(chunks)  # request.stream() của Starlette phát lại _body
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        email = data.get("email") if isinstance(data, dict) else None
+        return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+    async def check(self, request) -> float:
+        """
+        0 nếu request được phép, ngược lại số giây client phải chờ (Retry-After).
+        Xét mọi rule trước, chỉ tính request vào các rule khi TẤT CẢ đều cho qua.
+        """
+        method, path = request.method, request.url.path
+        client_ip = request.client.host if request.client else "unknown"
+        rules, limits = [], []
+        email, email_read = None, False
+        for rule in self.rules:
+            if not rule.matches(method, path):
+                continue
+            if rule.key == "email":
+                if not email_read:
+                    email, email_read = await self._email(request), True
+                if email is None:
+                    continue
+                value = email
+            else:
+                value = client_ip
+            rules.append(rule)
+            limits.append((f"rl:{rule.name}:{value}", rule.limit, rule.period))
+        try:
+            waits = await self.backend.hit_all(limits) if limits else []
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Lỗi backend rate limit, cho request đi qua: {e}")
+            waits = []
+        retry_after = 0.0
+        for rule, wait in zip(rules, waits):
+            if wait > 0:
+                self.limited[rule.name] += 1
+                retry_after = max(retry_after, wait)
+        if retry_after == 0:
+            self.allowed += 1
+        return retry_after
+
+    async def _sweep_loop(self):
+        max_period = max(rule.period for rule in self.rules)
+        while True:
+            await asyncio.sleep(GATEWAY_RATE_LIMIT_SWEEP_INTERVAL)
+            self.backend.sweep(max_period)
+
+    def start(self):
+        if self._task is None and GATEWAY_RATE_LIMIT_ENABLED:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": GATEWAY_RATE_LIMIT_ENABLED,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "backend_errors": self.backend_errors,
+            "rules": [f"{r.name}: {r.limit}/{r.period:g}s {r.path}" for r in self.rules],
+            **self.backend.stats(),
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def _create_backend():
+    if GATEWAY_RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(GATEWAY_RATE_LIMIT_REDIS_URL)
+    return MemoryBackend(GATEWAY_RATE_LIMIT_MAX_KEYS)
+
+
+rate_limiter = RateLimiter(_create_backend(), RULES)
@@ -0,0 +1,112 @@
+# File: /api-gateway/response_cache.py
+# Cache dùng chung (shared cache) của API Gateway cho các response GET.
+# Chỉ lưu response mà service cho phép: Cache-Control có "public" + "max-age", không có Set-Cookie.
+# Hết hạn thì gateway hỏi lại service bằng If-None-Match (revalidate); service trả 304 thì dùng lại body cũ.
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+GATEWAY_CACHE_ENABLED = os.getenv("GATEWAY_CACHE_ENABLED", "1") == "1"
+GATEWAY_CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "2000"))
+GATEWAY_CACHE_MAX_BODY_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BODY_BYTES", str(2 * 1024 * 1024)))
+
+# Header của response được lưu cùng body và trả lại cho client
+CACHED_HEADERS = ("content-type", "content-encoding", "etag", "cache-control", "last-modified", "vary")
+
+
+def parse_cache_control(value: str) -> dict[str, str | None]:
+    """'public, max-age=60' -> {'public': None, 'max-age': '60'}"""
+    directives = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """So sánh If-None-Match với ETag (so sánh "yếu" theo RFC 9110: bỏ qua tiền tố W/)"""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in if_none_match.split(","))
+
+
+def shared_max_age(headers) -> int | None:
+    """Số giây response được phép lưu ở cache dùng chung, None nếu không được lưu"""
+    if headers.get("set-cookie"):
+        return None
+    directives = parse_cache_control(headers.get("cache-control", ""))
+    if "public" not in directives or "no-store" in directives or "private" in directives:
+        return None
+    try:
+        max_age = int(directives.get("s-maxage") or directives.get("max-age") or 0)
+    except ValueError:
+        return None
+    return max_age if max_age > 0 else None
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    headers: dict[str, str]
+    expires_at: float
+    etag: str | None = field(default=None)
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class GatewayCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0   # Hết hạn nhưng service xác nhận còn đúng (304)
+        self.evictions = 0
+
+    def get(self, key: str) -> CacheEntry | None:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def store(self, key: str, body: bytes, headers, max_age: int):
+        if len(body) > GATEWAY_CACHE_MAX_BODY_BYTES:
+            return
+        kept = {name: headers[name] for name in CACHED_HEADERS if name in headers}
+        self._data[key] = CacheEntry(body, kept, time.monotonic() + max_age, kept.get("etag"))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def refresh(self, key: str, headers, max_age: int):
+        """Service trả 304 khi revalidate -> gia hạn entry"""
+        entry = self._data.get(key)
+        if entry is not None:
+            entry.expires_at = time.monotonic() + max_age
+            if "cache-control" in headers:
+                entry.headers["cache-control"] = headers["cache-control"]
+            self.revalidated += 1
+
+    def invalidate(self, key: str):
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": GATEWAY_CACHE_ENABLED,
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+        }
+
+
+gateway_cache = GatewayCache(GATEWAY_CACHE_MAX_ENTRIES)
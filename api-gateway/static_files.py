@@ -0,0 +1,133 @@
+# File: /api-gateway/static_files.py
+# Phục vụ frontend đã build (frontend_build.py) tại GATEWAY_STATIC_PREFIX (mặc định /app):
+# - Chỉ phục vụ đường dẫn có trong manifest.json (không đọc đường dẫn tùy ý trên đĩa)
+# - File <= GATEWAY_STATIC_MEMORY_MAX_BYTES nằm sẵn trong bộ nhớ; file lớn hơn gửi bằng FileResponse
+#   (sendfile khi server hỗ trợ, không thì đọc theo từng khối)
+# - File đã băm tên: Cache-Control: public, max-age=31536000, immutable -> chuyển trang không tải lại CSS/JS/ảnh
+#   Trang HTML / tên gốc chưa băm: no-cache + ETag (trình duyệt hỏi lại, thường nhận 304)
+# - Bản nén sẵn .br / .gz chọn theo Accept-Encoding (có q-value); bản WebP chọn theo Accept: image/webp
+#   Response đã có Content-Encoding nên CompressionMiddleware không nén lại
+
+import json
+import logging
+import os
+
+from fastapi import Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+
+from compression import negotiate
+from frontend_build import FRONTEND_DIST, MANIFEST_NAME
+from json_response import ORJSONResponse
+from response_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_STATIC_DIR = os.getenv("GATEWAY_STATIC_DIR", FRONTEND_DIST)
+GATEWAY_STATIC_PREFIX = "/" + os.getenv("GATEWAY_STATIC_PREFIX", "/app").strip("/")
+GATEWAY_STATIC_INDEX = os.getenv("GATEWAY_STATIC_INDEX", "pages/index.html")
+GATEWAY_STATIC_MEMORY_MAX_BYTES = int(os.getenv("GATEWAY_STATIC_MEMORY_MAX_BYTES", str(512 * 1024)))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+ENCODING_ORDER = ["br", "gzip"]  # Ưu tiên khi client chấp nhận ngang nhau
+
+
+class StaticSite:
+    def __init__(self, directory: str = GATEWAY_STATIC_DIR):
+        self.directory = directory
+        self.files: dict[str, dict] = {}     # đường dẫn phục vụ -> mục manifest
+        self._memory: dict[str, bytes] = {}  # đường dẫn trong dist -> nội dung
+        self.built_at = None
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.by_encoding: dict[str, int] = {}
+
+    def load(self) -> bool:
+        """Đọc manifest + nạp file nhỏ vào bộ nhớ. False nếu chưa build (trả 404 cho mọi đường dẫn)."""
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Chưa build frontend ({path}); chạy: python api-gateway/frontend_build.py")
+            return False
+        memory = {}
+        for entry in manifest["files"].values():
+            for stored in (entry["path"], *entry["encodings"].values()):
+                if stored in memory:
+                    continue
+                file_path = self._file_path(stored)
+                if os.path.getsize(file_path) <= GATEWAY_STATIC_MEMORY_MAX_BYTES:
+                    with open(file_path, "rb") as f:
+                        memory[stored] = f.read()
+        self.files, self._memory, self.built_at = manifest["files"], memory, manifest.get("built_at")
+        logger.info(f"Frontend: {len(self.files)} đường dẫn, {sum(map(len, memory.values())) // 1024} KB trong bộ nhớ")
+        return True
+
+    def _file_path(self, stored: str) -> str:
+        return os.path.join(self.directory, *stored.split("/"))
+
+    def response(self, path: str, request: Request) -> Response:
+        entry = self.files.get(path)
+        if entry is None:
+            return ORJSONResponse(content={"error": "Không tìm thấy file"}, status_code=404)
+        self.requests += 1
+        vary = []
+        webp = entry.get("webp")
+        if webp:
+            vary.append("Accept")
+            if "image/webp" in request.headers.get("accept", ""):
+                # Mục manifest của bản WebP (cùng chế độ cache với ảnh được yêu cầu)
+                entry = {**self.files[webp], "immutable": entry["immutable"]}
+
+        encodings = entry["encodings"]
+        encoding = None
+        if encodings:
+            vary.append("Accept-Encoding")
+            encoding = negotiate(
+                request.headers.get("accept-encoding", ""), [name for name in ENCODING_ORDER if name in encodings],
+            )
+        stored = encodings[encoding] if encoding else entry["path"]
+
+        etag = f'"{entry["hash"]}-{encoding}"' if encoding else f'"{entry["hash"]}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if entry["immutable"] else REVALIDATE_CACHE_CONTROL,
+        }
+        if vary:
+            headers["Vary"] = ", ".join(vary)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        self.by_encoding[encoding or "identity"] = self.by_encoding.get(encoding or "identity", 0) + 1
+
+        body = self._memory.get(stored)
+        if body is None:
+            self.bytes_sent += os.path.getsize(self._file_path(stored))
+            return FileResponse(self._file_path(stored), media_type=entry["type"], headers=headers)
+        self.bytes_sent += len(body)
+        return Response(content=body, media_type=entry["type"], headers=headers)
+
+    def index_redirect(self) -> Response:
+        return RedirectResponse(f"{GATEWAY_STATIC_PREFIX}/{GATEWAY_STATIC_INDEX}")
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "prefix": GATEWAY_STATIC_PREFIX,
+            "built_at": self.built_at,
+            "files": len(self.files),
+            "memory_files": len(self._memory),
+            "memory_bytes": sum(map(len, self._memory.values())),
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "by_encoding": self.by_encoding,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+static_site = StaticSite()
@@ -0,0 +1,229 @@
+# File: /api-gateway/token_auth.py
+# Gateway tự xác thực JWT (cookie) để trả lời /api/auth/me mà không cần gọi tới auth_service.
+# - Token đã xác thực được lưu trong LRU (key = sha256 token) tới khi hết hạn (exp)
+# - Danh sách thu hồi lấy định kỳ từ GET /revocations của auth_service (đăng xuất, reset mật khẩu;
+#   API nội bộ, cần INTERNAL_API_TOKEN); đăng xuất đi qua gateway thì thu hồi ngay tại chỗ
+# - Chữ ký kiểm tra bằng khóa công khai (JWKS, GET /.well-known/jwks.json của auth_service),
+#   chọn theo "kid"; gateway không giữ bí mật nào để tạo token
+# - Chưa đồng bộ được danh sách thu hồi/JWKS (hoặc quá cũ) thì không tự trả lời, chuyển tiếp cho auth_service
+# (Cùng logic với services/_shared/token_cache.py - gateway chạy riêng nên không import được)
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+COOKIE_NAME = "findmydentist_token"
+
+GATEWAY_AUTH_FAST_PATH = os.getenv("GATEWAY_AUTH_FAST_PATH", "1") == "1"
+GATEWAY_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+GATEWAY_REVOCATION_POLL_INTERVAL = float(os.getenv("GATEWAY_REVOCATION_POLL_INTERVAL", "2"))
+# Danh sách thu hồi cũ hơn mức này (auth_service không trả lời) -> tắt fast path
+GATEWAY_REVOCATION_MAX_STALENESS = float(os.getenv("GATEWAY_REVOCATION_MAX_STALENESS", "30"))
+GATEWAY_JWKS_REFRESH_INTERVAL = float(os.getenv("GATEWAY_JWKS_REFRESH_INTERVAL", "300"))
+# GET /revocations là API nội bộ của auth_service (cùng giá trị với services/_shared/security.py)
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+
+class TokenError(Exception):
+    """Token không hợp lệ; detail giống thông báo 401 của auth_service"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class UnknownKeyError(TokenError):
+    """Token ký bằng khóa (kid) gateway chưa biết -> chuyển tiếp cho auth_service và tải lại JWKS"""
+
+
+class TokenVerifier:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._cache: OrderedDict[str, dict] = OrderedDict()  # sha256(token) -> claims
+        self._revoked_jti: dict[str, float] = {}             # jti -> exp
+        self._revoked_before: dict[str, tuple[int, float]] = {}  # user_id -> (iat tối thiểu, hết hạn)
+        self.keys: dict[str, jwt.PyJWK] = {}                     # kid -> khóa công khai
+        self.keys_fetched_at = 0.0
+        self.last_id = 0         # Con trỏ "since" do auth_service trả về (chỉ theo dòng đã đọc từ CSDL)
+        self.last_sync = 0.0     # time.monotonic() của lần đồng bộ thành công gần nhất
+        self.hits = 0
+        self.misses = 0
+
+    # --- Thu hồi ---
+    def apply(self, event: dict):
+        if event.get("jti"):
+            self._revoked_jti[event["jti"]] = event["expires_at"]
+        if event.get("user_id") and event.get("revoked_before"):
+            current = self._revoked_before.get(event["user_id"])
+            if current is None or current[0] < event["revoked_before"]:
+                self._revoked_before[event["user_id"]] = (event["revoked_before"], event["expires_at"])
+
+    def prune(self):
+        now = time.time()
+        self._revoked_jti = {jti: exp for jti, exp in self._revoked_jti.items() if exp > now}
+        self._revoked_before = {u: item for u, item in self._revoked_before.items() if item[1] > now}
+
+    def revoke_local(self, token: str | None):
+        """Đăng xuất vừa đi qua gateway -> chặn token ngay, không chờ lần đồng bộ sau"""
+        if not token:
+            return
+        try:
+            claims = self.verify(token)
+        except TokenError:
+            return
+        if claims.get("jti"):
+            self.apply({"jti": claims["jti"], "expires_at": claims["exp"]})
+
+    def _is_revoked(self, claims: dict) -> bool:
+        if claims.get("jti") in self._revoked_jti:
+            return True
+        before = self._revoked_before.get(claims["sub"])
+        return before is not None and (claims.get("iat") is None or claims["iat"] < before[0])
+
+    # --- Khóa công khai ---
+    def load_jwks(self, jwks: dict):
+        keys = {}
+        for data in jwks.get("keys", []):
+            try:
+                keys[data["kid"]] = jwt.PyJWK(data)
+            except (KeyError, jwt.PyJWTError) as e:
+                logger.warning(f"Bỏ qua khóa JWKS không hợp lệ: {e}")
+        self.keys = keys
+        self.keys_fetched_at = time.monotonic()
+
+    # --- Xác thực ---
+    def ready(self) -> bool:
+        return (
+            bool(self.keys)
+            and self.last_sync > 0
+            and time.monotonic() - self.last_sync < GATEWAY_REVOCATION_MAX_STALENESS
+        )
+
+    def verify(self, token: str) -> dict:
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        claims = self._cache.get(cache_key)
+        if claims is not None and claims["exp"] <= time.time():
+            del self._cache[cache_key]
+            claims = None
+        if claims is None:
+            self.misses += 1
+            try:
+                kid = jwt.get_unverified_header(token).get("kid")
+                key = self.keys.get(kid)
+                if key is None:
+                    raise UnknownKeyError("Token không hợp lệ hoặc đã hết hạn")
+                claims = jwt.decode(token, key.key, algorithms=[key.algorithm_name])
+            except jwt.PyJWTError:
+                raise TokenError("Token không hợp lệ hoặc đã hết hạn")
+            if not isinstance(claims.get("sub"), str) or not isinstance(claims.get("role"), str):
+                raise TokenError("Nội dung token không hợp lệ")
+            if "exp" in claims:
+                self._cache[cache_key] = claims
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(cache_key)
+        if self._is_revoked(claims):
+            raise TokenError("Token đã bị thu hồi")
+        return claims
+
+    def stats(self) -> dict:
+        return {
+            "fast_path": GATEWAY_AUTH_FAST_PATH,
+            "ready": self.ready(),
+            "keys": sorted(self.keys),
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revoked_jti": len(self._revoked_jti),
+            "revoked_users": len(self._revoked_before),
+            "last_id": self.last_id,
+            "seconds_since_sync": round(time.monotonic() - self.last_sync, 1) if self.last_sync else None,
+        }
+
+
+class RevocationFeed:
+    """
+    Tác vụ nền: lấy sự kiện thu hồi mới từ auth_service (GET /revocations?since=<id>; áp dụng trùng không sao)
+    và làm mới JWKS mỗi GATEWAY_JWKS_REFRESH_INTERVAL giây (hoặc ngay khi gặp kid lạ)
+    """
+
+    def __init__(self, verifier: TokenVerifier):
+        self.verifier = verifier
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._jwks_needed = True
+
+    async def sync_jwks(self, upstream):
+        response = await upstream.send("GET", "/.well-known/jwks.json", headers={}, stream=False)
+        response.raise_for_status()
+        self.verifier.load_jwks(response.json())
+        self._jwks_needed = False
+
+    async def sync(self, upstream):
+        if self._jwks_needed or time.monotonic() - self.verifier.keys_fetched_at > GATEWAY_JWKS_REFRESH_INTERVAL:
+            await self.sync_jwks(upstream)
+        # Lâu không đồng bộ được -> lấy lại toàn bộ (worker auth chỉ phát lại sự kiện mới biết gần đây)
+        stale = time.monotonic() - self.verifier.last_sync > GATEWAY_REVOCATION_MAX_STALENESS
+        since = 0 if stale else self.verifier.last_id
+        response = await upstream.send(
+            "GET", f"/revocations?since={since}", headers={"x-internal-token": INTERNAL_API_TOKEN}, stream=False
+        )
+        response.raise_for_status()
+        data = response.json()
+        for event in data["events"]:
+            self.verifier.apply(event)
+        # Dùng con trỏ của worker vừa trả lời (có thể nhỏ hơn lần trước khi luân phiên worker: chỉ lấy dư, không sót)
+        self.verifier.last_id = data["last_id"]
+        self.verifier.prune()
+        self.verifier.last_sync = time.monotonic()
+
+    async def _run(self, upstream):
+        while True:
+            try:
+                await self.sync(upstream)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Không lấy được danh sách token thu hồi: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), GATEWAY_REVOCATION_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def sync_soon(self, jwks: bool = False):
+        """Có thay đổi (VD: reset mật khẩu, kid lạ) -> đồng bộ ngay thay vì chờ hết chu kỳ"""
+        if jwks:
+            self._jwks_needed = True
+        self._wakeup.set()
+
+    def start(self, upstream):
+        if GATEWAY_AUTH_FAST_PATH and not INTERNAL_API_TOKEN:
+            logger.warning(
+                "Chưa đặt INTERNAL_API_TOKEN: không lấy được danh sách thu hồi, /api/auth/me chuyển tiếp cho auth_service"
+            )
+            return
+        if self._task is None and GATEWAY_AUTH_FAST_PATH:
+            self._task = asyncio.create_task(self._run(upstream))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+token_verifier = TokenVerifier(GATEWAY_TOKEN_CACHE_MAX_ENTRIES)
+revocation_feed = RevocationFeed(token_verifier)
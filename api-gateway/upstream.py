@@ -0,0 +1,357 @@
+# File: /api-gateway/upstream.py
+# Kết nối từ gateway tới từng microservice (upstream):
+# - Mỗi service có thể chạy nhiều instance; chọn instance theo "power of two choices"
+#   (ít request đang xử lý hơn), có health check chủ động và loại thụ động instance lỗi
+# - Mỗi service có pool kết nối httpx riêng (giới hạn số kết nối, keep-alive, timeout riêng)
+# - Retry có backoff ngẫu nhiên (jitter) - CHỈ cho request idempotent, không có body
+# - Circuit breaker (từng instance): instance lỗi liên tục thì bị loại, sau đó thử lại (half-open) bằng vài request dò
+
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass, asdict
+
+import httpx
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Status do upstream (hoặc proxy phía trước nó) trả về khi quá tải/tạm ngừng -> đáng retry
+RETRYABLE_STATUS = {502, 503, 504}
+# Chỉ các status này (cùng lỗi kết nối/timeout) mới tính là instance hỏng cho circuit breaker.
+# 503 là service tự trả khi quá tải/đang tắt (VD: hết kết nối CSDL) - instance vẫn sống -> chỉ retry
+BREAKER_FAILURE_STATUS = {502, 504}
+
+
+@dataclass
+class UpstreamConfig:
+    # Pool kết nối
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    # Timeout (giây)
+    connect_timeout: float = 2.0
+    read_timeout: float = 10.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 2.0      # Chờ lấy kết nối trong pool
+    # Retry
+    max_retries: int = 2
+    backoff_base: float = 0.05
+    backoff_max: float = 1.0
+    # Circuit breaker
+    failure_threshold: int = 5     # Số lỗi liên tiếp để mở mạch
+    reset_timeout: float = 15.0    # Thời gian mở mạch trước khi cho request dò
+    half_open_max_calls: int = 1   # Số request dò đồng thời khi half-open
+    # Health check chủ động (GET tới trang gốc "/" của từng instance)
+    health_path: str = "/"
+    health_interval: float = 5.0   # (giây) 0 = tắt
+    health_timeout: float = 1.0
+    healthy_threshold: int = 2     # Số lần OK liên tiếp để đưa instance trở lại
+    unhealthy_threshold: int = 2   # Số lần lỗi liên tiếp để loại instance
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamConfig":
+        """Ghi đè cấu hình bằng biến môi trường GATEWAY_<TÊN>_<THAM SỐ>, VD: GATEWAY_SEARCH_READ_TIMEOUT=5"""
+        config = cls(**defaults)
+        for field, value in asdict(config).items():
+            raw = os.getenv(f"GATEWAY_{name.upper()}_{field.upper()}")
+            if raw is not None:
+                setattr(config, field, type(value)(raw))
+        return config
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Circuit breaker đang mở")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, half_open_max_calls: int):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_inflight = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """Gọi trước mỗi request; ném CircuitOpenError nếu phải từ chối ngay"""
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(self.reset_timeout - elapsed)
+            self.state = self.HALF_OPEN
+            self.half_open_inflight = 0
+        if self.state == self.HALF_OPEN:
+            if self.half_open_inflight >= self.half_open_max_calls:
+                raise CircuitOpenError(1.0)
+            self.half_open_inflight += 1
+
+    def record_success(self):
+        if self.state == self.HALF_OPEN:
+            self.half_open_inflight = max(0, self.half_open_inflight - 1)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN:
+            # Request dò thất bại -> mở mạch lại
+            self.half_open_inflight = max(0, self.half_open_inflight - 1)
+            self._open()
+        elif self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def abort_probe(self):
+        """Request bị hủy giữa chừng (không biết thành công hay lỗi) -> trả lại lượt dò half-open"""
+        if self.state == self.HALF_OPEN:
+            self.half_open_inflight = max(0, self.half_open_inflight - 1)
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Bọc stream của response để biết khi nào request thực sự kết thúc (đã đọc xong/đóng)"""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class Instance:
+    """1 tiến trình (uvicorn) của service. Có circuit breaker riêng (loại thụ động khi lỗi liên tiếp)."""
+
+    def __init__(self, url: str, config: UpstreamConfig):
+        self.url = url.rstrip("/")
+        self.breaker = CircuitBreaker(
+            config.failure_threshold, config.reset_timeout, config.half_open_max_calls
+        )
+        self.healthy = True          # Kết quả health check chủ động
+        self.health_successes = 0
+        self.health_failures = 0
+        self.outstanding = 0         # Số request đang xử lý
+        self.requests = 0
+        self.failures = 0
+
+    def available(self) -> bool:
+        """Có nhận request được không (không làm thay đổi trạng thái breaker)"""
+        if not self.healthy:
+            return False
+        breaker = self.breaker
+        if breaker.state == breaker.OPEN:
+            return time.monotonic() - breaker.opened_at >= breaker.reset_timeout
+        if breaker.state == breaker.HALF_OPEN:
+            return breaker.half_open_inflight < breaker.half_open_max_calls
+        return True
+
+    def retry_after(self) -> float:
+        if self.breaker.state == self.breaker.OPEN:
+            return max(0.0, self.breaker.reset_timeout - (time.monotonic() - self.breaker.opened_at))
+        return 1.0
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "available": self.available(),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit": self.breaker.status(),
+        }
+
+
+class Upstream:
+    """
+    1 service gồm nhiều instance. Chọn instance theo "power of two choices":
+    lấy ngẫu nhiên 2 instance khả dụng, gửi tới instance đang có ít request dở dang hơn.
+    """
+
+    def __init__(self, name: str, urls: list[str], config: UpstreamConfig):
+        self.name = name
+        self.config = config
+        self.instances = [Instance(url, config) for url in urls]
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=config.connect_timeout,
+                read=config.read_timeout,
+                write=config.write_timeout,
+                pool=config.pool_timeout,
+            ),
+        )
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0   # Bị từ chối vì không còn instance nào khả dụng
+        self._health_task: asyncio.Task | None = None
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": ngẫu nhiên trong [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt))
+
+    def _pick(self, exclude: set) -> Instance:
+        candidates = [i for i in self.instances if i.available() and i not in exclude]
+        if not candidates:
+            # Đã thử hết instance khả dụng -> cho phép thử lại instance cũ
+            candidates = [i for i in self.instances if i.available()]
+        if not candidates:
+            retry_after = min(i.retry_after() for i in self.instances)
+            raise CircuitOpenError(retry_after)
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return a if a.outstanding <= b.outstanding else b
+
+    async def send(self, method: str, path: str, headers, content=None, stream: bool = True) -> httpx.Response:
+        """
+        Gửi request tới 1 instance của upstream. Trả về response (dạng stream nếu stream=True,
+        người gọi phải aclose()). Ném CircuitOpenError khi không còn instance khả dụng,
+        hoặc lỗi httpx khi đã hết lượt retry.
+        """
+        # Body dạng stream không gửi lại được -> chỉ retry request idempotent không có body.
+        # Riêng lỗi không kết nối được thì request chưa hề được gửi -> luôn thử instance khác.
+        can_retry = method in IDEMPOTENT_METHODS and content is None
+        attempts = self.config.max_retries + 1
+        tried: set = set()
+
+        for attempt in range(attempts):
+            try:
+                instance = self._pick(tried)
+                instance.breaker.before_call()
+            except CircuitOpenError:
+                self.rejected += 1
+                raise
+            tried.add(instance)
+            self.requests += 1
+            instance.requests += 1
+            instance.outstanding += 1
+
+            def release(instance=instance):
+                instance.outstanding -= 1
+
+            try:
+                request = self.client.build_request(
+                    method, f"{instance.url}{path}", headers=headers, content=content
+                )
+                response = await self.client.send(request, stream=stream)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                release()
+                self.failures += 1
+                instance.failures += 1
+                instance.breaker.record_failure()
+                if attempt + 1 >= attempts or not (can_retry or isinstance(e, httpx.ConnectError)):
+                    raise
+            except BaseException:
+                # Bị hủy (CancelledError) hoặc lỗi khác giữa chừng: không tính là lỗi của instance,
+                # nhưng phải trả lại bộ đếm và lượt dò half-open, nếu không instance bị kẹt mãi
+                release()
+                instance.breaker.abort_probe()
+                raise
+            else:
+                failed = response.status_code in RETRYABLE_STATUS
+                if response.status_code in BREAKER_FAILURE_STATUS:
+                    self.failures += 1
+                    instance.failures += 1
+                    instance.breaker.record_failure()
+                elif failed:
+                    # 503 của chính service: không đóng mà cũng không mở mạch
+                    instance.breaker.abort_probe()
+                else:
+                    instance.breaker.record_success()
+                if not failed or not can_retry or attempt + 1 >= attempts:
+                    if stream:
+                        # Request chỉ kết thúc khi người gọi đọc xong/đóng response
+                        response.stream = _TrackedStream(response.stream, release)
+                    else:
+                        release()
+                    return response
+                try:
+                    await response.aclose()
+                finally:
+                    release()
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    # --- Health check chủ động ---
+    async def _check(self, instance: Instance):
+        try:
+            response = await self.client.get(
+                f"{instance.url}{self.config.health_path}", timeout=self.config.health_timeout
+            )
+            ok = response.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            instance.health_successes += 1
+            instance.health_failures = 0
+            if not instance.healthy and instance.health_successes >= self.config.healthy_threshold:
+                instance.healthy = True
+        else:
+            instance.health_failures += 1
+            instance.health_successes = 0
+            if instance.healthy and instance.health_failures >= self.config.unhealthy_threshold:
+                instance.healthy = False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self._check(i) for i in self.instances))
+            await asyncio.sleep(self.config.health_interval)
+
+    async def warm_up(self):
+        """1 lượt health check: mở sẵn kết nối keep-alive tới mọi instance trước khi gateway nhận request"""
+        await asyncio.gather(*(self._check(i) for i in self.instances))
+
+    def start_health_checks(self):
+        if self._health_task is None and self.config.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def aclose(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await self.client.aclose()
+
+    def status(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "instances": [i.status() for i in self.instances],
+            "config": asdict(self.config),
+        }
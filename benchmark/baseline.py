@@ -0,0 +1,58 @@
+# File: /benchmark/baseline.py
+# So sánh kết quả benchmark với baseline đã lưu (benchmark/baseline.json).
+# Baseline lưu theo "profile" (scale + concurrency + mix) -> chỉ so sánh các lần chạy cùng cấu hình tải.
+# Là hồi quy khi (theo từng route và tổng):
+# - p95 / p99 chậm hơn baseline quá BENCH_LATENCY_TOLERANCE (và quá BENCH_LATENCY_SLACK_MS tuyệt đối)
+# - throughput giảm quá BENCH_THROUGHPUT_TOLERANCE
+# - tỉ lệ lỗi tăng quá BENCH_ERROR_RATE_TOLERANCE
+
+import json
+import os
+
+BASELINE_PATH = os.getenv("BENCH_BASELINE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json"))
+BENCH_LATENCY_TOLERANCE = float(os.getenv("BENCH_LATENCY_TOLERANCE", "0.20"))
+BENCH_LATENCY_SLACK_MS = float(os.getenv("BENCH_LATENCY_SLACK_MS", "2"))
+BENCH_THROUGHPUT_TOLERANCE = float(os.getenv("BENCH_THROUGHPUT_TOLERANCE", "0.20"))
+BENCH_ERROR_RATE_TOLERANCE = float(os.getenv("BENCH_ERROR_RATE_TOLERANCE", "0.01"))
+
+
+def profile_key(scale: int, concurrency: int, mix: dict[str, float]) -> str:
+    mix_text = ",".join(f"{name}={weight:g}" for name, weight in sorted(mix.items()) if weight)
+    return f"scale={scale} concurrency={concurrency} mix={mix_text}"
+
+
+def load(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(profile: str, result: dict, path: str = BASELINE_PATH):
+    baselines = load(path)
+    baselines[profile] = {"recorded_at": result["recorded_at"], "routes": result["routes"], "total": result["total"]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def _compare_one(name: str, current: dict, base: dict) -> list[str]:
+    problems = []
+    for field in ("p95_ms", "p99_ms"):
+        limit = base[field] * (1 + BENCH_LATENCY_TOLERANCE)
+        if current[field] > limit and current[field] - base[field] > BENCH_LATENCY_SLACK_MS:
+            problems.append(f"{name}: {field} {current[field]:.1f} > {base[field]:.1f} (+{BENCH_LATENCY_TOLERANCE:.0%})")
+    if current["rps"] < base["rps"] * (1 - BENCH_THROUGHPUT_TOLERANCE):
+        problems.append(f"{name}: rps {current['rps']:.1f} < {base['rps']:.1f} (-{BENCH_THROUGHPUT_TOLERANCE:.0%})")
+    if current["error_rate"] > base["error_rate"] + BENCH_ERROR_RATE_TOLERANCE:
+        problems.append(f"{name}: error_rate {current['error_rate']:.2%} > {base['error_rate']:.2%}")
+    return problems
+
+
+def compare(result: dict, base: dict) -> list[str]:
+    """Danh sách hồi quy (rỗng = không chậm hơn baseline). Route mới / đã bỏ không bị tính."""
+    problems = _compare_one("TOTAL", result["total"], base["total"])
+    for route, current in result["routes"].items():
+        if route in base["routes"]:
+            problems += _compare_one(route, current, base["routes"][route])
+    return problems
@@ -0,0 +1,169 @@
+# File: /benchmark/load.py
+# Sinh tải qua API Gateway: BENCH_CONCURRENCY người dùng ảo chạy song song (vòng kín: gửi -> chờ -> gửi tiếp),
+# mỗi request chọn 1 nhóm theo tỉ lệ BENCH_MIX rồi chọn ngẫu nhiên 1 route trong nhóm.
+# Ghi độ trễ từng request theo route (bỏ qua giai đoạn khởi động BENCH_WARMUP), tính throughput và p50/p95/p99.
+
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from .seed import BENCH_PASSWORD, user_email
+
+BENCH_DURATION = float(os.getenv("BENCH_DURATION", "30"))
+BENCH_WARMUP = float(os.getenv("BENCH_WARMUP", "5"))
+BENCH_CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "32"))
+BENCH_MIX = os.getenv("BENCH_MIX", "browse=50,search=30,login=5,me=15")
+BENCH_REQUEST_TIMEOUT = float(os.getenv("BENCH_REQUEST_TIMEOUT", "30"))
+
+TEXT_QUERIES = ["nha khoa", "clinic", "duong", "tp.hcm", "nha si", "phong kham"]
+SPECIALIZATIONS = ["Chỉnh nha", "Nha chu", "Nội nha", "Phục hình", "Nha khoa trẻ em", "Cấy ghép"]
+
+
+# === 1. CÁC ROUTE ===
+# Mỗi hàm nhận (client, rng, scale) và gửi đúng 1 request qua gateway
+
+async def _login(client: httpx.AsyncClient, rng: random.Random, scale: int) -> httpx.Response:
+    # Chỉ khách hàng (user 1..5*scale); cookie JWT được client giữ lại cho /me
+    email = user_email(rng.randint(1, scale * 5))
+    return await client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+
+
+ROUTES = {
+    "browse": {
+        "GET /api/search/clinics":
+            lambda client, rng, scale: client.get("/api/search/clinics"),
+        "GET /api/search/dentists/{id}":
+            lambda client, rng, scale: client.get(f"/api/search/dentists/dent_{rng.randint(1, scale)}"),
+        "GET /api/search/clinics/{id}/full":
+            lambda client, rng, scale: client.get(f"/api/search/clinics/clinic_{rng.randint(1, scale)}/full"),
+        "GET /api/search/clinics/nearby":
+            lambda client, rng, scale: client.get("/api/search/clinics/nearby", params={
+                "lat": 10.7 + rng.random() / 5, "lng": 106.6 + rng.random() / 5, "radius": 2,
+            }),
+    },
+    "search": {
+        "GET /api/search/search":
+            lambda client, rng, scale: client.get("/api/search/search", params={
+                "type": rng.choice(["clinic", "dentist"]),
+                "min_rating": rng.choice([0, 3, 4]),
+                **({"specialization": rng.choice(SPECIALIZATIONS)} if rng.random() < 0.3 else {}),
+            }),
+        "GET /api/search/search/text":
+            lambda client, rng, scale: client.get("/api/search/search/text", params={
+                "q": rng.choice(TEXT_QUERIES), "type": rng.choice(["clinic", "dentist"]),
+            }),
+    },
+    "login": {
+        "POST /api/auth/login": _login,
+    },
+    "me": {
+        "GET /api/auth/me":
+            lambda client, rng, scale: client.get("/api/auth/me"),
+    },
+}
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """'browse=50,search=30' -> {'browse': 50.0, 'search': 30.0}"""
+    mix = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Nhóm lưu lượng không hợp lệ: {name} (có: {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("BENCH_MIX không có nhóm nào có tỉ lệ > 0")
+    return mix
+
+
+# === 2. GHI NHẬN SỐ LIỆU ===
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Phân vị theo nearest-rank trên danh sách đã sắp xếp"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.recording = False
+        self.latencies: dict[str, list[float]] = {}
+        self.statuses: dict[str, Counter] = {}
+
+    def record(self, route: str, elapsed_ms: float, status: int):
+        if not self.recording:
+            return
+        self.latencies.setdefault(route, []).append(elapsed_ms)
+        self.statuses.setdefault(route, Counter())[status] += 1
+
+    @staticmethod
+    def _summary(latencies: list[float], statuses: Counter, elapsed: float) -> dict:
+        values = sorted(latencies)
+        # 0 = lỗi kết nối / timeout; 304 là phản hồi hợp lệ của cache
+        errors = sum(count for status, count in statuses.items() if status == 0 or status >= 400)
+        return {
+            "requests": len(values),
+            "errors": errors,
+            "error_rate": round(errors / len(values), 4) if values else 0.0,
+            "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0,
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {
+            route: self._summary(self.latencies[route], self.statuses[route], elapsed)
+            for route in sorted(self.latencies)
+        }
+        total_statuses = sum(self.statuses.values(), Counter())
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {"routes": routes, "total": self._summary(all_latencies, total_statuses, elapsed)}
+
+
+# === 3. CHẠY TẢI ===
+
+async def run_load(base_url: str, scale: int, mix: dict[str, float],
+                   concurrency: int = BENCH_CONCURRENCY, duration: float = BENCH_DURATION,
+                   warmup: float = BENCH_WARMUP, seed: int = 42) -> dict:
+    recorder = Recorder()
+    groups, weights = list(mix), [mix[name] for name in mix]
+    stop_at = time.monotonic() + warmup + duration
+
+    async def user(number: int):
+        rng = random.Random(seed + number)
+        async with httpx.AsyncClient(base_url=base_url, timeout=BENCH_REQUEST_TIMEOUT,
+                                     headers={"accept-encoding": "gzip"}) as client:
+            # Mỗi người dùng ảo đăng nhập trước (có cookie cho /me); không tính vào kết quả
+            await _login(client, rng, scale)
+            while time.monotonic() < stop_at:
+                group = ROUTES[rng.choices(groups, weights)[0]]
+                route = rng.choice(list(group))
+                started = time.perf_counter()
+                try:
+                    response = await group[route](client, rng, scale)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                recorder.record(route, (time.perf_counter() - started) * 1000, status)
+
+    async def start_recording():
+        await asyncio.sleep(warmup)
+        recorder.recording = True
+        return time.monotonic()
+
+    recording_task = asyncio.create_task(start_recording())
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    elapsed = time.monotonic() - await recording_task
+    return recorder.summary(elapsed)
@@ -0,0 +1,98 @@
+# File: /benchmark/processes.py
+# Chạy API Gateway + auth/search/booking service thành các tiến trình uvicorn riêng, trỏ vào CSDL benchmark.
+# Dùng cổng riêng (BENCH_BASE_PORT..+3) nên không đụng tới các service đang chạy ở 8000-8003.
+# Biến môi trường hiện tại được truyền xuống (VD: BCRYPT_ROUNDS, DB_POOL_MAX_SIZE) -> so sánh cấu hình dễ dàng.
+
+import asyncio
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+import httpx
+
+from services._shared.migrate import ROOT_DIR
+
+BENCH_HOST = "127.0.0.1"
+BENCH_BASE_PORT = int(os.getenv("BENCH_BASE_PORT", "18000"))
+BENCH_BOOT_TIMEOUT = float(os.getenv("BENCH_BOOT_TIMEOUT", "120"))
+# Mặc định tắt rate limit của gateway: mọi request benchmark đến từ 1 IP
+BENCH_GATEWAY_RATE_LIMIT = os.getenv("BENCH_GATEWAY_RATE_LIMIT", "0") == "1"
+
+SERVICES = ("auth", "search", "booking")
+PORTS = {"gateway": BENCH_BASE_PORT, "auth": BENCH_BASE_PORT + 1,
+         "search": BENCH_BASE_PORT + 2, "booking": BENCH_BASE_PORT + 3}
+
+
+def gateway_url() -> str:
+    return f"http://{BENCH_HOST}:{PORTS['gateway']}"
+
+
+class Stack:
+    """Các tiến trình gateway + service của 1 lần benchmark"""
+
+    def __init__(self, database: str, log_dir: str):
+        self.database = database
+        self.log_dir = log_dir
+        self._processes: dict[str, subprocess.Popen] = {}
+        self._logs = []
+
+    def _spawn(self, name: str, args: list[str], env: dict):
+        log = open(os.path.join(self.log_dir, f"{name}.log"), "wb")
+        self._logs.append(log)
+        self._processes[name] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", *args,
+             "--host", BENCH_HOST, "--port", str(PORTS[name]), "--log-level", "warning"],
+            cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+
+    def start(self):
+        env = {**os.environ, "DB_DATABASE": self.database}
+        # Bí mật cho API nội bộ (gateway <-> service), dùng chung cho mọi tiến trình của lần chạy này
+        env.setdefault("INTERNAL_API_TOKEN", secrets.token_urlsafe(32))
+        for service in SERVICES:
+            self._spawn(service, [f"services.{service}_service.main:app"], env)
+        gateway_env = {
+            **env,
+            **{f"GATEWAY_{service.upper()}_URLS": f"http://{BENCH_HOST}:{PORTS[service]}" for service in SERVICES},
+        }
+        if not BENCH_GATEWAY_RATE_LIMIT:
+            gateway_env["GATEWAY_RATE_LIMIT_ENABLED"] = "0"
+        self._spawn("gateway", ["main:app", "--app-dir", os.path.join(ROOT_DIR, "api-gateway")], gateway_env)
+
+    async def wait_ready(self):
+        """Chờ mọi tiến trình trả lời và chỉ mục trong bộ nhớ (tìm kiếm, lịch trống) nạp xong"""
+        checks = [f"http://{BENCH_HOST}:{PORTS[name]}/" for name in PORTS] + [
+            f"{gateway_url()}/api/search/search/index-status",
+            f"{gateway_url()}/api/booking/availability/status",
+        ]
+        deadline = time.monotonic() + BENCH_BOOT_TIMEOUT
+        async with httpx.AsyncClient(timeout=5) as client:
+            for url in checks:
+                while True:
+                    for name, process in self._processes.items():
+                        if process.poll() is not None:
+                            raise RuntimeError(f"{name} đã dừng (exit {process.returncode}), xem {self.log_dir}/{name}.log")
+                    try:
+                        response = await client.get(url)
+                        if response.status_code == 200 and response.json().get("ready", True):
+                            break
+                    except (httpx.HTTPError, ValueError):
+                        pass
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"{url} chưa sẵn sàng sau {BENCH_BOOT_TIMEOUT:.0f}s")
+                    await asyncio.sleep(0.5)
+
+    def stop(self):
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for log in self._logs:
+            log.close()
+        self._processes.clear()
+        self._logs.clear()
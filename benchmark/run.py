@@ -0,0 +1,109 @@
+# File: /benchmark/run.py
+# Benchmark đầu-cuối: CSDL giả -> khởi động gateway + service -> phát lưu lượng -> so sánh với baseline.
+# Dùng để đo ảnh hưởng của thay đổi ở _proxy (gateway), get_db_connection (pool), bcrypt...
+#
+# Cách dùng (cần MySQL/MariaDB chạy ở máy, cấu hình kết nối đọc từ .env như các service):
+#   python -m benchmark.run                                   # scale 1000, 30s, 32 người dùng ảo
+#   BENCH_SCALE=100000 BENCH_DURATION=60 python -m benchmark.run --reuse-db
+#   BENCH_MIX=login=1 BCRYPT_ROUNDS=10 python -m benchmark.run    # chỉ đo đăng nhập
+#   python -m benchmark.run --save-baseline                   # lưu kết quả làm baseline cho profile này
+# Tùy chọn:
+#   --reuse-db       Dùng lại CSDL benchmark nếu đã có đúng scale (không sinh lại dữ liệu)
+#   --keep-db        Không xóa CSDL benchmark sau khi chạy
+#   --no-boot        Không tự khởi động; bắn tải vào gateway đang chạy ở BENCH_GATEWAY_URL
+#   --save-baseline  Ghi kết quả vào benchmark/baseline.json
+# Exit code 1 nếu chậm hơn baseline (xem baseline.py) hoặc tỉ lệ lỗi vượt BENCH_MAX_ERROR_RATE.
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from . import baseline, seed
+from .load import BENCH_CONCURRENCY, BENCH_DURATION, BENCH_MIX, BENCH_WARMUP, parse_mix, run_load
+from .processes import Stack, gateway_url
+
+BENCH_SCALE = int(os.getenv("BENCH_SCALE", "1000"))
+BENCH_MAX_ERROR_RATE = float(os.getenv("BENCH_MAX_ERROR_RATE", "0.01"))
+BENCH_RESULTS_DIR = os.getenv(
+    "BENCH_RESULTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+)
+
+
+def _print_table(result: dict):
+    header = f"{'route':<40} {'req':>8} {'rps':>8} {'err':>6} {'p50':>8} {'p95':>8} {'p99':>8}"
+    print(header)
+    print("-" * len(header))
+    for route, row in [*result["routes"].items(), ("TOTAL", result["total"])]:
+        print(f"{route:<40} {row['requests']:>8} {row['rps']:>8.1f} {row['errors']:>6} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+
+
+def _write_result(result: dict) -> str:
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    path = os.path.join(BENCH_RESULTS_DIR, f"{result['recorded_at'].replace(':', '')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+async def _main(args: list[str]) -> int:
+    mix = parse_mix(BENCH_MIX)
+    profile = baseline.profile_key(BENCH_SCALE, BENCH_CONCURRENCY, mix)
+    boot = "--no-boot" not in args
+    stack = None
+
+    if boot:
+        await seed.create(BENCH_SCALE, reuse="--reuse-db" in args)
+        log_dir = tempfile.mkdtemp(prefix="findmydentist-bench-")
+        print(f"Khởi động gateway + service (log: {log_dir})...")
+        stack = Stack(seed.BENCH_DATABASE, log_dir)
+        stack.start()
+    base_url = gateway_url() if boot else os.getenv("BENCH_GATEWAY_URL", "http://127.0.0.1:8000")
+
+    try:
+        if stack is not None:
+            await stack.wait_ready()
+        print(f"Chạy tải: {profile}, {BENCH_DURATION:g}s (+{BENCH_WARMUP:g}s khởi động) -> {base_url}")
+        result = await run_load(base_url, BENCH_SCALE, mix)
+    finally:
+        if stack is not None:
+            stack.stop()
+        if boot and "--keep-db" not in args and "--reuse-db" not in args:
+            await seed.drop()
+
+    result = {
+        "recorded_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "profile": profile,
+        "duration": BENCH_DURATION,
+        **result,
+    }
+    _print_table(result)
+    print(f"\nKết quả: {_write_result(result)}")
+
+    failures = []
+    if result["total"]["error_rate"] > BENCH_MAX_ERROR_RATE:
+        failures.append(f"TOTAL: error_rate {result['total']['error_rate']:.2%} > {BENCH_MAX_ERROR_RATE:.2%}")
+    base = baseline.load().get(profile)
+    if base is None:
+        print(f"Chưa có baseline cho profile '{profile}' (chạy với --save-baseline để lưu)")
+    else:
+        failures += baseline.compare(result, base)
+
+    if "--save-baseline" in args:
+        baseline.save(profile, result)
+        print(f"Đã lưu baseline: {baseline.BASELINE_PATH}")
+        return 0
+    if failures:
+        print(f"\n{len(failures)} hồi quy so với baseline ({base['recorded_at'] if base else '-'}):")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("\nKhông có hồi quy")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,61 @@
+# File: /benchmark/seed.py
+# CSDL cho benchmark: lược đồ FindmyDentist.sql + migration + dữ liệu giả (dùng chung bộ sinh với explain_check)
+# - BENCH_SCALE phòng khám / nha sĩ, 5*BENCH_SCALE khách hàng, 10*BENCH_SCALE lịch hẹn
+# - Mọi user có cùng mật khẩu BENCH_PASSWORD (hash bcrypt 1 lần, cùng cost với auth_service)
+#   -> lưu lượng đăng nhập đo đúng chi phí bcrypt, không phát sinh hash lại
+# Scale lớn (>= 100k) cần nhiều RAM và vài chục phút; dùng --reuse-db để không sinh lại giữa các lần chạy.
+
+import os
+
+from services._shared import explain_check
+from services._shared.migrate import connect
+from services._shared.security import get_password_hash
+
+BENCH_DATABASE = os.getenv("BENCH_DATABASE", "FindMyDentist_bench")
+BENCH_PASSWORD = os.getenv("BENCH_PASSWORD", "benchmark-123")
+
+
+def user_email(n: int) -> str:
+    """Email của user thứ n (1..5*scale là khách hàng, tiếp theo là nha sĩ) - khớp explain_check.seed"""
+    return f"user{n}@example.com"
+
+
+async def seeded_scale(database: str = BENCH_DATABASE) -> int | None:
+    """Số phòng khám trong CSDL benchmark đã có (None nếu chưa tạo)"""
+    conn = await connect(database="mysql")
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'Clinics'",
+                (database,),
+            )
+            if await cursor.fetchone() is None:
+                return None
+            await cursor.execute(f"SELECT COUNT(*) FROM `{database}`.Clinics")
+            (count,) = await cursor.fetchone()
+            return count or None
+    finally:
+        conn.close()
+
+
+async def create(scale: int, database: str = BENCH_DATABASE, reuse: bool = False):
+    """Tạo (hoặc dùng lại nếu reuse và đúng scale) CSDL benchmark"""
+    if reuse and await seeded_scale(database) == scale:
+        print(f"Dùng lại CSDL {database} (scale={scale})")
+        return
+    print(f"Tạo CSDL {database} (scale={scale})...")
+    conn = await explain_check.create_database(scale, database)
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute("UPDATE Users SET password_hash = %s", (get_password_hash(BENCH_PASSWORD),))
+    finally:
+        conn.close()
+
+
+async def drop(database: str = BENCH_DATABASE):
+    conn = await connect(database="mysql")
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    finally:
+        conn.close()
@@ -0,0 +1,321 @@
+# File: /launcher/run.py
+# Chạy production: nhiều worker cho mỗi service, khởi động nhanh, restart không rớt request.
+#
+# Mô hình pre-fork: tiến trình chủ mở socket lắng nghe cho từng service rồi tạo N worker
+# (launcher/worker.py) dùng chung socket đó. Tiến trình chủ không import FastAPI / code service
+# (khởi động gần như tức thì); mỗi worker chỉ import app của service mình, dùng uvloop + httptools nếu có.
+# Socket do tiến trình chủ giữ nên khi 1 worker tắt, kết nối đang xếp hàng vẫn được worker khác nhận
+# (khác SO_REUSEPORT: socket riêng của worker bị đóng thì kết nối trong hàng đợi của nó bị reset).
+#
+# Cách dùng:
+#   python -m launcher.run                     # gateway + auth + search + booking, mỗi service số worker = số CPU
+#                                              # (gateway: 1 worker trừ khi rate limit dùng Redis chung)
+#   LAUNCHER_WORKERS=4 LAUNCHER_SEARCH_WORKERS=8 python -m launcher.run
+#   LAUNCHER_SERVICES=search,booking python -m launcher.run
+#   python -m launcher.run reload              # restart cuốn chiếu (= kill -HUP <pid trong LAUNCHER_PID_FILE>)
+# Tín hiệu gửi tới tiến trình chủ:
+#   SIGHUP           restart cuốn chiếu: tạo worker mới, chờ nó sẵn sàng (lifespan xong: pool CSDL mở sẵn,
+#                    chỉ mục nạp xong) rồi mới cho 1 worker cũ nghỉ -> luôn đủ N worker nhận request
+#   SIGTERM / SIGINT tắt êm: worker ngừng accept, xử lý nốt request dở dang (tối đa LAUNCHER_GRACEFUL_TIMEOUT)
+# Worker chết bất thường được tạo lại (chờ tăng dần, tối đa 30 giây).
+
+import os
+import secrets
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAUNCHER_HOST = os.getenv("LAUNCHER_HOST", "127.0.0.1")
+LAUNCHER_SERVICES = [
+    name.strip() for name in os.getenv("LAUNCHER_SERVICES", "auth,search,booking,gateway").split(",") if name.strip()
+]
+LAUNCHER_WORKERS = int(os.getenv("LAUNCHER_WORKERS", "0")) or os.cpu_count() or 1
+LAUNCHER_READY_TIMEOUT = float(os.getenv("LAUNCHER_READY_TIMEOUT", "120"))
+LAUNCHER_GRACEFUL_TIMEOUT = float(os.getenv("LAUNCHER_GRACEFUL_TIMEOUT", "30"))
+LAUNCHER_PID_FILE = os.getenv("LAUNCHER_PID_FILE", os.path.join(ROOT_DIR, "launcher.pid"))
+# Bí mật cho API nội bộ giữa gateway và service (services/_shared/security.py): chưa đặt thì sinh ngẫu nhiên,
+# mọi worker (kể cả worker tạo lại khi restart cuốn chiếu) dùng chung
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN") or secrets.token_urlsafe(32)
+
+DEFAULT_PORTS = {"gateway": 8000, "auth": 8001, "search": 8002, "booking": 8003}
+MAX_RESTART_DELAY = 30.0
+
+
+def _port(service: str) -> int:
+    return int(os.getenv(f"LAUNCHER_{service.upper()}_PORT", str(DEFAULT_PORTS[service])))
+
+
+def _local_rate_limit() -> bool:
+    """Gateway giới hạn request bằng bộ đếm trong tiến trình (không dùng Redis chung)"""
+    return (os.getenv("GATEWAY_RATE_LIMIT_ENABLED", "1") == "1"
+            and os.getenv("GATEWAY_RATE_LIMIT_BACKEND", "memory") != "redis")
+
+
+def _workers(service: str) -> int:
+    explicit = os.getenv(f"LAUNCHER_{service.upper()}_WORKERS")
+    if service == "gateway" and _local_rate_limit() and explicit is None:
+        # Mỗi worker giữ bộ đếm riêng -> N worker = giới hạn x N. Không có Redis thì chỉ chạy 1 worker
+        return 1
+    return int(explicit or LAUNCHER_WORKERS)
+
+
+def _check_rate_limits():
+    """Nhiều worker gateway mà rate limit không dùng chung -> từ chối chạy (giới hạn chống dò mật khẩu bị nhân lên)"""
+    if "gateway" in LAUNCHER_SERVICES and _local_rate_limit() and _workers("gateway") > 1:
+        sys.exit(
+            "Nhiều worker gateway cần rate limit dùng chung: đặt GATEWAY_RATE_LIMIT_BACKEND=redis "
+            "(GATEWAY_RATE_LIMIT_REDIS_URL) hoặc LAUNCHER_GATEWAY_WORKERS=1"
+        )
+
+
+def _log(message: str):
+    print(f"[launcher {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def _worker_env(service: str) -> dict:
+    env = dict(os.environ)
+    env["INTERNAL_API_TOKEN"] = INTERNAL_API_TOKEN
+    # Worker mới chỉ nhận request khi dữ liệu trong bộ nhớ đã nạp xong (services/_shared/startup.py)
+    env.setdefault("STARTUP_READY_TIMEOUT", str(LAUNCHER_READY_TIMEOUT / 2))
+    if service == "auth":
+        # Bộ đếm đăng nhập sai nằm trong từng worker -> chia hạn mức cho các worker
+        env["LOGIN_THROTTLE_PROCESSES"] = str(_workers("auth"))
+    if service == "gateway":
+        env.setdefault("GATEWAY_STARTUP_WARM_UP", "1")
+        for name in DEFAULT_PORTS:
+            if name != "gateway":
+                env.setdefault(f"GATEWAY_{name.upper()}_URLS", f"http://{LAUNCHER_HOST}:{_port(name)}")
+    return env
+
+
+# === 1. WORKER ===
+
+class Worker:
+    def __init__(self, service: str, sock: socket.socket):
+        read_fd, write_fd = os.pipe()
+        env = {**_worker_env(service), "LAUNCHER_FD": str(sock.fileno()), "LAUNCHER_READY_FD": str(write_fd),
+               "LAUNCHER_GRACEFUL_TIMEOUT": str(LAUNCHER_GRACEFUL_TIMEOUT)}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "launcher.worker", service],
+            cwd=ROOT_DIR, env=env, pass_fds=(sock.fileno(), write_fd),
+            # Nhóm tiến trình riêng: Ctrl+C ở terminal chỉ tới tiến trình chủ, để nó tắt lần lượt gateway -> service
+            start_new_session=True,
+        )
+        os.close(write_fd)
+        self._ready_fd = read_fd
+        self.ready = False
+        self.started_at = time.monotonic()
+        self.drain_deadline = None  # Hạn chót xử lý nốt request sau SIGTERM (quá hạn -> SIGKILL)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def poll_ready(self, timeout: float = 0) -> bool | None:
+        """True: đã sẵn sàng; None: đang khởi động; False: chết trước khi sẵn sàng"""
+        if self.ready:
+            return True
+        if self._ready_fd is not None and select.select([self._ready_fd], [], [], timeout)[0]:
+            data = os.read(self._ready_fd, 1)
+            os.close(self._ready_fd)
+            self._ready_fd = None
+            self.ready = bool(data)
+            return self.ready or (False if self.process.poll() is not None else None)
+        return False if self.process.poll() is not None else None
+
+    def terminate(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+    def close(self):
+        if self._ready_fd is not None:
+            os.close(self._ready_fd)
+            self._ready_fd = None
+
+
+# === 2. CÁC WORKER CỦA 1 SERVICE ===
+
+class ServiceGroup:
+    def __init__(self, service: str, port: int, size: int):
+        self.service = service
+        self.port = port
+        self.size = size
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((LAUNCHER_HOST, port))
+        self.sock.listen(int(os.getenv("LAUNCHER_BACKLOG", "2048")))
+        self.sock.set_inheritable(True)
+        self.workers: list[Worker] = []
+        self.draining: list[Worker] = []  # Đã nhận SIGTERM, đang xử lý nốt request
+        self.failures = 0
+        self._next_restart = 0.0
+
+    def spawn(self) -> Worker:
+        worker = Worker(self.service, self.sock)
+        _log(f"{self.service}: tạo worker {worker.pid}")
+        return worker
+
+    def wait_ready(self, workers: list[Worker], should_stop) -> bool:
+        deadline = time.monotonic() + LAUNCHER_READY_TIMEOUT
+        while time.monotonic() < deadline and not should_stop():
+            states = [worker.poll_ready(0.1) for worker in workers]
+            if False in states:
+                return False
+            if all(states):
+                return True
+        return False
+
+    def start(self, should_stop) -> bool:
+        self.workers = [self.spawn() for _ in range(self.size)]
+        if not self.wait_ready(self.workers, should_stop):
+            return False
+        _log(f"{self.service}: {self.size} worker sẵn sàng tại http://{LAUNCHER_HOST}:{self.port}")
+        return True
+
+    def rolling_restart(self, should_stop) -> bool:
+        """Thay từng worker: worker mới sẵn sàng rồi worker cũ mới nghỉ (luôn có đủ worker nhận request)"""
+        for old in list(self.workers):
+            new = self.spawn()
+            if not self.wait_ready([new], should_stop):
+                _log(f"{self.service}: worker mới {new.pid} không khởi động được, dừng restart (giữ worker cũ)")
+                new.kill()
+                new.process.wait()
+                new.close()
+                return False
+            self.workers[self.workers.index(old)] = new
+            self._drain(old)
+        _log(f"{self.service}: đã restart {len(self.workers)} worker")
+        return True
+
+    def _drain(self, worker: Worker):
+        worker.terminate()
+        worker.drain_deadline = time.monotonic() + LAUNCHER_GRACEFUL_TIMEOUT + 5
+        self.draining.append(worker)
+
+    def supervise(self):
+        """Dọn worker đã nghỉ; tạo lại worker chết bất thường"""
+        now = time.monotonic()
+        for worker in list(self.draining):
+            if worker.process.poll() is not None:
+                worker.close()
+                self.draining.remove(worker)
+            elif now > worker.drain_deadline:
+                worker.kill()
+        for index, worker in enumerate(self.workers):
+            worker.poll_ready()
+            code = worker.process.poll()
+            if code is None:
+                if worker.ready and now - worker.started_at > 60:
+                    self.failures = 0
+                continue
+            if now < self._next_restart:
+                continue
+            worker.close()
+            self.failures += 1
+            delay = min(MAX_RESTART_DELAY, 0.5 * 2 ** (self.failures - 1))
+            self._next_restart = now + delay
+            _log(f"{self.service}: worker {worker.pid} thoát (exit {code}), tạo lại")
+            self.workers[index] = self.spawn()
+
+    def stop(self):
+        for worker in self.workers:
+            self._drain(worker)
+        self.workers = []
+
+    def stopped(self) -> bool:
+        self.supervise()
+        return not self.draining
+
+
+# === 3. TIẾN TRÌNH CHỦ ===
+
+class Launcher:
+    def __init__(self, services: list[str]):
+        self.services = services
+        self.groups: list[ServiceGroup] = []
+        self._stop = False
+        self._reload = False
+
+    def _on_stop(self, signum, frame):
+        self._stop = True
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        with open(LAUNCHER_PID_FILE, "w") as f:
+            f.write(str(os.getpid()))
+        try:
+            # Service trước, gateway sau cùng (để gateway mở sẵn được kết nối tới service)
+            for service in self.services:
+                group = ServiceGroup(service, _port(service), _workers(service))
+                self.groups.append(group)
+                if not group.start(lambda: self._stop):
+                    _log(f"{service}: không khởi động được")
+                    return 1
+            _log("Đã sẵn sàng (SIGHUP: restart cuốn chiếu, SIGTERM: tắt êm)")
+            while not self._stop:
+                if self._reload:
+                    self._reload = False
+                    _log("Restart cuốn chiếu...")
+                    for group in self.groups:
+                        if not group.rolling_restart(lambda: self._stop):
+                            break
+                for group in self.groups:
+                    group.supervise()
+                time.sleep(0.2)
+            return 0
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        _log("Đang tắt: chờ các request dở dang...")
+        # Gateway tắt trước và xử lý xong hẳn request dở dang (vẫn đang gọi tới service) rồi mới tắt service
+        for group in reversed(self.groups):
+            group.stop()
+            while not group.stopped():
+                for other in self.groups:
+                    if other is not group:
+                        other.supervise()  # Service vẫn phục vụ gateway trong lúc chờ
+                time.sleep(0.1)
+        for group in self.groups:
+            group.sock.close()
+        try:
+            os.remove(LAUNCHER_PID_FILE)
+        except FileNotFoundError:
+            pass
+        _log("Đã tắt")
+
+
+def reload() -> int:
+    try:
+        with open(LAUNCHER_PID_FILE) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, signal.SIGHUP)
+    except (FileNotFoundError, ValueError, ProcessLookupError) as e:
+        print(f"Không tìm thấy launcher đang chạy ({LAUNCHER_PID_FILE}): {e}", file=sys.stderr)
+        return 1
+    print(f"Đã gửi SIGHUP tới launcher {pid}")
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["reload"]:
+        sys.exit(reload())
+    unknown = [service for service in LAUNCHER_SERVICES if service not in DEFAULT_PORTS]
+    if unknown:
+        sys.exit(f"Service không hợp lệ: {', '.join(unknown)} (chọn trong {', '.join(DEFAULT_PORTS)})")
+    _check_rate_limits()
+    sys.exit(Launcher(LAUNCHER_SERVICES).run())
@@ -0,0 +1,73 @@
+# File: /launcher/worker.py
+# 1 worker của launcher (launcher/run.py tạo tiến trình: python -m launcher.worker <service>).
+# - Nhận socket đang lắng nghe từ tiến trình chủ (LAUNCHER_FD) -> mọi worker của 1 service dùng chung cổng
+# - Chỉ import app của đúng service mình (gateway không import code của service và ngược lại)
+# - Báo "sẵn sàng" qua pipe (LAUNCHER_READY_FD) sau khi lifespan khởi động xong (pool CSDL, chỉ mục đã nạp)
+#   và đã bắt đầu accept -> tiến trình chủ mới cho worker cũ nghỉ khi restart cuốn chiếu
+# - SIGTERM: uvicorn ngừng accept, chờ request dở dang tối đa LAUNCHER_GRACEFUL_TIMEOUT giây rồi tắt lifespan
+
+import os
+import socket
+import sys
+import threading
+import time
+
+import uvicorn
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Service -> (app, thư mục cần thêm vào sys.path)
+APPS = {
+    "gateway": ("main:app", os.path.join(ROOT_DIR, "api-gateway")),
+    "auth": ("services.auth_service.main:app", ROOT_DIR),
+    "search": ("services.search_service.main:app", ROOT_DIR),
+    "booking": ("services.booking_service.main:app", ROOT_DIR),
+}
+
+
+class WorkerServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, ready_fd: int | None):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.ready_fd is not None and not self.should_exit:
+            os.write(self.ready_fd, b"1")
+            os.close(self.ready_fd)
+            self.ready_fd = None
+
+
+def _exit_with_parent(server: WorkerServer):
+    """Tiến trình chủ chết đột ngột (kill -9) -> worker tự tắt êm thay vì giữ cổng mãi"""
+    parent = os.getppid()
+    while os.getppid() == parent:
+        time.sleep(1)
+    server.should_exit = True
+
+
+def main(service: str):
+    app, app_dir = APPS[service]
+    sys.path.insert(0, app_dir)
+    ready_fd = os.getenv("LAUNCHER_READY_FD")
+    config = uvicorn.Config(
+        app,
+        loop="auto",   # uvloop nếu đã cài (uvicorn[standard])
+        http="auto",   # httptools nếu đã cài
+        lifespan="on",
+        log_level=os.getenv("LAUNCHER_LOG_LEVEL", "info"),
+        access_log=os.getenv("LAUNCHER_ACCESS_LOG", "0") == "1",
+        backlog=int(os.getenv("LAUNCHER_BACKLOG", "2048")),
+        timeout_keep_alive=int(os.getenv("LAUNCHER_KEEP_ALIVE", "5")),
+        timeout_graceful_shutdown=int(float(os.getenv("LAUNCHER_GRACEFUL_TIMEOUT", "30"))),
+    )
+    server = WorkerServer(config, int(ready_fd) if ready_fd else None)
+    sock = socket.socket(fileno=int(os.environ["LAUNCHER_FD"]))
+    threading.Thread(target=_exit_with_parent, args=(server,), daemon=True).start()
+    server.run(sockets=[sock])
+    # uvicorn thoát với mã lỗi khi lifespan khởi động thất bại -> tiến trình chủ sẽ thấy và báo lỗi
+    sys.exit(0 if server.started else 3)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,41 @@
+-- ==========================================================
+-- 0001: Cột và bảng mới so với lược đồ gốc (FindmyDentist.sql, phiên bản 0)
+-- Phải chạy trước các index ở 0002 (idx_*_updated_at dùng cột updated_at ở đây)
+-- ==========================================================
+
+-- ----------------------------
+-- updated_at: đồng bộ tăng dần chỉ mục tìm kiếm và lịch làm việc trong bộ nhớ
+-- (search_service/text_index.py, booking_service/availability.py)
+-- ----------------------------
+ALTER TABLE `Users`
+  ADD COLUMN `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP AFTER `created_at`;
+
+ALTER TABLE `Dentists`
+  ADD COLUMN `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+
+-- ----------------------------
+-- Clinics: vị trí (tìm phòng khám gần nhất, search_service/geo_index.py)
+-- ----------------------------
+ALTER TABLE `Clinics`
+  ADD COLUMN `latitude` DECIMAL(9, 6) NULL AFTER `average_rating`,   -- Vĩ độ
+  ADD COLUMN `longitude` DECIMAL(9, 6) NULL AFTER `latitude`,        -- Kinh độ
+  ADD COLUMN `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+
+-- Vị trí cho 2 phòng khám mẫu của FindmyDentist.sql (không đụng tới dữ liệu khác)
+UPDATE `Clinics` SET `latitude` = 10.779700, `longitude` = 106.699000
+  WHERE `clinic_id` = 'clinic1' AND `latitude` IS NULL;
+UPDATE `Clinics` SET `latitude` = 10.775600, `longitude` = 106.688000
+  WHERE `clinic_id` = 'clinic2' AND `latitude` IS NULL;
+
+-- ----------------------------
+-- Token_Revocations: token JWT bị thu hồi (đăng xuất / reset mật khẩu), services/_shared/token_cache.py
+-- ----------------------------
+CREATE TABLE `Token_Revocations` (
+  `revocation_id` BIGINT AUTO_INCREMENT PRIMARY KEY, -- Các instance đọc tiếp từ id đã đồng bộ
+  `jti` VARCHAR(64),                                  -- Thu hồi 1 token (đăng xuất)
+  `user_id` VARCHAR(50),                              -- Thu hồi mọi token của user ...
+  `revoked_before` BIGINT,                            -- ... cấp trước thời điểm này (epoch giây)
+  `expires_at` BIGINT NOT NULL,                       -- Sau thời điểm này token liên quan đã hết hạn
+  `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX `idx_revocations_expires` (`expires_at`)
+);
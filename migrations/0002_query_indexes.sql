@@ -0,0 +1,61 @@
+-- ==========================================================
+-- 0002: Chỉ mục cho các truy vấn của auth_service và search_service
+-- Áp dụng bằng: python -m services._shared.migrate
+-- Kiểm tra (EXPLAIN, không được quét toàn bảng): python -m services._shared.explain_check
+-- ==========================================================
+
+-- ----------------------------
+-- Users
+-- ----------------------------
+-- Cột dùng cho luồng quên mật khẩu (routes.py: request-reset / verify-otp / reset-password)
+-- reset-password tìm user theo reset_token -> index (reset_token, reset_expiry), user_id có sẵn (PK)
+ALTER TABLE `Users`
+  ADD COLUMN `reset_token` VARCHAR(64) NULL,
+  ADD COLUMN `reset_expiry` DATETIME NULL,
+  ADD INDEX `idx_users_reset_token` (`reset_token`, `reset_expiry`),
+  ADD INDEX `idx_users_updated_at` (`updated_at`); -- Đồng bộ chỉ mục tìm kiếm (incremental_refresh)
+
+-- ----------------------------
+-- Clinics
+-- ----------------------------
+-- /clinics, /search?type=clinic: luôn lọc is_verified = TRUE, sắp xếp theo rating hoặc tên, lọc min_rating
+ALTER TABLE `Clinics`
+  ADD INDEX `idx_clinics_verified_rating` (`is_verified`, `average_rating`),
+  ADD INDEX `idx_clinics_verified_name` (`is_verified`, `name`),
+  ADD INDEX `idx_clinics_updated_at` (`updated_at`);
+
+-- ----------------------------
+-- Dentists
+-- ----------------------------
+ALTER TABLE `Dentists`
+  ADD INDEX `idx_dentists_verified_rating` (`is_verified`, `average_rating`),
+  ADD INDEX `idx_dentists_updated_at` (`updated_at`);
+
+-- ----------------------------
+-- Bảng trung gian: tra theo chiều ngược với khóa chính
+-- ----------------------------
+-- /clinics/nearby?service=: WHERE service_id = ? AND clinic_id IN (...) -> covering
+ALTER TABLE `Clinic_Services`
+  ADD INDEX `idx_clinic_services_service` (`service_id`, `clinic_id`);
+
+-- Nha sĩ thuộc những phòng khám nào
+ALTER TABLE `Clinic_Dentists`
+  ADD INDEX `idx_clinic_dentists_dentist` (`dentist_id`, `clinic_id`);
+
+ALTER TABLE `Dentist_Services`
+  ADD INDEX `idx_dentist_services_service` (`service_id`, `dentist_id`);
+
+-- ----------------------------
+-- Appointments: lịch của nha sĩ / khách hàng theo thời gian
+-- ----------------------------
+ALTER TABLE `Appointments`
+  ADD INDEX `idx_appointments_dentist_time` (`dentist_id`, `appointment_datetime`),
+  ADD INDEX `idx_appointments_customer_time` (`customer_id`, `appointment_datetime`),
+  ADD INDEX `idx_appointments_clinic_time` (`clinic_id`, `appointment_datetime`);
+
+-- ----------------------------
+-- Reviews: điểm đánh giá theo phòng khám / nha sĩ (covering cho COUNT/AVG(rating))
+-- ----------------------------
+ALTER TABLE `Reviews`
+  ADD INDEX `idx_reviews_clinic_rating` (`clinic_id`, `rating`),
+  ADD INDEX `idx_reviews_dentist_rating` (`dentist_id`, `rating`);
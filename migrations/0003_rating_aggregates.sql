@@ -0,0 +1,46 @@
+-- ==========================================================
+-- 0003: Điểm đánh giá duy trì tăng dần (services/_shared/ratings.py)
+-- - rating_count / rating_sum: số review đã xác minh và tổng điểm
+-- - rating_score: điểm Bayes, DECIMAL (so sánh bằng chính xác -> dùng được cho cursor phân trang)
+-- - /search sắp xếp theo rating_score bằng index, không GROUP BY Reviews
+-- ==========================================================
+
+ALTER TABLE `Clinics`
+  ADD COLUMN `rating_count` INT NOT NULL DEFAULT 0,
+  ADD COLUMN `rating_sum` INT NOT NULL DEFAULT 0,
+  ADD COLUMN `rating_score` DECIMAL(5, 4) NOT NULL DEFAULT 0,
+  ADD INDEX `idx_clinics_verified_score` (`is_verified`, `rating_score` DESC, `clinic_id`);
+
+ALTER TABLE `Dentists`
+  ADD COLUMN `rating_count` INT NOT NULL DEFAULT 0,
+  ADD COLUMN `rating_sum` INT NOT NULL DEFAULT 0,
+  ADD COLUMN `rating_score` DECIMAL(5, 4) NOT NULL DEFAULT 0,
+  ADD INDEX `idx_dentists_verified_score` (`is_verified`, `rating_score` DESC, `user_id`);
+
+-- Chỉ review đã xác minh được tính -> thêm is_verified vào index (covering cho recompute)
+ALTER TABLE `Reviews`
+  DROP INDEX `idx_reviews_clinic_rating`,
+  DROP INDEX `idx_reviews_dentist_rating`,
+  ADD INDEX `idx_reviews_clinic_verified` (`clinic_id`, `is_verified`, `rating`),
+  ADD INDEX `idx_reviews_dentist_verified` (`dentist_id`, `is_verified`, `rating`);
+
+-- Backfill 1 lần. Điểm Bayes dùng giá trị mặc định RATING_PRIOR_MEAN = 3.5, RATING_PRIOR_WEIGHT = 5;
+-- cấu hình khác thì chạy: python -m services._shared.ratings recompute
+UPDATE `Clinics` c
+  LEFT JOIN (
+    SELECT clinic_id, COUNT(*) AS n, SUM(rating) AS s FROM `Reviews` WHERE is_verified = TRUE GROUP BY clinic_id
+  ) r ON r.clinic_id = c.clinic_id
+SET c.rating_count = COALESCE(r.n, 0),
+    c.rating_sum = COALESCE(r.s, 0),
+    c.total_reviews = COALESCE(r.n, 0),
+    c.average_rating = IF(COALESCE(r.n, 0) > 0, r.s / r.n, 0),
+    c.rating_score = (5 * 3.5 + COALESCE(r.s, 0)) / (5 + COALESCE(r.n, 0));
+
+UPDATE `Dentists` d
+  LEFT JOIN (
+    SELECT dentist_id, COUNT(*) AS n, SUM(rating) AS s FROM `Reviews` WHERE is_verified = TRUE GROUP BY dentist_id
+  ) r ON r.dentist_id = d.user_id
+SET d.rating_count = COALESCE(r.n, 0),
+    d.rating_sum = COALESCE(r.s, 0),
+    d.average_rating = IF(COALESCE(r.n, 0) > 0, r.s / r.n, 0),
+    d.rating_score = (5 * 3.5 + COALESCE(r.s, 0)) / (5 + COALESCE(r.n, 0));
@@ -0,0 +1,27 @@
+-- ==========================================================
+-- 0004: Lịch trống và đặt lịch (services/booking_service)
+-- - Appointments: thêm dịch vụ và thời lượng (lấy từ Services.expected_duration_minutes khi đặt)
+-- - Dentist_Day_Slots: bitmap các ô thời gian đã được đặt của 1 nha sĩ trong 1 ngày
+--   (bit i = ô [i * slot_minutes, (i + 1) * slot_minutes) phút tính từ 0h), kèm version
+--   để đặt lịch bằng optimistic concurrency (UPDATE ... WHERE version = <đã đọc>)
+-- Sau khi áp dụng, dựng bitmap cho các lịch hẹn sẵn có:
+--   python -m services.booking_service.availability rebuild
+-- ==========================================================
+
+ALTER TABLE `Appointments`
+  ADD COLUMN `service_id` VARCHAR(50) NULL AFTER `clinic_id`,
+  ADD COLUMN `duration_minutes` INT NOT NULL DEFAULT 30 AFTER `appointment_datetime`,
+  ADD CONSTRAINT `fk_appointments_service` FOREIGN KEY (`service_id`) REFERENCES `Services`(`service_id`) ON DELETE SET NULL,
+  ADD INDEX `idx_appointments_time_status` (`appointment_datetime`, `status`); -- rebuild: lịch hẹn từ hôm nay trở đi
+
+CREATE TABLE `Dentist_Day_Slots` (
+  `dentist_id` VARCHAR(50) NOT NULL,
+  `slot_date` DATE NOT NULL,
+  `booked` VARBINARY(64) NOT NULL,             -- Bitmap little-endian các ô đã đặt
+  `slot_minutes` SMALLINT NOT NULL,            -- Độ dài 1 ô khi ghi bitmap (đổi BOOKING_SLOT_MINUTES vẫn đọc được)
+  `version` INT NOT NULL DEFAULT 0,
+  `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`dentist_id`, `slot_date`),
+  INDEX `idx_day_slots_date` (`slot_date`),     -- Tra lịch trống của mọi nha sĩ trong 1 ngày
+  FOREIGN KEY (`dentist_id`) REFERENCES `Users`(`user_id`) ON DELETE CASCADE
+);
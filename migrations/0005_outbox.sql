@@ -0,0 +1,28 @@
+-- ==========================================================
+-- 0005: Outbox cho tác vụ nền (services/_shared/outbox.py)
+-- - Handler ghi job vào Outbox_Jobs trong CÙNG transaction với thay đổi dữ liệu
+--   -> dữ liệu commit thì job chắc chắn có, rollback thì job cũng mất
+-- - Worker nền lấy job theo lô: PENDING/RUNNING có available_at <= NOW(3)
+--   (job đang chạy có available_at = hạn thuê; worker chết thì hết hạn và job được lấy lại)
+-- - idempotency_key: ghi trùng key giữ job cũ (ON DUPLICATE KEY), handler gửi kèm key
+--   (VD: Message-ID của email) để bên nhận tự bỏ bản trùng khi job chạy lại
+-- - DEAD: hết số lần thử (hoặc lỗi vĩnh viễn), giữ lại để xem / chạy lại (payload chứa OTP... bị xóa):
+--   python -m services._shared.outbox retry-dead
+-- ==========================================================
+
+CREATE TABLE `Outbox_Jobs` (
+  `job_id` BIGINT AUTO_INCREMENT PRIMARY KEY,
+  `kind` VARCHAR(64) NOT NULL,                  -- VD: email.password_reset
+  `idempotency_key` VARCHAR(191) NOT NULL,
+  `payload` MEDIUMTEXT NULL,                    -- JSON, xóa khi xong (không giữ OTP...)
+  `status` ENUM('PENDING', 'RUNNING', 'DONE', 'DEAD') NOT NULL DEFAULT 'PENDING',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `available_at` DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+  `locked_by` VARCHAR(64) NULL,                 -- Lô đã lấy job (mỗi lần lấy có mã riêng)
+  `last_error` TEXT NULL,
+  `created_at` DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+  `completed_at` DATETIME(3) NULL,
+  UNIQUE KEY `uq_outbox_idempotency` (`idempotency_key`),
+  INDEX `idx_outbox_claim` (`status`, `available_at`),     -- Lấy job đến hạn
+  INDEX `idx_outbox_locked_by` (`locked_by`)               -- Đọc lại lô vừa lấy
+);
@@ -1,7 +1,17 @@
 # File: /services/_shared/db.py
 import aiomysql  # <-- THAY ĐỔI
+from . import metrics
+from fastapi import HTTPException, Request, Response, status
 from pydantic_settings import BaseSettings
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import math
 import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
 
 # 1. Đọc cấu hình từ file .env (Giữ nguyên)
 class Settings(BaseSettings):
@@ -9,25 +19,390 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_DATABASE: str
+    DB_PORT: int = 3306
+
+    # Cấu hình pool kết nối (có thể ghi đè trong .env)
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_RECYCLE: int = 3600           # (giây) Đóng kết nối đã mở quá lâu
+    DB_POOL_ACQUIRE_TIMEOUT: float = 5.0  # (giây) Thời gian chờ tối đa khi pool đã hết kết nối rảnh
+    DB_POOL_PING_INTERVAL: float = 30.0   # (giây) Kết nối rảnh lâu hơn mức này sẽ được ping lại
+    DB_POOL_WARM_SIZE: int = 4            # Số kết nối mở sẵn khi khởi động (request đầu không phải chờ bắt tay MySQL)
+
+    # Read replica (chỉ dùng cho các API đọc qua get_read_connection); rỗng = mọi thứ đọc từ primary
+    DB_REPLICA_HOSTS: str = ""               # VD: "10.0.0.11,10.0.0.12:3307" (cùng user/mật khẩu/CSDL với primary)
+    DB_REPLICA_POOL_MAX_SIZE: int = 10
+    DB_REPLICA_MAX_LAG: float = 5.0          # (giây) Trễ hơn mức này -> không đọc từ replica đó
+    DB_REPLICA_CHECK_INTERVAL: float = 2.0   # (giây) Chu kỳ đo độ trễ (SHOW REPLICA STATUS)
+    # (giây) Sau khi user ghi, các lần đọc của user đó đi thẳng primary trong khoảng này.
+    # Nên >= DB_REPLICA_MAX_LAG để luôn đọc được dữ liệu mình vừa ghi.
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
     class Config:
         env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')
+        extra = "ignore" # .env dùng chung cho cấu hình khác (cache...)
 
 settings = Settings()
 
-# 2. Tạo hàm cung cấp kết nối CSDL (Dùng aiomysql)
-async def get_db_connection():
-    conn = None
+# 2. Pool kết nối dùng chung cho cả process
+# Tạo 1 lần trong lifespan của FastAPI, mỗi request chỉ "mượn" kết nối rồi trả lại
+_pool: aiomysql.Pool | None = None
+_pool_lock = asyncio.Lock()
+
+
+class PoolStats:
+    """Số liệu đo đạc của pool (đọc qua get_pool_stats())"""
+
+    def __init__(self):
+        self.waiters = 0          # Số request đang chờ lấy kết nối
+        self.acquired = 0         # Tổng số lần lấy kết nối thành công
+        self.timeouts = 0         # Số lần chờ quá DB_POOL_ACQUIRE_TIMEOUT
+        self.reconnects = 0       # Số lần ping phát hiện kết nối chết
+        self.acquire_total_ms = 0.0
+        self.acquire_max_ms = 0.0
+
+    def record_acquire(self, elapsed_ms: float):
+        self.acquired += 1
+        self.acquire_total_ms += elapsed_ms
+        if elapsed_ms > self.acquire_max_ms:
+            self.acquire_max_ms = elapsed_ms
+
+
+pool_stats = PoolStats()
+
+
+async def init_db_pool() -> aiomysql.Pool:
+    """Tạo pool (gọi khi service khởi động). Gọi nhiều lần vẫn chỉ tạo 1 pool."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = await aiomysql.create_pool(
+                host=settings.DB_HOST,
+                port=settings.DB_PORT,
+                user=settings.DB_USER,
+                password=settings.DB_PASSWORD,
+                db=settings.DB_DATABASE,
+                autocommit=True, # Tự động commit
+                minsize=settings.DB_POOL_MIN_SIZE,
+                maxsize=settings.DB_POOL_MAX_SIZE,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+            )
+            await _warm_pool(_pool, settings.DB_POOL_WARM_SIZE)
+    # Đo độ trễ các replica ở nền (không có replica thì không làm gì)
+    replica_monitor.start()
+    return _pool
+
+
+async def _warm_pool(pool: aiomysql.Pool, size: int):
+    """Mở sẵn kết nối tới `size` (tối đa DB_POOL_MAX_SIZE) rồi trả về pool ở trạng thái rảnh"""
+    missing = min(size, settings.DB_POOL_MAX_SIZE) - pool.size
+    if missing <= 0:
+        return
+    conns = await asyncio.gather(*(pool.acquire() for _ in range(missing)), return_exceptions=True)
+    for conn in conns:
+        if isinstance(conn, BaseException):
+            logger.warning(f"Không mở sẵn được kết nối CSDL: {conn}")
+        else:
+            pool.release(conn)
+
+
+async def close_db_pool():
+    """Đóng pool và chờ các kết nối đang mượn được trả lại (gọi khi service tắt)."""
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            await _pool.wait_closed()
+            _pool = None
+    await replica_monitor.stop()
+
+
+def get_pool_stats() -> dict:
+    """Trả về số liệu của pool: kết nối đang dùng, đang rảnh, số request đang chờ, độ trễ khi lấy kết nối."""
+    acquired = pool_stats.acquired
+    stats = {
+        "initialized": _pool is not None,
+        "min_size": settings.DB_POOL_MIN_SIZE,
+        "max_size": settings.DB_POOL_MAX_SIZE,
+        "size": 0,
+        "in_use": 0,
+        "free": 0,
+        "waiters": pool_stats.waiters,
+        "acquired_total": acquired,
+        "acquire_timeouts": pool_stats.timeouts,
+        "reconnects": pool_stats.reconnects,
+        "acquire_avg_ms": round(pool_stats.acquire_total_ms / acquired, 3) if acquired else 0.0,
+        "acquire_max_ms": round(pool_stats.acquire_max_ms, 3),
+    }
+    if _pool is not None:
+        stats["size"] = _pool.size
+        stats["free"] = _pool.freesize
+        stats["in_use"] = _pool.size - _pool.freesize
+    if replica_monitor.replicas:
+        stats["reads"] = dict(read_routing)
+        stats["replicas"] = [replica.status() for replica in replica_monitor.replicas]
+    return stats
+
+
+def _pool_gauges() -> dict:
+    stats = get_pool_stats()
+    return {("in_use",): stats["in_use"], ("free",): stats["free"], ("waiters",): stats["waiters"]}
+
+
+metrics.registry.register(metrics.GaugeFunc(
+    "db_pool_connections", "Kết nối của pool CSDL theo trạng thái", ("state",), _pool_gauges,
+))
+
+
+# 3. Mượn kết nối từ pool (dùng chung cho dependency và các tác vụ nền)
+@asynccontextmanager
+async def acquire_connection():
+    """
+    Mượn 1 kết nối từ pool, tự trả lại khi ra khỏi khối `async with`.
+    Dùng trực tiếp cho tác vụ nền (không có request), VD: nạp chỉ mục tìm kiếm.
+    """
+    pool = _pool
+    if pool is None:
+        # Trường hợp chạy app không qua lifespan (VD: script, test) thì tạo pool khi cần
+        pool = await init_db_pool()
+
+    pool_stats.waiters += 1
+    start = time.perf_counter()
     try:
-        # --- THAY ĐỔI LỚN Ở ĐÂY ---
-        conn = await aiomysql.connect(
-            host=settings.DB_HOST,
-            user=settings.DB_USER,
-            password=settings.DB_PASSWORD,
-            db=settings.DB_DATABASE,
-            autocommit=True # Tự động commit
+        conn = await asyncio.wait_for(pool.acquire(), timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        pool_stats.timeouts += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="CSDL đang quá tải, vui lòng thử lại sau",
         )
-        # ---------------------------
+    finally:
+        pool_stats.waiters -= 1
+    elapsed = time.perf_counter() - start
+    pool_stats.record_acquire(elapsed * 1000)
+    metrics.db_acquire_duration.observe(elapsed)
+
+    try:
+        # Health check: chỉ ping kết nối đã nằm rảnh quá lâu (tránh tốn 1 round-trip mỗi request)
+        if asyncio.get_running_loop().time() - conn.last_usage > settings.DB_POOL_PING_INTERVAL:
+            try:
+                await conn.ping(reconnect=False)
+            except Exception:
+                pool_stats.reconnects += 1
+                await conn.ping(reconnect=True)
+        # Mọi cursor của kết nối được đo thời gian + số dòng (metrics.TimedConnection)
+        yield metrics.instrument_connection(conn)
+    finally:
+        # Trả kết nối về pool (pool tự đóng kết nối nếu còn transaction dở dang)
+        pool.release(conn)
+
+
+# 4. Tạo hàm cung cấp kết nối CSDL (Dùng aiomysql)
+async def get_db_connection():
+    """
+    Dependency của FastAPI: mượn 1 kết nối từ pool, trả lại pool khi request xong.
+    (Giữ nguyên cách dùng: conn = Depends(get_db_connection))
+    """
+    async with acquire_connection() as conn:
         yield conn # Cung cấp kết nối
+
+
+# 5. Read replica: định tuyến các truy vấn chỉ đọc
+# - Chọn replica khỏe có độ trễ thấp nhất (cùng mức trễ thì chọn pool đang rảnh hơn)
+# - Không còn replica khỏe / lấy kết nối replica lỗi -> đọc từ primary
+# - Read-your-writes: API ghi dùng get_write_connection -> đặt cookie RW_COOKIE ngắn hạn;
+#   request có cookie này đọc từ primary. Cookie đi qua gateway nên có hiệu lực với mọi service.
+RW_COOKIE = "findmydentist_rw"
+
+read_routing = {"replica": 0, "primary": 0, "sticky": 0, "fallback": 0}
+
+metrics.registry.register(metrics.GaugeFunc(
+    "db_reads_total", "Số lần mượn kết nối đọc theo nơi phục vụ", ("target",),
+    lambda: {(target,): count for target, count in read_routing.items()}, kind="counter",
+))
+
+
+class Replica:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.pool: aiomysql.Pool | None = None
+        self.lag: float | None = None   # Seconds_Behind_Source
+        self.healthy = False
+        self.checked_at = 0.0
+        self.last_error: str | None = None
+
+    @property
+    def usable(self) -> bool:
+        # Số đo quá cũ (monitor dừng / treo) thì không tin nữa
+        fresh = time.monotonic() - self.checked_at < settings.DB_REPLICA_CHECK_INTERVAL * 3
+        return self.healthy and fresh and self.pool is not None and not self.pool.closed
+
+    def mark_failed(self, error: Exception | str):
+        self.healthy = False
+        self.last_error = str(error) or type(error).__name__
+
+    def status(self) -> dict:
+        return {
+            "host": f"{self.host}:{self.port}",
+            "healthy": self.usable,
+            "lag_seconds": self.lag,
+            "in_use": self.pool.size - self.pool.freesize if self.pool is not None else 0,
+            "last_error": self.last_error,
+        }
+
+
+def _parse_replicas(raw: str) -> list[Replica]:
+    replicas = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        replicas.append(Replica(host, int(port) if port else settings.DB_PORT))
+    return replicas
+
+
+class ReplicaMonitor:
+    """Tác vụ nền: đo độ trễ từng replica mỗi DB_REPLICA_CHECK_INTERVAL giây"""
+
+    def __init__(self, replicas: list[Replica]):
+        self.replicas = replicas
+        self._task: asyncio.Task | None = None
+
+    async def check(self, replica: Replica):
+        try:
+            if replica.pool is None or replica.pool.closed:
+                replica.pool = await aiomysql.create_pool(
+                    host=replica.host,
+                    port=replica.port,
+                    user=settings.DB_USER,
+                    password=settings.DB_PASSWORD,
+                    db=settings.DB_DATABASE,
+                    autocommit=True,
+                    minsize=0,
+                    maxsize=settings.DB_REPLICA_POOL_MAX_SIZE,
+                    pool_recycle=settings.DB_POOL_RECYCLE,
+                )
+            conn = await asyncio.wait_for(replica.pool.acquire(), timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+            try:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    try:
+                        await cursor.execute("SHOW REPLICA STATUS")  # MySQL >= 8.0.22
+                    except aiomysql.ProgrammingError:
+                        await cursor.execute("SHOW SLAVE STATUS")    # MariaDB / MySQL cũ
+                    row = await cursor.fetchone()
+            finally:
+                replica.pool.release(conn)
+        except Exception as e:
+            replica.mark_failed(e)
+            return
+        replica.checked_at = time.monotonic()
+        if row is None:
+            replica.mark_failed("Máy chủ không phải replica (SHOW REPLICA STATUS rỗng)")
+            return
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        if lag is None:
+            # Luồng replication đã dừng
+            replica.lag = None
+            replica.mark_failed(row.get("Last_SQL_Error") or row.get("Last_IO_Error") or "Replication đã dừng")
+            return
+        replica.lag = float(lag)
+        replica.healthy = replica.lag <= settings.DB_REPLICA_MAX_LAG
+        replica.last_error = None if replica.healthy else f"Trễ {replica.lag:.0f}s"
+
+    async def _run(self):
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                replica.pool.close()
+                await replica.pool.wait_closed()
+                replica.pool = None
+
+
+replica_monitor = ReplicaMonitor(_parse_replicas(settings.DB_REPLICA_HOSTS))
+
+
+def _pick_replica() -> Replica | None:
+    candidates = [replica for replica in replica_monitor.replicas if replica.usable]
+    if not candidates:
+        return None
+    random.shuffle(candidates)  # Cùng mức trễ và cùng tải -> chia đều
+    return min(candidates, key=lambda r: (math.floor(r.lag or 0), r.pool.size - r.pool.freesize))
+
+
+@asynccontextmanager
+async def acquire_read_connection(prefer_primary: bool = False):
+    """
+    Mượn 1 kết nối chỉ để đọc: từ replica nếu có replica khỏe, không thì từ primary.
+    prefer_primary=True: đọc primary (VD: user vừa ghi, cần thấy ngay dữ liệu của mình).
+    """
+    replica = None if prefer_primary else _pick_replica()
+    conn = None
+    if replica is not None:
+        try:
+            conn = await asyncio.wait_for(replica.pool.acquire(), timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+        except Exception as e:
+            replica.mark_failed(e)
+            read_routing["fallback"] += 1
+
+    if conn is None:
+        if prefer_primary:
+            read_routing["sticky"] += 1
+        elif replica is None:
+            read_routing["primary"] += 1
+        async with acquire_connection() as primary_conn:
+            yield primary_conn
+        return
+
+    read_routing["replica"] += 1
+    try:
+        yield metrics.instrument_connection(conn)
     finally:
-        if conn:
-            conn.close() # Đóng kết nối
\ No newline at end of file
+        replica.pool.release(conn)
+
+
+def recently_wrote(request: Request) -> bool:
+    """Request có cookie read-your-writes còn hạn"""
+    try:
+        return float(request.cookies.get(RW_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def mark_write(response: Response):
+    """Các lần đọc tiếp theo của user này (trong DB_READ_YOUR_WRITES_SECONDS) đi thẳng primary"""
+    window = settings.DB_READ_YOUR_WRITES_SECONDS
+    if not replica_monitor.replicas or window <= 0:
+        return
+    response.set_cookie(
+        RW_COOKIE, str(int(time.time() + window) + 1),
+        max_age=math.ceil(window), httponly=True, samesite="lax", path="/",
+    )
+
+
+async def get_read_connection(request: Request):
+    """Dependency cho API chỉ đọc (search_service): replica theo độ trễ, primary nếu user vừa ghi"""
+    async with acquire_read_connection(prefer_primary=recently_wrote(request)) as conn:
+        yield conn
+
+
+async def get_write_connection(response: Response):
+    """Dependency cho API ghi: kết nối primary + bật read-your-writes cho user"""
+    mark_write(response)
+    async with acquire_connection() as conn:
+        yield conn
@@ -0,0 +1,321 @@
+# File: /services/_shared/explain_check.py
+# Kiểm tra kế hoạch truy vấn (EXPLAIN) của mọi câu SQL mà auth_service, search_service và booking_service gửi tới CSDL.
+# - Tạo CSDL tạm (EXPLAIN_DATABASE) từ lược đồ FindmyDentist.sql + các migration
+# - Sinh dữ liệu giả với số lượng EXPLAIN_SCALE phòng khám (bảng nhỏ thì MySQL luôn chọn quét toàn bảng)
+# - EXPLAIN từng truy vấn; có bảng nào bị quét toàn bộ (type = ALL / index) -> báo lỗi, exit code 1
+#
+# Cách dùng (cần MySQL/MariaDB chạy ở máy, cấu hình kết nối đọc từ .env):
+#   python -m services._shared.explain_check
+#   EXPLAIN_SCALE=5000 python -m services._shared.explain_check --keep   # giữ lại CSDL tạm sau khi chạy
+
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import aiomysql
+
+from . import outbox, ratings, token_cache
+from .migrate import ROOT_DIR, connect, migrate, split_statements
+from ..booking_service import availability
+from ..search_service import loaders as search_loaders
+from ..search_service import routes as search_routes
+from ..search_service import text_index
+
+EXPLAIN_DATABASE = os.getenv("EXPLAIN_DATABASE", "FindMyDentist_explain")
+EXPLAIN_SCALE = int(os.getenv("EXPLAIN_SCALE", "2000"))
+
+# Kiểu truy cập của EXPLAIN nghĩa là đọc toàn bộ bảng / toàn bộ index
+FULL_SCAN_TYPES = {"ALL", "index"}
+
+
+# === 1. DANH SÁCH TRUY VẤN ===
+# (tên, SQL, tham số, lý do được phép quét toàn bảng hoặc None)
+# SQL của auth_service viết trực tiếp trong routes.py -> giữ đồng bộ khi sửa routes.py
+def _queries() -> list[tuple[str, str, list, str | None]]:
+    now = datetime.utcnow()
+    queries = [
+        # --- auth_service ---
+        ("auth.login", "SELECT user_id, email, role, password_hash FROM Users WHERE email = %s",
+         ["user1@example.com"], None),
+        ("auth.register.email_exists", "SELECT user_id FROM Users WHERE email = %s",
+         ["user1@example.com"], None),
+        ("auth.login.rehash", "UPDATE Users SET password_hash = %s WHERE user_id = %s",
+         ["x", "cust_1"], None),
+        ("auth.request_reset", "UPDATE Users SET reset_token = %s, reset_expiry = %s WHERE email = %s",
+         ["t", now, "user1@example.com"], None),
+        ("auth.verify_otp", "SELECT reset_token, reset_expiry FROM Users WHERE email = %s",
+         ["user1@example.com"], None),
+        ("auth.reset_password.lookup",
+         "SELECT user_id FROM Users WHERE reset_token = %s AND reset_expiry > %s", ["t", now], None),
+        ("auth.reset_password.update",
+         "UPDATE Users SET password_hash = %s, reset_token = NULL, reset_expiry = NULL "
+         "WHERE user_id = %s AND reset_token = %s", ["x", "cust_1", "t"], None),
+        ("auth.revocations.sync", token_cache._SELECT_SQL, [0, int(now.timestamp())], None),
+        ("outbox.claim", outbox._claim_sql(2), ["b", 60_000_000, "email.password_reset", "email.welcome", 20], None),
+        ("outbox.claimed", outbox._SELECT_CLAIMED_SQL, ["b"], None),
+        ("outbox.prune", outbox._PRUNE_SQL, [86400], None),
+
+        # --- search_service ---
+        ("search.clinics",
+         "SELECT clinic_id, name, address, description, images, average_rating "
+         "FROM Clinics WHERE is_verified = TRUE", [], None),
+        ("search.dentist_detail",
+         "SELECT u.user_id, u.first_name, u.last_name, u.email, u.phone_number, "
+         "d.specialization, d.bio, d.years_of_exp, d.average_rating "
+         "FROM Users u JOIN Dentists d ON u.user_id = d.user_id WHERE u.user_id = %s", ["dent_1"], None),
+        ("search.nearby.service_filter",
+         "SELECT clinic_id FROM Clinic_Services WHERE service_id = %s AND clinic_id IN (%s, %s, %s)",
+         ["serv_1", "clinic_1", "clinic_2", "clinic_3"], None),
+        ("index.full_refresh.clinics", text_index._CLINIC_SQL, [],
+         "Nạp lại toàn bộ chỉ mục tìm kiếm (tác vụ nền, mặc định 1 giờ/lần)"),
+        ("index.full_refresh.dentists", text_index._DENTIST_SQL, [],
+         "Nạp lại toàn bộ chỉ mục tìm kiếm (tác vụ nền, mặc định 1 giờ/lần)"),
+        ("index.incremental.clinics", text_index._CLINIC_SQL + " WHERE updated_at >= %s",
+         [now - timedelta(seconds=30)], None),
+        ("index.incremental.dentists",
+         f"({text_index._DENTIST_SQL} WHERE d.updated_at >= %s) UNION "
+         f"({text_index._DENTIST_SQL} WHERE u.updated_at >= %s)",
+         [now - timedelta(seconds=30)] * 2, None),
+    ]
+
+    # Tài liệu ghép (loaders.py): mỗi loader là 1 câu IN (...)
+    for name, sql, keys in [
+        ("dentists", search_loaders.DENTISTS_SQL, ["dent_1", "dent_2", "dent_3"]),
+        ("clinics", search_loaders.CLINICS_SQL, ["clinic_1", "clinic_2", "clinic_3"]),
+        ("clinics_of_dentists", search_loaders.CLINICS_OF_DENTISTS_SQL, ["dent_1", "dent_2", "dent_3"]),
+        ("dentists_of_clinics", search_loaders.DENTISTS_OF_CLINICS_SQL, ["clinic_1", "clinic_2"]),
+        ("services_of_dentists", search_loaders.SERVICES_OF_DENTISTS_SQL, ["dent_1", "dent_2", "dent_3"]),
+        ("services_of_clinics", search_loaders.SERVICES_OF_CLINICS_SQL, ["clinic_1", "clinic_2"]),
+    ]:
+        queries.append((f"search.loaders.{name}", sql.format(", ".join(["%s"] * len(keys))), keys, None))
+
+    # --- booking_service ---
+    today = now.date()
+    day_start = datetime.combine(today, datetime.min.time())
+    queries += [
+        ("booking.schedule.full", availability._SCHEDULE_SQL, [],
+         "Nạp lại toàn bộ lịch làm việc (tác vụ nền, mặc định 1 giờ/lần)"),
+        ("booking.schedule.incremental", availability._SCHEDULE_SQL + " WHERE updated_at >= %s",
+         [now - timedelta(seconds=30)], None),
+        ("booking.day_bitmaps", availability._DAY_SQL, [today], None),
+        ("booking.day_row", availability._SELECT_DAY_ROW_SQL, ["dent_1", today], None),
+        ("booking.appointments_of_day", availability._APPOINTMENTS_OF_DAY_SQL,
+         ["dent_1", day_start, day_start + timedelta(days=1)], None),
+        ("booking.cas", availability._CAS_SQL, [b"", 15, "dent_1", today, 0], None),
+        ("booking.service_duration", "SELECT expected_duration_minutes FROM Services WHERE service_id = %s",
+         ["serv_1"], None),
+        ("booking.clinic_dentists", "SELECT dentist_id FROM Clinic_Dentists WHERE clinic_id = %s",
+         ["clinic_1"], None),
+        ("booking.clinic_dentist_link",
+         "SELECT 1 FROM Clinic_Dentists WHERE clinic_id = %s AND dentist_id = %s", ["clinic_1", "dent_1"], None),
+        ("booking.cancel.lookup",
+         "SELECT customer_id, dentist_id, appointment_datetime, status FROM Appointments "
+         "WHERE appointment_id = %s", ["app_1"], None),
+        ("booking.cancel.update", "UPDATE Appointments SET status = 'Cancelled' WHERE appointment_id = %s",
+         ["app_1"], None),
+    ]
+
+    # Điểm đánh giá (ratings.py): cập nhật theo khóa chính, tính lại theo lô khóa chính
+    for kind, (table, key_column, review_column, _) in ratings._TARGETS.items():
+        target_id = "clinic_1" if kind == "clinic" else "dent_1"
+        queries += [
+            (f"ratings.{kind}.delta",
+             f"UPDATE {table} SET rating_count = rating_count + %s, rating_sum = rating_sum + %s, "
+             f"rating_score = (%s * %s + rating_sum) / (%s + rating_count) WHERE {key_column} = %s",
+             [1, 5, 5, 3.5, 5, target_id], None),
+            (f"ratings.{kind}.recompute.batch",
+             f"SELECT {key_column} FROM {table} WHERE {key_column} > %s ORDER BY {key_column} LIMIT %s",
+             [target_id, 500], None),
+            (f"ratings.{kind}.recompute.aggregate",
+             f"SELECT {review_column}, COUNT(*), COALESCE(SUM(rating), 0) FROM Reviews "
+             f"WHERE is_verified = TRUE AND {review_column} IN (%s, %s, %s) GROUP BY {review_column}",
+             [target_id, target_id + "0", target_id + "1"], None),
+        ]
+
+    # /search: mọi tổ hợp type x sort x bộ lọc, cả trang đầu lẫn trang sau (cursor)
+    text_index.refresher.ready = False  # Từ khóa đi theo nhánh LIKE; nhánh IN (...) thử riêng bên dưới
+    filters = {
+        "plain": {},
+        "q_like": {"q": "nha"},
+        "min_rating": {"min_rating": 4.0},
+        "specialization": {"specialization": "Chỉnh nha"},
+        "service": {"service": "serv_1"},
+        "price": {"min_price": 100000, "max_price": 500000},
+    }
+    for type in ("clinic", "dentist"):
+        for name, values in filters.items():
+            args = {"q": None, "specialization": None, "service": None, "min_rating": None,
+                    "min_price": None, "max_price": None, **values}
+            conditions, params = search_routes._build_search_filters(type, **args)
+            for sort in ("rating", "name"):
+                for after in (None, (3.5 if sort == "rating" else "M", "x_500")):
+                    (page_sql, page_params), (count_sql, count_params) = search_routes._build_search_sql(
+                        type, sort, conditions, params, after, 20
+                    )
+                    page = "next" if after else "first"
+                    queries.append((f"search.{type}.{name}.{sort}.{page}", page_sql, page_params, None))
+            queries.append((f"search.{type}.{name}.count", count_sql, count_params, None))
+
+        # Từ khóa khớp chỉ mục trong bộ nhớ -> id IN (...)
+        id_column = search_routes._ID_COLUMNS[type]
+        ids = [f"{'clinic' if type == 'clinic' else 'dent'}_{i}" for i in range(1, 21)]
+        in_condition = f"{id_column} IN ({', '.join(['%s'] * len(ids))})"
+        verified = "c.is_verified = TRUE" if type == "clinic" else "d.is_verified = TRUE"
+        (page_sql, page_params), _ = search_routes._build_search_sql(
+            type, "rating", [verified, in_condition], ids, None, 20
+        )
+        queries.append((f"search.{type}.q_index.rating.first", page_sql, page_params, None))
+    return queries
+
+
+# === 2. TẠO CSDL TẠM VÀ DỮ LIỆU GIẢ ===
+def _schema_statements(database: str = EXPLAIN_DATABASE) -> list[str]:
+    """Các câu tạo bảng trong FindmyDentist.sql (bỏ INSERT mẫu), đổi tên CSDL sang `database`"""
+    with open(os.path.join(ROOT_DIR, "FindmyDentist.sql"), encoding="utf-8") as f:
+        sql = f.read().replace("`FindMyDentist`", f"`{database}`")
+    return [s for s in split_statements(sql) if not s.lstrip().upper().startswith("INSERT")]
+
+
+async def _insert_many(cursor, table: str, columns: list[str], rows: list[tuple], chunk: int = 1000):
+    sql = (
+        f"INSERT INTO `{table}` ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    for i in range(0, len(rows), chunk):
+        await cursor.executemany(sql, rows[i:i + chunk])
+
+
+async def seed(conn, scale: int, rng: random.Random | None = None):
+    """
+    Sinh dữ liệu giả theo tỉ lệ: scale phòng khám, scale nha sĩ, 5*scale khách hàng,
+    30 dịch vụ, 10*scale lịch hẹn. Khoảng 20% phòng khám / nha sĩ đã được xác minh.
+    """
+    rng = rng or random.Random(42)
+    now = datetime.utcnow()
+    specializations = ["Chỉnh nha", "Nha chu", "Nội nha", "Phục hình", "Nha khoa trẻ em", "Cấy ghép"]
+    customers = [f"cust_{i}" for i in range(1, scale * 5 + 1)]
+    dentists = [f"dent_{i}" for i in range(1, scale + 1)]
+    clinics = [f"clinic_{i}" for i in range(1, scale + 1)]
+    services = [f"serv_{i}" for i in range(1, 31)]
+
+    users = [
+        (user_id, f"user{n}@example.com", "x", f"Tên {n}", f"Họ {n % 97}",
+         "DENTIST" if user_id.startswith("dent") else "CUSTOMER")
+        for n, user_id in enumerate(customers + dentists, start=1)
+    ]
+    async with conn.cursor() as cursor:
+        await _insert_many(cursor, "Users",
+                           ["user_id", "email", "password_hash", "first_name", "last_name", "role"], users)
+        await _insert_many(cursor, "Customers", ["user_id"], [(c,) for c in customers])
+        await _insert_many(cursor, "Dentists",
+                           ["user_id", "years_of_exp", "specialization", "bio", "average_rating", "is_verified"],
+                           [(d, rng.randint(0, 30), rng.choice(specializations), "Nha sĩ",
+                             round(rng.uniform(0, 5), 1), rng.random() < 0.2) for d in dentists])
+        await _insert_many(cursor, "Clinics",
+                           ["clinic_id", "name", "address", "description", "average_rating",
+                            "latitude", "longitude", "is_verified"],
+                           [(c, f"Nha khoa {c}", f"{i} Đường {i % 50}, TP.HCM", "Phòng khám nha khoa",
+                             round(rng.uniform(0, 5), 1), 10.7 + rng.random() / 5, 106.6 + rng.random() / 5,
+                             rng.random() < 0.2) for i, c in enumerate(clinics)])
+        await _insert_many(cursor, "Services",
+                           ["service_id", "name", "min_price", "max_price", "expected_duration_minutes"],
+                           [(s, f"Dịch vụ {s}", 100000 * (i + 1), 300000 * (i + 1), 30)
+                            for i, s in enumerate(services)])
+        await _insert_many(cursor, "Clinic_Services", ["clinic_id", "service_id"],
+                           [(c, s) for c in clinics for s in rng.sample(services, 3)])
+        await _insert_many(cursor, "Dentist_Services", ["dentist_id", "service_id"],
+                           [(d, s) for d in dentists for s in rng.sample(services, 2)])
+        await _insert_many(cursor, "Clinic_Dentists", ["clinic_id", "dentist_id"],
+                           [(rng.choice(clinics), d) for d in dentists])
+
+        appointments, reviews = [], []
+        for i in range(1, scale * 10 + 1):
+            appointment_id = f"app_{i}"
+            dentist, clinic = rng.choice(dentists), rng.choice(clinics)
+            completed = rng.random() < 0.5
+            appointments.append((appointment_id, rng.choice(customers), dentist, clinic,
+                                 now + timedelta(hours=rng.randint(-2000, 2000)),
+                                 "Completed" if completed else "Pending"))
+            if completed:
+                reviews.append((f"rev_{i}", appointment_id, dentist, clinic, rng.randint(1, 5),
+                                rng.random() < 0.8))
+        await _insert_many(cursor, "Appointments",
+                           ["appointment_id", "customer_id", "dentist_id", "clinic_id",
+                            "appointment_datetime", "status"], appointments)
+        await _insert_many(cursor, "Reviews",
+                           ["review_id", "appointment_id", "dentist_id", "clinic_id", "rating", "is_verified"],
+                           reviews)
+
+    await ratings.recompute_all(conn)
+    await availability.rebuild(conn, now.date())
+
+    async with conn.cursor() as cursor:
+        await cursor.execute("SHOW TABLES")
+        for (table,) in await cursor.fetchall():
+            await cursor.execute(f"ANALYZE TABLE `{table}`")
+            await cursor.fetchall()
+
+
+async def create_database(scale: int = EXPLAIN_SCALE, database: str = EXPLAIN_DATABASE):
+    """Tạo CSDL tạm từ lược đồ + migration + dữ liệu giả; trả về kết nối tới CSDL đó"""
+    conn = await connect(database="mysql")
+    async with conn.cursor() as cursor:
+        for statement in _schema_statements(database):
+            await cursor.execute(statement)
+    await migrate(conn, log=lambda message: None)
+    await seed(conn, scale)
+    return conn
+
+
+# === 3. EXPLAIN ===
+async def explain(conn, sql: str, params: list) -> list[dict]:
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        await cursor.execute("EXPLAIN " + sql, params)
+        return list(await cursor.fetchall())
+
+
+def full_scans(plan: list[dict]) -> list[dict]:
+    """Các bảng thật bị đọc toàn bộ (bỏ qua bảng tạm như <union1,2>, <derived2>)"""
+    return [
+        row for row in plan
+        if row.get("type") in FULL_SCAN_TYPES and not str(row.get("table") or "").startswith("<")
+    ]
+
+
+async def check(conn) -> list[str]:
+    """Trả về danh sách lỗi (rỗng = mọi truy vấn đều dùng index)"""
+    failures = []
+    for name, sql, params, allowed_reason in _queries():
+        scans = full_scans(await explain(conn, sql, params))
+        if not scans:
+            print(f"OK    {name}")
+        elif allowed_reason:
+            print(f"SKIP  {name} (quét toàn bảng có chủ đích: {allowed_reason})")
+        else:
+            detail = ", ".join(f"{row['table']} type={row['type']} key={row.get('key')}" for row in scans)
+            print(f"FAIL  {name}: {detail}")
+            failures.append(f"{name}: {detail}")
+    return failures
+
+
+async def _main(args: list[str]):
+    conn = await create_database()
+    try:
+        failures = await check(conn)
+    finally:
+        if "--keep" not in args:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f"DROP DATABASE IF EXISTS `{EXPLAIN_DATABASE}`")
+        conn.close()
+    if failures:
+        print(f"\n{len(failures)} truy vấn quét toàn bảng:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nMọi truy vấn đều dùng index")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,84 @@
+# File: /services/_shared/http_cache.py
+# Middleware ASGI thêm ngữ nghĩa cache HTTP cho các response GET:
+# - ETag mạnh (strong) = hash nội dung body
+# - Cache-Control theo tiền tố đường dẫn
+# - Trả 304 Not Modified (không body) khi If-None-Match của client khớp ETag
+
+import hashlib
+
+
+def make_etag(body: bytes) -> str:
+    """ETag mạnh: cùng nội dung byte -> cùng ETag"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """So sánh If-None-Match với ETag (so sánh "yếu" theo RFC 9110: bỏ qua tiền tố W/)"""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in if_none_match.split(","))
+
+
+class ETagMiddleware:
+    """
+    rules: danh sách (tiền tố đường dẫn, giá trị Cache-Control), khớp theo thứ tự - quy tắc đầu tiên thắng.
+    Chỉ xử lý GET/HEAD có status 200 và chưa tự đặt Cache-Control.
+    Quy tắc có "no-store" thì không gắn ETag.
+    """
+
+    def __init__(self, app, rules: list[tuple[str, str]]):
+        self.app = app
+        self.rules = rules
+
+    def _cache_control_for(self, path: str) -> str | None:
+        for prefix, value in self.rules:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/") or prefix == "/":
+                return value
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        cache_control = self._cache_control_for(scope["path"])
+        if cache_control is None:
+            return await self.app(scope, receive, send)
+
+        request_headers = dict(scope["headers"])
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        start_message = None
+        body_parts: list[bytes] = []
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = [(k.lower(), v) for k, v in message.get("headers", [])]
+                if message["status"] != 200 or any(k == b"cache-control" for k, _ in headers):
+                    start_message = False  # Không xử lý -> chuyển tiếp nguyên trạng
+                    await send(message)
+                else:
+                    start_message = {**message, "headers": headers}
+                return
+            if start_message is False or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(body_parts)
+            headers = start_message["headers"]
+            headers.append((b"cache-control", cache_control.encode("latin-1")))
+            if "no-store" not in cache_control:
+                etag = make_etag(body)
+                headers.append((b"etag", etag.encode("latin-1")))
+                if if_none_match and etag_matches(if_none_match, etag):
+                    # Client đã có bản mới nhất -> 304, không gửi lại body
+                    headers = [(k, v) for k, v in headers if k not in (b"content-length", b"content-type")]
+                    await send({**start_message, "status": 304, "headers": headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
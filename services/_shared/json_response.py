@@ -0,0 +1,54 @@
+# File: /services/_shared/json_response.py
+# Mã hóa JSON bằng orjson (nhanh hơn json của thư viện chuẩn nhiều lần, trả thẳng bytes).
+# - ORJSONResponse: response mặc định của mọi service (FastAPI(default_response_class=ORJSONResponse))
+# - Handler nóng trả thẳng ORJSONResponse(...) để bỏ qua bước jsonable_encoder của FastAPI
+# - RawJSONResponse: body đã là JSON bytes (VD: lấy từ cache) -> không giải mã / mã hóa lại
+# (API Gateway có bản tương ứng: api-gateway/json_response.py)
+
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from . import metrics
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    """Kiểu orjson không tự mã hóa được; kết quả giống fastapi.encoders.jsonable_encoder"""
+    if isinstance(value, Decimal):
+        # DECIMAL(10, 2) -> float; số nguyên (không có phần thập phân) -> int
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    raise TypeError(f"Không mã hóa JSON được kiểu {type(value).__name__}")
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+loads = orjson.loads
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = dumps(content)
+        metrics.json_render_duration.observe(time.perf_counter() - started)
+        return body
+
+
+class RawJSONResponse(Response):
+    """Body là JSON đã mã hóa sẵn (bytes)"""
+    media_type = "application/json"
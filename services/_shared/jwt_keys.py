@@ -0,0 +1,231 @@
+# File: /services/_shared/jwt_keys.py
+# Khóa ký JWT bất đối xứng (EdDSA/Ed25519 hoặc RS256), có "kid" trong header token.
+# - auth_service giữ khóa bí mật (SigningKeyRing), ký token và công bố khóa công khai qua JWKS
+#   (GET /.well-known/jwks.json)
+# - Service khác và API Gateway chỉ giữ khóa công khai (JWKSCache), tự xác thực token tại chỗ;
+#   JWKS được làm mới định kỳ ở nền, chỉ gọi auth_service khi gặp "kid" lạ
+#
+# Xoay khóa (rotation) có chồng lấn, không làm ai bị đăng xuất:
+#   1. Tạo khóa mới:  python -m services._shared.jwt_keys generate [--alg EdDSA|RS256]
+#      Khóa mới được công bố ngay trong JWKS nhưng chỉ bắt đầu ký sau JWT_KEY_PUBLISH_DELAY giây
+#      (đủ để mọi nơi đã tải JWKS mới)
+#   2. Khóa cũ vẫn nằm trong JWKS nên token cũ còn hợp lệ tới khi hết hạn
+#   3. Sau ACCESS_TOKEN_EXPIRE_MINUTES kể từ lúc khóa cũ ngừng ký: xóa file .pem của khóa cũ
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+logger = logging.getLogger(__name__)
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", os.path.join(_ROOT_DIR, "keys"))
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "EdDSA")          # Thuật toán khi tạo khóa mới
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")                  # Ép dùng 1 khóa (kid hoặc tên file)
+JWT_KEY_PUBLISH_DELAY = float(os.getenv("JWT_KEY_PUBLISH_DELAY", "300"))
+JWT_KEYS_RELOAD_INTERVAL = float(os.getenv("JWT_KEYS_RELOAD_INTERVAL", "60"))
+
+JWKS_URL = os.getenv("JWKS_URL", "http://localhost:8001/.well-known/jwks.json")
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", "300"))
+JWKS_MIN_REFETCH_INTERVAL = float(os.getenv("JWKS_MIN_REFETCH_INTERVAL", "10"))  # Khi gặp kid lạ
+
+
+def _b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def public_jwk(private_key) -> tuple[dict, str]:
+    """Trả về (JWK công khai, thuật toán). kid = JWK thumbprint (RFC 7638) -> mọi instance tính ra giống nhau"""
+    public_key = private_key.public_key()
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        jwk = {"crv": "Ed25519", "kty": "OKP", "x": base64.urlsafe_b64encode(raw).rstrip(b"=").decode()}
+        alg = "EdDSA"
+    elif isinstance(private_key, rsa.RSAPrivateKey):
+        numbers = public_key.public_numbers()
+        jwk = {"e": _b64url_uint(numbers.e), "kty": "RSA", "n": _b64url_uint(numbers.n)}
+        alg = "RS256"
+    else:
+        raise ValueError(f"Loại khóa không hỗ trợ: {type(private_key).__name__}")
+    canonical = json.dumps(jwk, sort_keys=True, separators=(",", ":")).encode()
+    kid = base64.urlsafe_b64encode(hashlib.sha256(canonical).digest()).rstrip(b"=").decode()
+    return {**jwk, "kid": kid, "alg": alg, "use": "sig"}, alg
+
+
+def generate_key_file(directory: str = JWT_KEYS_DIR, alg: str = JWT_ALGORITHM, name: str | None = None) -> str:
+    """Tạo khóa mới và ghi file PEM (quyền 600). Trả về đường dẫn file."""
+    if alg == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif alg == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"Thuật toán không hỗ trợ: {alg}")
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    path = os.path.join(directory, f"{name or time.strftime('%Y%m%d%H%M%S')}.pem")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+        # link() thất bại nếu file đã tồn tại -> nhiều instance khởi động cùng lúc không ghi đè nhau
+        os.link(tmp_path, path)
+    finally:
+        os.unlink(tmp_path)
+    return path
+
+
+# === 1. PHÍA AUTH_SERVICE: KHÓA BÍ MẬT ===
+@dataclass
+class SigningKey:
+    kid: str
+    alg: str
+    private_key: object
+    jwk: dict
+    created_at: float   # mtime của file
+    name: str
+
+
+class SigningKeyRing:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.keys: dict[str, SigningKey] = {}
+        self.loaded_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.keys)
+
+    def load(self):
+        """Đọc mọi file *.pem trong thư mục khóa; thư mục trống thì tạo 1 khóa (tiện cho môi trường dev)"""
+        if not os.path.isdir(self.directory) or not any(
+            name.endswith(".pem") for name in os.listdir(self.directory)
+        ):
+            try:
+                path = generate_key_file(self.directory, name="initial")
+                logger.warning(f"Chưa có khóa ký JWT, đã tạo khóa mới: {path}")
+            except FileExistsError:
+                pass  # Instance khác vừa tạo
+
+        keys = {}
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".pem"):
+                continue
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+            jwk, alg = public_jwk(private_key)
+            keys[jwk["kid"]] = SigningKey(
+                jwk["kid"], alg, private_key, jwk, os.path.getmtime(path), name.removesuffix(".pem")
+            )
+        self.keys = keys
+        self.loaded_at = time.monotonic()
+
+    def _maybe_reload(self):
+        if not self.keys or time.monotonic() - self.loaded_at > JWT_KEYS_RELOAD_INTERVAL:
+            self.load()
+
+    def active(self) -> SigningKey:
+        """Khóa dùng để ký: khóa mới nhất đã được công bố đủ JWT_KEY_PUBLISH_DELAY giây"""
+        self._maybe_reload()
+        if JWT_ACTIVE_KID:
+            for key in self.keys.values():
+                if JWT_ACTIVE_KID in (key.kid, key.name):
+                    return key
+        by_age = sorted(self.keys.values(), key=lambda k: k.created_at, reverse=True)
+        published = [k for k in by_age if time.time() - k.created_at >= JWT_KEY_PUBLISH_DELAY]
+        return (published or by_age)[0]
+
+    def sign(self, claims: dict) -> str:
+        key = self.active()
+        return jwt.encode(claims, key.private_key, algorithm=key.alg, headers={"kid": key.kid})
+
+    def public_key(self, kid: str):
+        """(khóa công khai, thuật toán) hoặc None"""
+        self._maybe_reload()
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.loaded_at > JWKS_MIN_REFETCH_INTERVAL:
+            self.load()  # Có thể instance khác vừa thêm khóa
+            key = self.keys.get(kid)
+        return (key.private_key.public_key(), key.alg) if key else None
+
+    def jwks(self) -> dict:
+        self._maybe_reload()
+        return {"keys": [key.jwk for key in self.keys.values()]}
+
+
+# === 2. PHÍA SERVICE KHÁC: KHÓA CÔNG KHAI (JWKS) ===
+class JWKSCache:
+    def __init__(self, url: str):
+        self.url = url
+        self.keys: dict[str, jwt.PyJWK] = {}
+        self.fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+        self.fetches = 0
+        self.last_error: str | None = None
+
+    def load(self, jwks: dict):
+        keys = {}
+        for data in jwks.get("keys", []):
+            try:
+                keys[data["kid"]] = jwt.PyJWK(data)
+            except (KeyError, jwt.PyJWTError) as e:
+                logger.warning(f"Bỏ qua khóa JWKS không hợp lệ: {e}")
+        self.keys = keys
+        self.fetched_at = time.monotonic()
+
+    async def refresh(self):
+        async with self._lock:
+            self.fetches += 1
+            try:
+                async with httpx.AsyncClient(timeout=2.0) as client:
+                    response = await client.get(self.url)
+                    response.raise_for_status()
+                self.load(response.json())
+                self.last_error = None
+            except Exception as e:
+                self.fetched_at = time.monotonic()  # Tránh dồn request khi auth_service lỗi
+                self.last_error = str(e)
+                logger.warning(f"Không tải được JWKS từ {self.url}: {e}")
+
+    async def public_key(self, kid: str):
+        """(khóa công khai, thuật toán) hoặc None. Chỉ gọi mạng khi JWKS quá cũ hoặc gặp kid lạ."""
+        age = time.monotonic() - self.fetched_at
+        key = self.keys.get(kid)
+        if key is None and age > JWKS_MIN_REFETCH_INTERVAL:
+            await self.refresh()
+            key = self.keys.get(kid)
+        elif age > JWKS_REFRESH_INTERVAL and not self._lock.locked():
+            # Khóa đã có: làm mới ở nền, request hiện tại không phải chờ
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return (key.key, key.algorithm_name) if key else None
+
+
+signing_keys = SigningKeyRing(JWT_KEYS_DIR)
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+if __name__ == "__main__":
+    # python -m services._shared.jwt_keys generate [--alg EdDSA|RS256]
+    args = sys.argv[1:]
+    if not args or args[0] != "generate":
+        print("Cách dùng: python -m services._shared.jwt_keys generate [--alg EdDSA|RS256]")
+        sys.exit(1)
+    alg = args[args.index("--alg") + 1] if "--alg" in args else JWT_ALGORITHM
+    print(generate_key_file(JWT_KEYS_DIR, alg))
@@ -0,0 +1,239 @@
+# File: /services/_shared/mailer.py
+# Gửi email qua SMTP cho các job của outbox (không bao giờ gọi trên đường xử lý request).
+# - smtplib chạy trong thread riêng (không chặn event loop); mỗi thread giữ 1 kết nối SMTP
+#   và dùng lại cho nhiều email liên tiếp (1 lô job = 1 lần bắt tay SMTP)
+# - Message-ID sinh từ idempotency key của job -> job chạy lại vẫn cùng Message-ID, bên nhận tự bỏ trùng
+# - SMTP_HOST rỗng (mặc định): chỉ ghi log (môi trường dev không có máy chủ mail)
+#
+# Máy chủ SMTP giả để chạy thử ở máy (ghi mỗi email thành 1 file .eml):
+#   python -m services._shared.mailer serve        # lắng nghe localhost:SMTP_PORT (mặc định 1025)
+#   SMTP_HOST=localhost python -m services.auth_service.main   # auth_service gửi vào máy chủ giả
+
+import asyncio
+import hashlib
+import logging
+import os
+import smtplib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from email.utils import formatdate
+
+from pydantic_settings import BaseSettings
+
+logger = logging.getLogger(__name__)
+
+
+# === 0. CẤU HÌNH (đọc từ .env giống services/_shared/db.py: có mật khẩu SMTP) ===
+class MailSettings(BaseSettings):
+    SMTP_HOST: str = ""                  # Rỗng: chỉ ghi log, không gửi (dev)
+    SMTP_PORT: int = 1025
+    SMTP_USER: str = ""
+    SMTP_PASSWORD: str = ""
+    SMTP_STARTTLS: bool = False
+    SMTP_TIMEOUT: float = 10.0           # (giây)
+    SMTP_CONNECTIONS: int = 2            # Số kết nối (thread) gửi song song
+    SMTP_FROM: str = "FindMyDentist <no-reply@findmydentist.local>"
+    class Config:
+        env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')
+        extra = "ignore"
+
+mail_settings = MailSettings()
+
+SMTP_IDLE_SECONDS = 30.0  # Kết nối rảnh lâu hơn mức này được mở lại (máy chủ thường tự ngắt)
+
+MAILER_STANDIN_DIR = os.getenv("MAILER_STANDIN_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "mail_outbox",
+))
+
+
+# Lỗi không thể thành công dù thử lại (địa chỉ bị từ chối...) -> job chuyển thẳng sang DEAD
+class PermanentDeliveryError(Exception):
+    pass
+
+
+def build_message(to: str, subject: str, body: str, idempotency_key: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = mail_settings.SMTP_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message["Date"] = formatdate(localtime=True)
+    digest = hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()[:32]
+    message["Message-ID"] = f"<{digest}@findmydentist.local>"
+    message.set_content(body)
+    return message
+
+
+# === 1. GỬI EMAIL ===
+
+class Mailer:
+    def __init__(self):
+        self._executor: ThreadPoolExecutor | None = None
+        self._local = threading.local()  # Kết nối SMTP của từng thread
+        self._connections: list[smtplib.SMTP] = []  # Mọi kết nối đang mở (để đóng hết khi tắt)
+        self._connections_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def _connection(self) -> smtplib.SMTP:
+        smtp, last_used = getattr(self._local, "smtp", None), getattr(self._local, "last_used", 0.0)
+        if smtp is not None and time.monotonic() - last_used > SMTP_IDLE_SECONDS:
+            self._close_local()
+            smtp = None
+        if smtp is None:
+            smtp = smtplib.SMTP(mail_settings.SMTP_HOST, mail_settings.SMTP_PORT, timeout=mail_settings.SMTP_TIMEOUT)
+            # Ghi nhận trước STARTTLS/login: bước này lỗi thì _send_blocking vẫn đóng được kết nối
+            with self._connections_lock:
+                self._connections.append(smtp)
+            self._local.smtp = smtp
+            if mail_settings.SMTP_STARTTLS:
+                smtp.starttls()
+            if mail_settings.SMTP_USER:
+                smtp.login(mail_settings.SMTP_USER, mail_settings.SMTP_PASSWORD)
+        return smtp
+
+    def _close_local(self):
+        smtp = getattr(self._local, "smtp", None)
+        self._local.smtp = None
+        if smtp is not None:
+            self._close(smtp)
+
+    def _close(self, smtp: smtplib.SMTP):
+        with self._connections_lock:
+            if smtp not in self._connections:
+                return  # Đã đóng
+            self._connections.remove(smtp)
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def _send_blocking(self, message: EmailMessage):
+        try:
+            self._connection().send_message(message)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentDeliveryError(f"Địa chỉ bị từ chối: {list(e.recipients)}") from e
+        except (smtplib.SMTPException, OSError):
+            # Kết nối hỏng -> bỏ, lần sau mở lại (outbox sẽ thử lại job)
+            self._close_local()
+            raise
+        self._local.last_used = time.monotonic()
+
+    async def send(self, message: EmailMessage):
+        if not mail_settings.SMTP_HOST:
+            logger.info(f"[mail] (SMTP_HOST rỗng, không gửi) tới {message['To']}: {message['Subject']}")
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=mail_settings.SMTP_CONNECTIONS, thread_name_prefix="smtp")
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._send_blocking, message)
+        except Exception:
+            self.failed += 1
+            raise
+        self.sent += 1
+
+    async def shutdown(self):
+        """Chờ email đang gửi xong rồi đóng mọi kết nối SMTP (trong thread, không chặn event loop)"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(self._shutdown_blocking, executor)
+
+    def _shutdown_blocking(self, executor: ThreadPoolExecutor):
+        executor.shutdown(wait=True)
+        # Các thread gửi đã dừng -> đóng từ đây, không cần đúng thread đã mở kết nối
+        with self._connections_lock:
+            connections = list(self._connections)
+        for smtp in connections:
+            self._close(smtp)
+
+    def stats(self) -> dict:
+        return {"host": mail_settings.SMTP_HOST or None, "port": mail_settings.SMTP_PORT, "sent": self.sent, "failed": self.failed}
+
+
+mailer = Mailer()
+
+
+# === 2. MÁY CHỦ SMTP GIẢ (CHẠY THỬ Ở MÁY) ===
+
+class StandInSMTP:
+    """
+    Đủ lệnh SMTP cho smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT).
+    Mỗi email ghi ra MAILER_STANDIN_DIR/<thời gian>-<n>.eml; reject: tập địa chỉ luôn bị từ chối (để thử DEAD).
+    """
+
+    def __init__(self, directory: str = MAILER_STANDIN_DIR, reject: set[str] | None = None):
+        self.directory = directory
+        self.reject = reject or set()
+        self.received: list[bytes] = []
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write(line.encode("ascii") + b"\r\n")
+            await writer.drain()
+
+        await reply("220 findmydentist-standin ESMTP")
+        recipients: list[str] = []
+        try:
+            while line := await reader.readline():
+                command = line.decode("latin-1").strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    await reply("250-findmydentist-standin\r\n250 8BITMIME" if verb == "EHLO" else "250 OK")
+                elif verb == "MAIL":
+                    recipients = []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    address = command.partition(":")[2].strip().strip("<>")
+                    if address in self.reject:
+                        await reply("550 Mailbox unavailable")
+                    else:
+                        recipients.append(address)
+                        await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while (data := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        lines.append(data[1:] if data.startswith(b"..") else data)
+                    self._store(b"".join(lines))
+                    await reply("250 OK")
+                elif verb == "RSET":
+                    recipients = []
+                    await reply("250 OK")
+                elif verb == "NOOP":
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+    def _store(self, data: bytes):
+        self.received.append(data)
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{len(self.received)}.eml"
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(data)
+        subject = next((line for line in data.decode("utf-8", "replace").splitlines() if line.startswith("Subject:")), "")
+        print(f"Nhận email -> {name} {subject}", flush=True)
+
+    async def serve(self, host: str, port: int):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def _serve_forever():
+    server = await StandInSMTP().serve(mail_settings.SMTP_HOST or "localhost", mail_settings.SMTP_PORT)
+    print(f"Máy chủ SMTP giả tại {mail_settings.SMTP_HOST or 'localhost'}:{mail_settings.SMTP_PORT}, email lưu ở {MAILER_STANDIN_DIR}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["serve"]:
+        sys.exit("Cách dùng: python -m services._shared.mailer serve")
+    asyncio.run(_serve_forever())
@@ -0,0 +1,287 @@
+# File: /services/_shared/metrics.py
+# Đo đạc trên đường nóng của service, xuất định dạng Prometheus (text 0.0.4) tại GET /metrics:
+# - http_request_duration_seconds{method, route, status}: route là mẫu đường dẫn (VD: /dentists/{dentist_id})
+#   chứ không phải đường dẫn thật -> số chuỗi nhãn có giới hạn
+# - db_acquire_duration_seconds: thời gian chờ mượn kết nối (get_db_connection / acquire_connection)
+# - db_query_duration_seconds{statement} + db_query_rows_total{statement}: mọi cursor.execute,
+#   statement = lệnh + bảng chính (VD: "SELECT Clinics"); truy vấn chậm hơn METRICS_SLOW_QUERY_MS được ghi log
+# - bcrypt_duration_seconds{phase}: thời gian xếp hàng (queue) và thời gian hash (hash)
+# - json_render_seconds: thời gian mã hóa body JSON
+# - Mã request (X-Request-ID) nhận từ API Gateway (hoặc tự tạo), trả lại trong response, ghi kèm log truy vấn chậm
+# Không dùng thư viện ngoài; mỗi lần ghi chỉ là vài phép cộng trên event loop (không cần khóa)
+# -> đủ rẻ để luôn bật ở production (tắt bằng METRICS_ENABLED=0).
+# (API Gateway có bản tương ứng: api-gateway/metrics.py)
+
+import logging
+import os
+import re
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_SLOW_QUERY_MS = float(os.getenv("METRICS_SLOW_QUERY_MS", "500"))
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._\-]{1,64}$")
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+# === 1. CÁC LOẠI METRIC ===
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # nhãn -> [số mẫu theo từng bucket..., số mẫu > bucket cuối, tổng]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class GaugeFunc:
+    """
+    Giá trị đọc lúc xuất (VD: số liệu pool kết nối) -> không tốn gì trên đường nóng.
+    kind="counter" cho bộ đếm tăng dần đã có sẵn ở nơi khác.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...], fn, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.fn = fn  # () -> {nhãn: giá trị}
+        self.kind = kind
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.fn().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request (tới khi gửi xong body)", ("method", "route", "status"),
+))
+db_acquire_duration = registry.register(Histogram(
+    "db_acquire_duration_seconds", "Thời gian chờ mượn kết nối từ pool CSDL", buckets=FAST_BUCKETS,
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Thời gian thực thi truy vấn (cursor.execute)", ("statement",),
+))
+db_query_rows = registry.register(Counter(
+    "db_query_rows_total", "Số dòng trả về / bị ảnh hưởng", ("statement",),
+))
+bcrypt_duration = registry.register(Histogram(
+    "bcrypt_duration_seconds", "Thời gian bcrypt: xếp hàng (queue) và hash/verify (hash)", ("phase",),
+))
+json_render_duration = registry.register(Histogram(
+    "json_render_seconds", "Thời gian mã hóa body JSON", buckets=FAST_BUCKETS,
+))
+
+
+def metrics_response() -> Response:
+    """Endpoint GET /metrics (định dạng text của Prometheus)"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# === 2. TRUY VẤN CSDL ===
+
+_VERB_TABLE_RE = re.compile(r"^\s*(INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)", re.IGNORECASE)
+_FROM_TABLE_RE = re.compile(r"\bFROM\s+`?(\w+)", re.IGNORECASE)
+_statements: dict[str, str] = {}
+_MAX_STATEMENTS = 2000  # SQL sinh động (VD: danh sách IN) -> giới hạn cache
+
+
+def statement_name(sql: str) -> str:
+    """'SELECT ... FROM Clinics c JOIN ...' -> 'SELECT Clinics' (nhãn có số lượng giới hạn)"""
+    name = _statements.get(sql)
+    if name is not None:
+        return name
+    match = _VERB_TABLE_RE.match(sql)
+    if match:
+        name = f"{match.group(1).split()[0].upper()} {match.group(2)}"
+    else:
+        words = sql.lstrip(" \t\r\n(").split(None, 1)
+        verb = words[0].upper() if words else "OTHER"
+        table = _FROM_TABLE_RE.search(sql)
+        name = f"{verb} {table.group(1)}" if table else verb
+    if len(_statements) < _MAX_STATEMENTS:
+        _statements[sql] = name
+    return name
+
+
+def record_query(sql: str, elapsed: float, rows: int):
+    name = statement_name(sql)
+    db_query_duration.observe(elapsed, (name,))
+    if rows > 0:
+        db_query_rows.inc(rows, (name,))
+    if elapsed * 1000 >= METRICS_SLOW_QUERY_MS:
+        logger.warning(f"Truy vấn chậm {elapsed * 1000:.0f}ms [{request_id_var.get() or '-'}] {name}: {sql[:200]}")
+
+
+class _TimedCursorMixin:
+    async def execute(self, query, args=None):
+        # executemany của aiomysql cũng gọi execute -> được đo theo từng lô
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+
+_timed_cursor_classes: dict[tuple, type] = {}
+
+
+def _timed_cursor_class(cursors: tuple) -> type:
+    cls = _timed_cursor_classes.get(cursors)
+    if cls is None:
+        name = "Timed" + "".join(cursor.__name__ for cursor in cursors)
+        cls = _timed_cursor_classes[cursors] = type(name, (_TimedCursorMixin, *cursors), {})
+    return cls
+
+
+class TimedConnection:
+    """
+    Bọc kết nối aiomysql: mọi cursor tạo ra (kể cả conn.cursor(aiomysql.DictCursor)) đều được đo thời gian.
+    Các thuộc tính / phương thức khác (begin, commit, rollback...) chuyển thẳng cho kết nối gốc.
+    """
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *cursors):
+        return self._conn.cursor(_timed_cursor_class(cursors or (self._conn.cursorclass,)))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrument_connection(conn):
+    return TimedConnection(conn) if METRICS_ENABLED else conn
+
+
+# === 3. MIDDLEWARE: THỜI GIAN REQUEST + MÃ REQUEST ===
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class MetricsMiddleware:
+    """
+    Đặt ngoài cùng (add_middleware sau cùng) để đo cả thời gian của các middleware khác.
+    Nhận X-Request-ID từ gateway (chỉ chấp nhận ký tự an toàn), tự tạo nếu thiếu, gắn vào response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _REQUEST_ID_RE.match(request_id):
+            request_id = new_request_id()
+        token = request_id_var.set(request_id)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))],
+                }
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if METRICS_ENABLED:
+                # Router ghi route đã khớp vào scope -> dùng mẫu đường dẫn làm nhãn
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                http_request_duration.observe(time.perf_counter() - started, (scope["method"], route, str(status_code)))
+            request_id_var.reset(token)
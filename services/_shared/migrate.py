@@ -0,0 +1,135 @@
+# File: /services/_shared/migrate.py
+# Migration có đánh số phiên bản cho CSDL.
+# - FindmyDentist.sql là lược đồ gốc (phiên bản 0); các thay đổi sau đó nằm trong migrations/NNNN_<tên>.sql
+# - Bảng Schema_Migrations ghi lại phiên bản đã áp dụng (kèm checksum để phát hiện file bị sửa sau khi chạy)
+#
+# Cách dùng (từ thư mục gốc của repo, đọc cấu hình CSDL từ .env):
+#   python -m services._shared.migrate           # Áp dụng các migration chưa chạy
+#   python -m services._shared.migrate status    # Xem trạng thái
+
+import asyncio
+import hashlib
+import os
+import re
+import sys
+
+import aiomysql
+
+from .db import settings
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, "migrations")
+
+_FILE_PATTERN = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+
+_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS `Schema_Migrations` (
+  `version` VARCHAR(10) PRIMARY KEY,
+  `name` VARCHAR(255) NOT NULL,
+  `checksum` CHAR(64) NOT NULL,
+  `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def split_statements(sql: str) -> list[str]:
+    """Tách file .sql thành từng câu lệnh (bỏ comment '--', câu kết thúc bằng ';' ở cuối dòng)"""
+    statements, current = [], []
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("--"):
+            continue
+        current.append(line)
+        if stripped.endswith(";") or re.search(r";\s*--.*$", stripped):
+            statement = "\n".join(current).strip()
+            statements.append(statement[: statement.rindex(";")])
+            current = []
+    if current:
+        statements.append("\n".join(current).strip())
+    return statements
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> list[tuple[str, str, str, str]]:
+    """Danh sách (phiên bản, tên, checksum, nội dung) theo thứ tự phiên bản"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append((match.group(1), match.group(2), hashlib.sha256(sql.encode()).hexdigest(), sql))
+    return migrations
+
+
+async def connect(database: str | None = None) -> aiomysql.Connection:
+    return await aiomysql.connect(
+        host=settings.DB_HOST,
+        port=settings.DB_PORT,
+        user=settings.DB_USER,
+        password=settings.DB_PASSWORD,
+        db=database or settings.DB_DATABASE,
+        autocommit=True,
+    )
+
+
+async def applied_versions(conn) -> dict[str, str]:
+    async with conn.cursor() as cursor:
+        await cursor.execute(_CREATE_TABLE_SQL)
+        await cursor.execute("SELECT version, checksum FROM Schema_Migrations")
+        return {version: checksum for version, checksum in await cursor.fetchall()}
+
+
+async def migrate(conn, directory: str = MIGRATIONS_DIR, log=print) -> int:
+    """Áp dụng các migration chưa chạy, trả về số migration đã áp dụng"""
+    applied = await applied_versions(conn)
+    count = 0
+    for version, name, checksum, sql in load_migrations(directory):
+        if version in applied:
+            if applied[version] != checksum:
+                log(f"CẢNH BÁO: {version}_{name}.sql đã bị sửa sau khi áp dụng")
+            continue
+        log(f"Áp dụng {version}_{name}.sql")
+        # DDL của MySQL tự commit -> không gói được trong transaction; chỉ ghi phiên bản khi chạy xong
+        async with conn.cursor() as cursor:
+            for statement in split_statements(sql):
+                await cursor.execute(statement)
+            await cursor.execute(
+                "INSERT INTO Schema_Migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (version, name, checksum),
+            )
+        count += 1
+    return count
+
+
+async def status(conn, directory: str = MIGRATIONS_DIR) -> list[dict]:
+    applied = await applied_versions(conn)
+    return [
+        {
+            "version": version,
+            "name": name,
+            "applied": version in applied,
+            "modified": version in applied and applied[version] != checksum,
+        }
+        for version, name, checksum, _ in load_migrations(directory)
+    ]
+
+
+async def _main(args: list[str]):
+    conn = await connect()
+    try:
+        if args and args[0] == "status":
+            for item in await status(conn):
+                state = "đã áp dụng" if item["applied"] else "CHƯA áp dụng"
+                if item["modified"]:
+                    state += " (file đã bị sửa!)"
+                print(f"{item['version']}_{item['name']}: {state}")
+        else:
+            count = await migrate(conn)
+            print(f"Đã áp dụng {count} migration")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,315 @@
+# File: /services/_shared/outbox.py
+# Hàng đợi job nền theo mô hình transactional outbox (bảng Outbox_Jobs, migrations/0005_outbox.sql):
+# - Handler của API gọi enqueue(cursor, ...) trong CÙNG transaction với thay đổi dữ liệu
+#   -> request chỉ tốn thêm 1 câu INSERT; việc gửi email... không nằm trên đường xử lý request
+# - OutboxWorker (tác vụ nền của service) lấy job đến hạn theo lô (UPDATE ... LIMIT rồi đọc lại theo mã lô),
+#   chạy song song trong lô, ghi kết quả theo lô. Nhiều tiến trình / instance cùng chạy vẫn không lấy trùng.
+# - Lỗi: thử lại sau khoảng chờ tăng dần (ngẫu nhiên), quá OUTBOX_MAX_ATTEMPTS lần hoặc lỗi vĩnh viễn -> DEAD
+# - Worker chết giữa chừng: job RUNNING hết hạn thuê (OUTBOX_LEASE_SECONDS) thì được lấy lại
+#   -> giao ít nhất 1 lần; handler dùng idempotency key để bên nhận bỏ bản trùng
+#
+# Cách dùng (từ thư mục gốc của repo):
+#   python -m services._shared.outbox status              # Số job theo trạng thái + các job DEAD
+#   python -m services._shared.outbox retry-dead [job_id...]  # Chạy lại job DEAD còn payload (mặc định: tất cả)
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import sys
+import time
+import uuid
+
+from . import metrics
+from .db import acquire_connection
+from .json_response import dumps, loads
+from .migrate import connect
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "1") == "1"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))      # (giây) khi không có job
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))     # Job RUNNING quá hạn -> lấy lại
+OUTBOX_JOB_TIMEOUT = float(os.getenv("OUTBOX_JOB_TIMEOUT", "30"))         # Phải nhỏ hơn OUTBOX_LEASE_SECONDS
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))        # (giây)
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))        # (giây)
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))  # Job DONE giữ lại bao lâu
+OUTBOX_PRUNE_INTERVAL = 600.0
+
+job_runs = metrics.registry.register(metrics.Counter(
+    "outbox_jobs_total", "Số lần chạy job của outbox theo kết quả (done / retry / dead)", ("kind", "result"),
+))
+job_duration = metrics.registry.register(metrics.Histogram(
+    "outbox_job_duration_seconds", "Thời gian chạy 1 job (VD: gửi 1 email)", ("kind",),
+))
+
+
+# Handler ném lỗi này khi thử lại cũng vô ích (VD: địa chỉ email bị từ chối) -> DEAD ngay
+class PermanentJobError(Exception):
+    pass
+
+
+# === 1. GHI JOB (TRONG TRANSACTION CỦA REQUEST) ===
+# Trùng idempotency_key -> giữ job cũ (request bị gửi lại không tạo thêm email)
+_INSERT_SQL = """
+    INSERT INTO Outbox_Jobs (kind, idempotency_key, payload, available_at)
+    VALUES (%s, %s, %s, NOW(3) + INTERVAL %s MICROSECOND)
+    ON DUPLICATE KEY UPDATE job_id = job_id
+"""
+
+
+async def enqueue(cursor, kind: str, payload: dict, key: str, delay: float = 0.0):
+    """Gọi giữa conn.begin() và conn.commit() của handler, dùng cursor của cùng kết nối"""
+    await cursor.execute(_INSERT_SQL, (kind, key, dumps(payload).decode("utf-8"), int(delay * 1_000_000)))
+
+
+_handlers: dict = {}
+
+
+_keep_dead_payload: set[str] = set()
+
+
+def handler(kind: str, keep_payload_on_dead: bool = False):
+    """
+    Đăng ký hàm xử lý: async def fn(payload: dict, key: str) -> None
+    Worker của mỗi service chỉ lấy các loại job mà service đó đã đăng ký.
+    Job DEAD bị xóa payload (có thể chứa OTP...) trừ khi keep_payload_on_dead=True (để retry-dead chạy lại được).
+    """
+    def register(fn):
+        _handlers[kind] = fn
+        if keep_payload_on_dead:
+            _keep_dead_payload.add(kind)
+        return fn
+    return register
+
+
+# === 2. LẤY JOB THEO LÔ ===
+def _claim_sql(kinds: int) -> str:
+    # Job RUNNING có available_at = hạn thuê -> cùng 1 điều kiện cho job mới và job của worker đã chết
+    return f"""
+        UPDATE Outbox_Jobs
+        SET status = 'RUNNING', locked_by = %s, attempts = attempts + 1,
+            available_at = NOW(3) + INTERVAL %s MICROSECOND
+        WHERE status IN ('PENDING', 'RUNNING') AND available_at <= NOW(3)
+          AND kind IN ({', '.join(['%s'] * kinds)})
+        ORDER BY available_at
+        LIMIT %s
+    """
+
+
+_SELECT_CLAIMED_SQL = """
+    SELECT job_id, kind, idempotency_key, payload, attempts
+    FROM Outbox_Jobs WHERE locked_by = %s AND status = 'RUNNING'
+"""
+
+_RETRY_SQL = """
+    UPDATE Outbox_Jobs
+    SET status = %s, available_at = NOW(3) + INTERVAL %s MICROSECOND, last_error = %s, locked_by = NULL,
+        payload = IF(%s, NULL, payload)
+    WHERE job_id = %s AND locked_by = %s
+"""
+
+_PRUNE_SQL = """
+    DELETE FROM Outbox_Jobs
+    WHERE status = 'DONE' AND available_at < NOW(3) - INTERVAL %s SECOND
+    LIMIT 1000
+"""
+
+
+def _done_sql(count: int) -> str:
+    # available_at của job DONE = thời điểm xong (dùng để dọn theo OUTBOX_RETENTION_HOURS)
+    return f"""
+        UPDATE Outbox_Jobs
+        SET status = 'DONE', payload = NULL, last_error = NULL, locked_by = NULL,
+            available_at = NOW(3), completed_at = NOW(3)
+        WHERE locked_by = %s AND job_id IN ({', '.join(['%s'] * count)})
+    """
+
+
+def backoff(attempts: int) -> float:
+    # Ngẫu nhiên như khi gateway thử lại (upstream.py) nhưng không dưới base/2: [base/2, min(max, base * 2^(n-1))]
+    ceiling = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return random.uniform(min(OUTBOX_BACKOFF_BASE / 2, ceiling), ceiling)
+
+
+class OutboxWorker:
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._last_prune = 0.0
+        self.worker_id = f"{socket.gethostname()[:30]}:{os.getpid()}"
+        self.batches = 0
+        self.done = 0
+        self.retried = 0
+        self.dead = 0
+        self.last_error: str | None = None
+
+    def notify(self):
+        """Gọi sau khi commit: worker trong process này lấy job ngay thay vì chờ lượt poll"""
+        self._wake.set()
+
+    async def _claim(self) -> tuple[str, list]:
+        batch_id = f"{self.worker_id}:{uuid.uuid4().hex[:12]}"
+        kinds = sorted(_handlers)
+        async with acquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                claimed = await cursor.execute(
+                    _claim_sql(len(kinds)),
+                    (batch_id, int(OUTBOX_LEASE_SECONDS * 1_000_000), *kinds, OUTBOX_BATCH_SIZE),
+                )
+                if not claimed:
+                    return batch_id, []
+                await cursor.execute(_SELECT_CLAIMED_SQL, (batch_id,))
+                return batch_id, list(await cursor.fetchall())
+
+    async def _run_job(self, job) -> tuple[str | None, bool]:
+        """(lỗi hoặc None, lỗi vĩnh viễn?)"""
+        job_id, kind, key, payload, attempts = job
+        fn = _handlers.get(kind)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(fn(loads(payload) if payload else {}, key), OUTBOX_JOB_TIMEOUT)
+            return None, False
+        except PermanentJobError as e:
+            return f"{type(e).__name__}: {e}", True
+        except asyncio.TimeoutError:
+            return f"Quá {OUTBOX_JOB_TIMEOUT:g}s", False
+        except Exception as e:
+            return f"{type(e).__name__}: {e}", False
+        finally:
+            job_duration.observe(time.perf_counter() - started, (kind,))
+
+    async def run_batch(self) -> int:
+        """Lấy + chạy 1 lô; trả về số job đã lấy (không giữ kết nối CSDL trong lúc chạy job)"""
+        if not _handlers:
+            return 0
+        batch_id, jobs = await self._claim()
+        if not jobs:
+            return 0
+        self.batches += 1
+        results = await asyncio.gather(*(self._run_job(job) for job in jobs))
+
+        done = [job[0] for job, (error, _) in zip(jobs, results) if error is None]
+        async with acquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                if done:
+                    await cursor.execute(_done_sql(len(done)), (batch_id, *done))
+                for job, (error, permanent) in zip(jobs, results):
+                    if error is None:
+                        job_runs.inc(1, (job[1], "done"))
+                        continue
+                    job_id, kind, _, _, attempts = job
+                    if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+                        status, delay, result = "DEAD", 0.0, "dead"
+                        logger.error(f"Job {job_id} ({kind}) -> DEAD sau {attempts} lần: {error}")
+                    else:
+                        status, delay, result = "PENDING", backoff(attempts), "retry"
+                        logger.warning(f"Job {job_id} ({kind}) lỗi lần {attempts}, thử lại sau {delay:.1f}s: {error}")
+                    clear_payload = status == "DEAD" and kind not in _keep_dead_payload
+                    await cursor.execute(_RETRY_SQL, (status, int(delay * 1_000_000), error[:2000],
+                                                      clear_payload, job_id, batch_id))
+                    job_runs.inc(1, (kind, result))
+                    if result == "dead":
+                        self.dead += 1
+                    else:
+                        self.retried += 1
+        self.done += len(done)
+        return len(jobs)
+
+    async def prune(self):
+        async with acquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(_PRUNE_SQL, (int(OUTBOX_RETENTION_HOURS * 3600),))
+
+    async def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            claimed = 0
+            try:
+                claimed = await self.run_batch()
+                if time.monotonic() - self._last_prune > OUTBOX_PRUNE_INTERVAL:
+                    self._last_prune = time.monotonic()
+                    await self.prune()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Outbox: không lấy / ghi được job: {e}")
+            if claimed >= OUTBOX_BATCH_SIZE:
+                continue  # Còn job đến hạn -> lấy lô tiếp ngay
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None and OUTBOX_WORKER_ENABLED and _handlers:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cho lô đang chạy xong (tối đa OUTBOX_JOB_TIMEOUT); job bị cắt ngang sẽ được lấy lại khi hết hạn thuê"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, OUTBOX_JOB_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "kinds": sorted(_handlers),
+            "batches": self.batches,
+            "done": self.done,
+            "retried": self.retried,
+            "dead": self.dead,
+            "last_error": self.last_error,
+        }
+
+
+outbox_worker = OutboxWorker()
+
+
+# === 3. DÒNG LỆNH ===
+async def queue_counts(conn) -> dict:
+    async with conn.cursor() as cursor:
+        await cursor.execute("SELECT status, COUNT(*) FROM Outbox_Jobs GROUP BY status")
+        return {status: count for status, count in await cursor.fetchall()}
+
+
+async def _main(args: list[str]):
+    conn = await connect()
+    try:
+        async with conn.cursor() as cursor:
+            if args and args[0] == "retry-dead":
+                ids = [int(job_id) for job_id in args[1:]]
+                where = f" AND job_id IN ({', '.join(['%s'] * len(ids))})" if ids else ""
+                count = await cursor.execute(
+                    "UPDATE Outbox_Jobs SET status = 'PENDING', attempts = 0, available_at = NOW(3), "
+                    "locked_by = NULL WHERE status = 'DEAD' AND payload IS NOT NULL" + where, ids,
+                )
+                print(f"Đã đưa {count} job DEAD về hàng đợi (job đã xóa payload không chạy lại được)")
+                return
+            print(await queue_counts(conn))
+            await cursor.execute(
+                "SELECT job_id, kind, attempts, payload IS NOT NULL, last_error FROM Outbox_Jobs "
+                "WHERE status = 'DEAD' ORDER BY job_id DESC LIMIT 50"
+            )
+            for job_id, kind, attempts, retryable, error in await cursor.fetchall():
+                note = "" if retryable else ", đã xóa payload"
+                print(f"DEAD {job_id} {kind} ({attempts} lần{note}): {error}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,154 @@
+# File: /services/_shared/ratings.py
+# Điểm đánh giá của phòng khám / nha sĩ được duy trì tăng dần (incremental), không GROUP BY Reviews lúc đọc:
+# - Mỗi phòng khám / nha sĩ lưu rating_count, rating_sum (chỉ tính review đã xác minh),
+#   average_rating = sum / count và rating_score = điểm Bayes (làm mượt)
+# - Nơi nào ghi vào Reviews (thêm / xác minh / sửa / xóa) gọi review_changed() TRONG CÙNG transaction
+# - recompute_all(): tính lại toàn bộ theo lô (backfill, đổi RATING_PRIOR_*, sửa dữ liệu bằng tay)
+#     python -m services._shared.ratings recompute
+#
+# Điểm Bayes: score = (C * m + sum) / (C + count), với m = RATING_PRIOR_MEAN, C = RATING_PRIOR_WEIGHT.
+# Phòng khám ít review bị kéo về m, nên 1 review 5 sao không xếp trên 200 review trung bình 4.8.
+
+import asyncio
+import os
+import sys
+from decimal import Decimal, ROUND_HALF_UP
+
+RATING_PRIOR_MEAN = float(os.getenv("RATING_PRIOR_MEAN", "3.5"))
+RATING_PRIOR_WEIGHT = float(os.getenv("RATING_PRIOR_WEIGHT", "5"))
+RECOMPUTE_BATCH_SIZE = int(os.getenv("RATING_RECOMPUTE_BATCH_SIZE", "500"))
+
+# Bảng đích: (bảng, cột khóa, cột trong Reviews, cột tổng số review hiển thị nếu có)
+_TARGETS = {
+    "clinic": ("Clinics", "clinic_id", "clinic_id", "total_reviews"),
+    "dentist": ("Dentists", "user_id", "dentist_id", None),
+}
+
+
+def bayesian_score(count: int, total: int) -> Decimal:
+    """Cùng công thức với câu UPDATE bên dưới, làm tròn theo cột DECIMAL(5,4)"""
+    score = (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + total) / (RATING_PRIOR_WEIGHT + count)
+    return Decimal(str(score)).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+
+
+def _contribution(review: dict | None) -> tuple[int, int]:
+    """(số review, tổng điểm) mà 1 review đóng góp vào aggregate"""
+    if not review or not review.get("is_verified"):
+        return 0, 0
+    return 1, int(review["rating"])
+
+
+async def _apply_delta(cursor, kind: str, target_id: str, count_delta: int, sum_delta: int):
+    table, key_column, _, total_column = _TARGETS[kind]
+    # MySQL/MariaDB gán giá trị từ trái sang phải trong UPDATE 1 bảng: các biểu thức phía sau
+    # dùng rating_count / rating_sum ĐÃ cập nhật -> 1 câu lệnh, nguyên tử, không cần đọc trước
+    total_assignment = f"{total_column} = rating_count, " if total_column else ""
+    await cursor.execute(
+        f"""
+        UPDATE {table} SET
+            rating_count = GREATEST(rating_count + %s, 0),
+            rating_sum = GREATEST(rating_sum + %s, 0),
+            {total_assignment}
+            average_rating = IF(rating_count > 0, rating_sum / rating_count, 0),
+            rating_score = (%s * %s + rating_sum) / (%s + rating_count)
+        WHERE {key_column} = %s
+        """,
+        (count_delta, sum_delta, RATING_PRIOR_WEIGHT, RATING_PRIOR_MEAN, RATING_PRIOR_WEIGHT, target_id),
+    )
+
+
+async def review_changed(conn, before: dict | None, after: dict | None):
+    """
+    Cập nhật aggregate sau khi 1 review thay đổi. before / after: dòng Reviews trước / sau khi ghi
+    (cần clinic_id, dentist_id, rating, is_verified), None nếu là thêm mới / xóa.
+      - Thêm:      review_changed(conn, None, review)
+      - Xác minh:  review_changed(conn, {**review, "is_verified": False}, {**review, "is_verified": True})
+      - Xóa:       review_changed(conn, review, None)
+    Gọi trong cùng transaction với câu lệnh ghi Reviews để aggregate không bao giờ lệch.
+    """
+    old_count, old_sum = _contribution(before)
+    new_count, new_sum = _contribution(after)
+    async with conn.cursor() as cursor:
+        for kind, (_, _, review_column, _) in _TARGETS.items():
+            old_id = before.get(review_column) if before else None
+            new_id = after.get(review_column) if after else None
+            if old_id == new_id:
+                if old_id and (new_count - old_count or new_sum - old_sum):
+                    await _apply_delta(cursor, kind, old_id, new_count - old_count, new_sum - old_sum)
+                continue
+            # Review bị chuyển sang phòng khám / nha sĩ khác
+            if old_id and old_count:
+                await _apply_delta(cursor, kind, old_id, -old_count, -old_sum)
+            if new_id and new_count:
+                await _apply_delta(cursor, kind, new_id, new_count, new_sum)
+
+
+# === TÍNH LẠI TOÀN BỘ (BACKFILL) ===
+async def recompute(conn, kind: str, batch_size: int = RECOMPUTE_BATCH_SIZE) -> int:
+    """
+    Tính lại aggregate của 1 loại (clinic / dentist) theo từng lô khóa chính (keyset),
+    mỗi lô 1 transaction ngắn để không khóa cả bảng. Trả về số dòng đã xử lý.
+    """
+    table, key_column, review_column, total_column = _TARGETS[kind]
+    processed, last_id = 0, ""
+    while True:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"SELECT {key_column} FROM {table} WHERE {key_column} > %s ORDER BY {key_column} LIMIT %s",
+                (last_id, batch_size),
+            )
+            ids = [row[0] for row in await cursor.fetchall()]
+            if not ids:
+                return processed
+            placeholders = ", ".join(["%s"] * len(ids))
+            # Dùng index (<cột>, is_verified, rating) -> chỉ đọc index, không đọc bảng Reviews
+            await cursor.execute(
+                f"SELECT {review_column}, COUNT(*), COALESCE(SUM(rating), 0) FROM Reviews "
+                f"WHERE is_verified = TRUE AND {review_column} IN ({placeholders}) "
+                f"GROUP BY {review_column}",
+                ids,
+            )
+            aggregates = {row[0]: (int(row[1]), int(row[2])) for row in await cursor.fetchall()}
+
+            total_assignment = f", {total_column} = %s" if total_column else ""
+            rows = []
+            for target_id in ids:
+                count, total = aggregates.get(target_id, (0, 0))
+                values = [count, total, total / count if count else 0, bayesian_score(count, total)]
+                if total_column:
+                    values.append(count)
+                rows.append((*values, target_id))
+            await conn.begin()
+            try:
+                await cursor.executemany(
+                    f"UPDATE {table} SET rating_count = %s, rating_sum = %s, average_rating = %s, "
+                    f"rating_score = %s{total_assignment} WHERE {key_column} = %s",
+                    rows,
+                )
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+        processed += len(ids)
+        last_id = ids[-1]
+
+
+async def recompute_all(conn, batch_size: int = RECOMPUTE_BATCH_SIZE) -> dict:
+    return {kind: await recompute(conn, kind, batch_size) for kind in _TARGETS}
+
+
+async def _main(args: list[str]):
+    from .migrate import connect
+
+    if not args or args[0] != "recompute":
+        print("Cách dùng: python -m services._shared.ratings recompute")
+        sys.exit(1)
+    conn = await connect()
+    try:
+        print(await recompute_all(conn))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -3,21 +3,45 @@
 
 import jwt
 from jwt import PyJWTError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import APIKeyCookie
 from pydantic import BaseModel, ValidationError
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import math
+import os
 import secrets # Dùng để tạo token reset an toàn
+import time
+import uuid
+from . import metrics
+from .token_cache import token_cache, revocations
+from .jwt_keys import signing_keys, jwks_cache
 
 # === 1. CẤU HÌNH HASHING MẬT KHẨU ===
 # Sử dụng bcrypt làm thuật toán hash
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Đổi BCRYPT_ROUNDS thì mật khẩu cũ vẫn đăng nhập được và sẽ được hash lại khi đăng nhập
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt tốn ~100-300ms CPU mỗi lần -> chạy ngoài event loop, giới hạn số lần chạy đồng thời
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" hoặc "process"
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))  # Quá mức này thì trả 503
+REHASH_ON_LOGIN = os.getenv("REHASH_ON_LOGIN", "1") == "1"
+
+# Đăng nhập sai quá LOGIN_MAX_FAILURES lần trong LOGIN_FAILURE_WINDOW giây -> chặn email đó (429)
+# trước khi chạy bcrypt (gateway đã rate limit; đây là lớp bảo vệ khi gọi thẳng service)
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "10"))
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+# Số tiến trình auth_service cùng nhận request (launcher đặt = số worker). Bộ đếm nằm trong từng tiến trình
+# nên mỗi tiến trình chỉ cho 1 phần LOGIN_MAX_FAILURES -> tổng số lần sai cho phép không nhân theo số worker
+LOGIN_THROTTLE_PROCESSES = max(1, int(os.getenv("LOGIN_THROTTLE_PROCESSES", "1")))
 
 # === 2. CẤU HÌNH JWT ===
-# BẮT BUỘC: Hãy thay đổi chuỗi này thành một chuỗi bí mật của riêng bạn
-SECRET_KEY = "your-super-secret-key-for-findmydentist-thay-doi-sau" 
-ALGORITHM = "HS256"
+# Token được ký bằng khóa bất đối xứng (EdDSA/RS256) của auth_service, có "kid" trong header.
+# Nơi khác chỉ cần khóa công khai (JWKS) để xác thực - xem jwt_keys.py (cả cách xoay khóa)
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # Token hết hạn sau 1 ngày
 
 # Tên của cookie mà chúng ta sẽ lưu token
@@ -30,6 +54,9 @@ class TokenPayload(BaseModel):
     """
     sub: str  # 'subject' (chủ thể) - chúng ta sẽ dùng user_id (VARCHAR)
     role: str # Vai trò (CUSTOMER, DENTIST, ADMIN)
+    jti: str | None = None  # ID của token (dùng để thu hồi khi đăng xuất)
+    iat: int | None = None  # Thời điểm cấp (dùng để thu hồi khi đổi mật khẩu)
+    exp: int | None = None
 
 # === 4. CÁC HÀM BẢO MẬT (Dùng trong routes.py) ===
 
@@ -41,15 +68,171 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Hàm kiểm tra mật khẩu (dùng khi đăng nhập)"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    # Trả về (đúng/sai, hash mới nếu cost factor đã đổi)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Chạy bcrypt trong thread pool (bcrypt nhả GIL) hoặc process pool.
+    - Tối đa PASSWORD_HASH_MAX_CONCURRENCY phép hash chạy cùng lúc
+    - Tối đa PASSWORD_HASH_MAX_QUEUE request xếp hàng chờ; vượt quá -> 503 (backpressure)
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, kind: str = "thread"):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Executor | None = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_concurrency)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Máy chủ đang bận, vui lòng thử lại sau",
+                headers={"Retry-After": "1"},
+            )
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        start = time.perf_counter()
+        metrics.bcrypt_duration.observe(start - queued_at, ("queue",))
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            elapsed = time.perf_counter() - start
+            self.total_ms += elapsed * 1000
+            metrics.bcrypt_duration.observe(elapsed, ("hash",))
+            self._semaphore.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.completed, 3) if self.completed else 0.0,
+        }
+
+
+class LoginThrottle:
+    """
+    Đếm số lần đăng nhập sai theo email bằng token bucket (mỗi email: (token, thời điểm) -> O(1)).
+    Chỉ lần SAI mới tốn token, nên người dùng đăng nhập đúng không bao giờ bị chặn.
+    """
+
+    def __init__(self, max_failures: int, window: float, max_keys: int = 100000):
+        self.max_failures = max_failures
+        self.rate = max_failures / window
+        self.window = window
+        self.max_keys = max_keys
+        self._buckets: dict[str, list] = {}  # email -> [token còn lại, thời điểm cập nhật]
+        self.blocked = 0
+
+    def _refill(self, email: str) -> list | None:
+        bucket = self._buckets.get(email)
+        if bucket is not None:
+            now = time.monotonic()
+            bucket[0] = min(self.max_failures, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def check(self, email: str):
+        """Gọi TRƯỚC khi chạy bcrypt: ném 429 nếu email này đã sai quá nhiều"""
+        bucket = self._refill(email.lower())
+        if bucket is not None and bucket[0] < 1:
+            self.blocked += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Đăng nhập sai quá nhiều lần, vui lòng thử lại sau",
+                headers={"Retry-After": str(max(1, int((1 - bucket[0]) / self.rate) + 1))},
+            )
+
+    def record_failure(self, email: str):
+        email = email.lower()
+        bucket = self._refill(email)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._sweep()
+            bucket = self._buckets[email] = [float(self.max_failures), time.monotonic()]
+        bucket[0] = max(0.0, bucket[0] - 1)
+
+    def record_success(self, email: str):
+        self._buckets.pop(email.lower(), None)
+
+    def _sweep(self):
+        # Bucket không dùng quá `window` giây đã đầy lại -> bỏ
+        cutoff = time.monotonic() - self.window
+        self._buckets = {k: b for k, b in self._buckets.items() if b[1] >= cutoff}
+
+
+login_throttle = LoginThrottle(math.ceil(LOGIN_MAX_FAILURES / LOGIN_THROTTLE_PROCESSES), LOGIN_FAILURE_WINDOW)
+
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_MAX_CONCURRENCY, PASSWORD_HASH_MAX_QUEUE, PASSWORD_HASH_EXECUTOR
+)
+
+async def get_password_hash_async(password: str) -> str:
+    """Giống get_password_hash nhưng không chặn event loop (dùng trong async handler)"""
+    return await password_hasher.run(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Giống verify_password nhưng không chặn event loop.
+    Trả về (đúng/sai, hash mới). Hash mới khác None khi mật khẩu đúng nhưng hash cũ dùng cost
+    factor khác BCRYPT_ROUNDS (và REHASH_ON_LOGIN bật) -> nơi gọi nên lưu lại vào CSDL.
+    """
+    if REHASH_ON_LOGIN:
+        return await password_hasher.run(_verify_and_update, plain_password, hashed_password)
+    return await password_hasher.run(verify_password, plain_password, hashed_password), None
+
 def create_access_token(user_id: str, role: str) -> str:
     """Tạo ra một JWT token mới"""
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    now = datetime.utcnow()
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {
         "sub": user_id,     # Lưu user_id vào token
         "role": role,       # Lưu vai trò vào token
-        "exp": expire       # Đặt thời gian hết hạn
+        "exp": expire,      # Đặt thời gian hết hạn
+        "iat": now,         # Thời điểm cấp
+        "jti": uuid.uuid4().hex,
     }
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # Ký bằng khóa đang hoạt động, header có "kid" để bên xác thực chọn đúng khóa công khai
+    encoded_jwt = signing_keys.sign(to_encode)
     return encoded_jwt
 
 def create_reset_token() -> str:
@@ -77,25 +260,71 @@ async def get_current_user(token: str = Depends(cookie_scheme)) -> TokenPayload:
             detail="Chưa đăng nhập (Không tìm thấy cookie)",
         )
         
-    try:
-        # Giải mã token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        # Chuyển payload thành model Pydantic để xác thực
-        token_data = TokenPayload(**payload)
-        
-    except PyJWTError:
-        # Lỗi nếu token hết hạn, sai chữ ký...
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token không hợp lệ hoặc đã hết hạn",
-        )
-    except ValidationError:
-        # Lỗi nếu payload thiếu 'sub' hoặc 'role'
+    return await verify_token(token)
+
+
+async def _public_key(kid: str | None):
+    """auth_service (có khóa bí mật) tra tại chỗ; service khác dùng JWKS đã cache"""
+    if kid is None:
+        return None
+    if signing_keys.loaded:
+        return signing_keys.public_key(kid)
+    return await jwks_cache.public_key(kid)
+
+
+async def verify_token(token: str) -> TokenPayload:
+    """
+    Xác thực token, ném HTTPException 401 nếu không hợp lệ.
+    Token đã xác thực được lưu trong token_cache tới khi hết hạn -> lần sau không phải
+    jwt.decode + validate Pydantic. Danh sách thu hồi luôn được kiểm tra (chỉ là tra dict).
+    """
+    token_data = token_cache.get(token)
+    if token_data is None:
+        try:
+            # Chọn khóa công khai theo "kid" rồi giải mã token
+            key = await _public_key(jwt.get_unverified_header(token).get("kid"))
+            if key is None:
+                raise PyJWTError("Không tìm thấy khóa xác thực (kid)")
+            public_key, algorithm = key
+            payload = jwt.decode(token, public_key, algorithms=[algorithm])
+
+            # Chuyển payload thành model Pydantic để xác thực
+            token_data = TokenPayload(**payload)
+
+        except PyJWTError:
+            # Lỗi nếu token hết hạn, sai chữ ký...
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token không hợp lệ hoặc đã hết hạn",
+            )
+        except ValidationError:
+            # Lỗi nếu payload thiếu 'sub' hoặc 'role'
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Nội dung token không hợp lệ",
+            )
+        if token_data.exp is not None:
+            token_cache.set(token, token_data.exp, token_data)
+
+    if revocations.is_revoked(token_data.jti, token_data.sub, token_data.iat):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Nội dung token không hợp lệ",
+            detail="Token đã bị thu hồi",
         )
-    
+
     # Nếu mọi thứ OK, trả về payload (chứa user_id và role)
-    return token_data
\ No newline at end of file
+    return token_data
+
+
+# === 6. API NỘI BỘ (QUẢN TRỊ / GIỮA CÁC SERVICE) ===
+# Bí mật dùng chung giữa gateway và các service (launcher tự sinh nếu chưa đặt).
+# Gateway không chuyển tiếp header này từ client -> API nội bộ không gọi được qua /api/...
+# Chưa đặt INTERNAL_API_TOKEN thì mọi API nội bộ đều bị từ chối.
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+async def require_internal(x_internal_token: str | None = Header(None)):
+    """Dependency cho API nội bộ (xóa cache, danh sách thu hồi...): cần header X-Internal-Token đúng"""
+    if not INTERNAL_API_TOKEN or x_internal_token is None or not secrets.compare_digest(
+        x_internal_token.encode("utf-8"), INTERNAL_API_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="API chỉ dành cho gọi nội bộ")
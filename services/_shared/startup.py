@@ -0,0 +1,27 @@
+# File: /services/_shared/startup.py
+# Chờ dữ liệu trong bộ nhớ (chỉ mục tìm kiếm, bitmap lịch trống...) nạp xong trước khi nhận request.
+# Mặc định không chờ (nạp ở nền như trước). Bộ khởi chạy nhiều tiến trình (python -m launcher.run) đặt
+# STARTUP_READY_TIMEOUT để worker mới chỉ nhận request khi đã "nóng" - trong lúc đó các worker cũ vẫn phục vụ.
+
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTUP_READY_TIMEOUT = float(os.getenv("STARTUP_READY_TIMEOUT", "0"))  # (giây) 0 = không chờ
+
+
+async def wait_until_ready(*components, timeout: float = STARTUP_READY_TIMEOUT):
+    """components: các đối tượng có thuộc tính .ready (VD: refresher của text_index / availability)"""
+    if timeout <= 0 or not components:
+        return
+    started = time.monotonic()
+    deadline = started + timeout
+    while not all(component.ready for component in components):
+        if time.monotonic() >= deadline:
+            logger.warning(f"Hết {timeout:g}s chờ dữ liệu khởi động; nhận request khi dữ liệu chưa nạp xong")
+            return
+        await asyncio.sleep(0.05)
+    logger.info(f"Dữ liệu khởi động đã sẵn sàng sau {time.monotonic() - started:.2f}s")
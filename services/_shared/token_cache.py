@@ -0,0 +1,208 @@
+# File: /services/_shared/token_cache.py
+# Bộ nhớ đệm cho việc xác thực JWT (dùng trong get_current_user):
+# - TokenCache: LRU giới hạn số entry, key = sha256(token), tự bỏ khi token hết hạn (exp)
+# - RevocationList: danh sách thu hồi token, kiểm tra O(1) bằng dict
+#     + theo jti (đăng xuất 1 phiên)
+#     + theo user: mọi token cấp trước thời điểm X (đổi/reset mật khẩu)
+# - RevocationSync: đồng bộ danh sách thu hồi giữa các instance qua bảng Token_Revocations
+#   (gateway lấy lại qua API GET /revocations của auth_service)
+#   Con trỏ đọc (synced_id) chỉ tăng theo các dòng đọc từ CSDL, không theo sự kiện instance tự ghi:
+#   nhiều worker auth cùng ghi nên id không đến theo thứ tự (id nhỏ hơn có thể commit sau)
+#   -> mỗi lần đọc lùi lại REVOCATION_REREAD_IDS id, áp dụng trùng không sao (theo id)
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from .db import acquire_connection
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+REVOCATION_POLL_INTERVAL = float(os.getenv("REVOCATION_POLL_INTERVAL", "2"))  # (giây)
+REVOCATION_REREAD_IDS = int(os.getenv("REVOCATION_REREAD_IDS", "200"))
+# GET /revocations trả lại cả sự kiện instance mới biết trong khoảng này (dù id <= since),
+# để gateway luân phiên gọi nhiều worker không bỏ sót sự kiện đến muộn
+REVOCATION_REPLAY_SECONDS = float(os.getenv("REVOCATION_REPLAY_SECONDS", "60"))
+
+
+def token_key(token: str) -> str:
+    """Không giữ nguyên token trong bộ nhớ đệm, chỉ giữ hash"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+# === 1. DANH SÁCH THU HỒI ===
+class RevocationList:
+    def __init__(self):
+        self._jti: dict[str, float] = {}           # jti -> exp (hết hạn thì không cần giữ)
+        self._before: dict[str, tuple[int, float]] = {}  # user_id -> (iat nhỏ nhất còn hợp lệ, hết hạn)
+        self.synced_id = 0                          # revocation_id lớn nhất đã đọc từ CSDL (con trỏ đồng bộ)
+        self.events: dict[int, tuple[float, dict]] = {}  # id -> (lúc biết, sự kiện) còn hiệu lực (trả cho gateway)
+
+    def apply(self, event: dict):
+        """event: {id, jti, user_id, revoked_before, expires_at} (1 dòng của Token_Revocations)"""
+        if event.get("jti"):
+            self._jti[event["jti"]] = event["expires_at"]
+        if event.get("user_id") and event.get("revoked_before"):
+            current = self._before.get(event["user_id"])
+            if current is None or current[0] < event["revoked_before"]:
+                self._before[event["user_id"]] = (event["revoked_before"], event["expires_at"])
+        if event.get("id") and event["id"] not in self.events:
+            self.events[event["id"]] = (time.monotonic(), event)
+
+    def is_revoked(self, jti: str | None, user_id: str, iat: int | None) -> bool:
+        if jti is not None and jti in self._jti:
+            return True
+        before = self._before.get(user_id)
+        return before is not None and (iat is None or iat < before[0])
+
+    def prune(self):
+        """Bỏ các mục đã quá hạn (token liên quan đã hết hạn nên không cần chặn nữa)"""
+        now = time.time()
+        self._jti = {jti: exp for jti, exp in self._jti.items() if exp > now}
+        self._before = {user: item for user, item in self._before.items() if item[1] > now}
+        self.events = {id_: item for id_, item in self.events.items() if item[1]["expires_at"] > now}
+
+    def since(self, last_id: int) -> list[dict]:
+        """Sự kiện có id > last_id, cộng các sự kiện mới biết trong REVOCATION_REPLAY_SECONDS giây"""
+        recent = time.monotonic() - REVOCATION_REPLAY_SECONDS
+        return [event for id_, (seen, event) in sorted(self.events.items()) if id_ > last_id or seen >= recent]
+
+    def stats(self) -> dict:
+        return {"jti": len(self._jti), "users": len(self._before), "synced_id": self.synced_id}
+
+
+# === 2. CACHE TOKEN ĐÃ XÁC THỰC ===
+class TokenCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()  # key -> (exp, payload)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str):
+        key = token_key(token)
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        exp, payload = item
+        if exp <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def set(self, token: str, exp: float, payload):
+        key = token_key(token)
+        self._data[key] = (exp, payload)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+revocations = RevocationList()
+token_cache = TokenCache(TOKEN_CACHE_MAX_ENTRIES)
+
+
+# === 3. ĐỒNG BỘ QUA CSDL ===
+_SELECT_SQL = """
+    SELECT revocation_id, jti, user_id, revoked_before, expires_at
+    FROM Token_Revocations
+    WHERE revocation_id > %s AND expires_at > %s
+    ORDER BY revocation_id
+"""
+
+
+def _row_to_event(row) -> dict:
+    revocation_id, jti, user_id, revoked_before, expires_at = row
+    return {
+        "id": revocation_id,
+        "jti": jti,
+        "user_id": user_id,
+        "revoked_before": revoked_before,
+        "expires_at": expires_at,
+    }
+
+
+async def record_revocation(conn, *, jti: str | None = None, user_id: str | None = None,
+                            revoked_before: int | None = None, expires_at: float):
+    """Ghi sự kiện thu hồi vào CSDL và áp dụng ngay cho instance hiện tại (không đổi synced_id)"""
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "INSERT INTO Token_Revocations (jti, user_id, revoked_before, expires_at) VALUES (%s, %s, %s, %s)",
+            (jti, user_id, revoked_before, int(expires_at)),
+        )
+        revocation_id = cursor.lastrowid
+    revocations.apply({
+        "id": revocation_id,
+        "jti": jti,
+        "user_id": user_id,
+        "revoked_before": revoked_before,
+        "expires_at": int(expires_at),
+    })
+
+
+class RevocationSync:
+    """Tác vụ nền: đọc các dòng mới của Token_Revocations (instance khác ghi) mỗi REVOCATION_POLL_INTERVAL giây"""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.last_error: str | None = None
+
+    async def sync(self):
+        async with acquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    _SELECT_SQL, (max(0, revocations.synced_id - REVOCATION_REREAD_IDS), int(time.time()))
+                )
+                rows = await cursor.fetchall()
+        for row in rows:
+            revocations.apply(_row_to_event(row))
+        if rows:
+            revocations.synced_id = max(revocations.synced_id, rows[-1][0])
+        revocations.prune()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Không thể đồng bộ danh sách thu hồi token: {e}")
+            await asyncio.sleep(REVOCATION_POLL_INTERVAL)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+revocation_sync = RevocationSync()
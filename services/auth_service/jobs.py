@@ -0,0 +1,41 @@
+# File: /services/auth_service/jobs.py
+# Các job nền của auth_service (ghi vào outbox trong routes.py, worker gửi đi sau khi commit).
+# Import module này trong main.py để đăng ký handler.
+
+from .._shared.mailer import PermanentDeliveryError, build_message, mailer
+from .._shared.outbox import PermanentJobError, handler
+
+PASSWORD_RESET_EMAIL = "email.password_reset"
+WELCOME_EMAIL = "email.welcome"
+
+
+async def _send(to: str, subject: str, body: str, key: str):
+    try:
+        await mailer.send(build_message(to, subject, body, key))
+    except PermanentDeliveryError as e:
+        raise PermanentJobError(str(e)) from e
+
+
+@handler(PASSWORD_RESET_EMAIL)
+async def send_password_reset_email(payload: dict, key: str):
+    """payload: {email, otp, expires_minutes}"""
+    await _send(
+        payload["email"],
+        "FindMyDentist - Mã OTP đặt lại mật khẩu",
+        f"Mã OTP của bạn là: {payload['otp']}\n"
+        f"Mã có hiệu lực trong {payload['expires_minutes']} phút.\n\n"
+        "Nếu bạn không yêu cầu đặt lại mật khẩu, hãy bỏ qua email này.",
+        key,
+    )
+
+
+@handler(WELCOME_EMAIL, keep_payload_on_dead=True)  # Không chứa bí mật, cho phép retry-dead
+async def send_welcome_email(payload: dict, key: str):
+    """payload: {email, first_name}"""
+    await _send(
+        payload["email"],
+        "Chào mừng bạn đến với FindMyDentist",
+        f"Xin chào {payload['first_name']},\n\n"
+        "Tài khoản FindMyDentist của bạn đã được tạo thành công.",
+        key,
+    )
@@ -1,9 +1,47 @@
 # File: /services/auth_service/main.py
-import uvicorn
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from . import routes 
+from .._shared.db import init_db_pool, close_db_pool, get_pool_stats
+from .._shared.json_response import ORJSONResponse
+from .._shared.metrics import MetricsMiddleware, metrics_response
+from .._shared.security import password_hasher, require_internal
+from .._shared.token_cache import revocation_sync
+from .._shared.jwt_keys import signing_keys
+from .._shared.mailer import mailer
+from .._shared.outbox import outbox_worker
+from . import jobs  # noqa: F401 (đăng ký handler cho outbox)
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Khởi tạo pool kết nối CSDL trước khi nhận request
+    try:
+        await init_db_pool()
+    except Exception as e:
+        # CSDL chưa sẵn sàng: service vẫn chạy, pool sẽ được tạo lại ở request đầu tiên
+        logger.warning(f"Không thể khởi tạo pool CSDL: {e}")
+    # Nạp khóa ký JWT (tạo khóa mới nếu thư mục khóa trống)
+    signing_keys.load()
+    # Đồng bộ danh sách token bị thu hồi từ các instance khác
+    revocation_sync.start()
+    # Gửi email (OTP, chào mừng...) từ outbox ở nền
+    outbox_worker.start()
+    yield
+    await outbox_worker.stop()
+    await mailer.shutdown()
+    await revocation_sync.stop()
+    # Đóng pool khi service tắt
+    await close_db_pool()
+    password_hasher.shutdown()
+
+# Mã hóa JSON bằng orjson; nén response chỉ làm 1 lần ở API Gateway
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Đo thời gian request + mã request (X-Request-ID); đặt ngoài cùng nên thêm sau cùng
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(routes.router)
 
@@ -11,5 +49,26 @@ app.include_router(routes.router)
 def read_root():
     return {"service": "Auth Service (Python-Only)"}
 
+@app.get("/db-pool", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_db_pool_stats():
+    """Số liệu pool kết nối CSDL (in-use, waiters, độ trễ lấy kết nối)"""
+    return get_pool_stats()
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_metrics():
+    """Số liệu dạng Prometheus (độ trễ theo route, truy vấn CSDL, bcrypt...)"""
+    return metrics_response()
+
+@app.get("/password-hasher", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_password_hasher_stats():
+    """Số liệu pool bcrypt (đang chạy, đang chờ, bị từ chối, thời gian trung bình)"""
+    return password_hasher.stats()
+
+@app.get("/outbox", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_outbox_stats():
+    """Số liệu job nền: số lô, job xong / thử lại / DEAD, số email đã gửi"""
+    return {**outbox_worker.stats(), "mail": mailer.stats()}
+
 if __name__ == "__main__":
+    import uvicorn  # Chỉ cần khi chạy trực tiếp (launcher / uvicorn CLI tự import)
     uvicorn.run(app, host="127.0.0.1", port=8001)
\ No newline at end of file
@@ -1,20 +1,30 @@
-from fastapi import APIRouter, Depends, Response, status, HTTPException
-from .._shared.db import get_db_connection 
+from fastapi import APIRouter, Depends, Response, status, HTTPException, Query
+from .._shared.db import get_db_connection, get_write_connection
 import aiomysql
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime, timedelta
+import time
 import uuid # Dùng để tạo VARCHAR ID
 
 # Import các hàm bảo mật từ file dùng chung
 from .._shared.security import (
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
+    login_throttle,
     create_access_token,
     create_reset_token,
     get_current_user,
+    verify_token,
+    require_internal,
+    cookie_scheme,
     TokenPayload,
-    COOKIE_NAME
+    COOKIE_NAME,
+    ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from .._shared.token_cache import record_revocation, revocations, token_cache
+from .._shared.jwt_keys import signing_keys
+from .._shared.outbox import enqueue, outbox_worker
+from .jobs import PASSWORD_RESET_EMAIL, WELCOME_EMAIL
 
 router = APIRouter()
 
@@ -71,6 +81,9 @@ async def login_user(
     conn: aiomysql.Connection = Depends(get_db_connection)
 ):
     try:
+        # 0. Email đã đăng nhập sai quá nhiều lần -> 429 ngay, không tốn truy vấn và bcrypt
+        login_throttle.check(form_data.email)
+
         # 1. Tìm user bằng email
         async with conn.cursor(aiomysql.DictCursor) as cursor:
             await cursor.execute(
@@ -80,12 +93,30 @@ async def login_user(
             user = await cursor.fetchone()
 
         
-        # 2. Kiểm tra user và mật khẩu
-        if not user or not verify_password(form_data.password, user["password_hash"]):
+        # 2. Kiểm tra user và mật khẩu (bcrypt chạy ngoài event loop)
+        if not user:
+            login_throttle.record_failure(form_data.email)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, 
+                detail="Email hoặc mật khẩu không chính xác"
+            )
+        is_valid, new_hash = await verify_password_async(form_data.password, user["password_hash"])
+        if not is_valid:
+            login_throttle.record_failure(form_data.email)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, 
                 detail="Email hoặc mật khẩu không chính xác"
             )
+
+        login_throttle.record_success(form_data.email)
+
+        # 2b. Cost factor của bcrypt đã đổi -> lưu hash mới
+        if new_hash:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "UPDATE Users SET password_hash = %s WHERE user_id = %s",
+                    (new_hash, user["user_id"])
+                )
         
         # 3. Tạo JWT Token
         access_token = create_access_token(
@@ -110,14 +141,28 @@ async def login_user(
                 "role": user["role"]
             }
         }
+    except HTTPException:
+        # 401 (sai mật khẩu) / 429 (sai quá nhiều lần) / 503 (bcrypt quá tải) giữ nguyên status
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi máy chủ: {e}")
 @router.post(
     "/logout",
     summary="Đăng xuất",
-    description="Xóa HttpOnly cookie khỏi trình duyệt."
+    description="Xóa HttpOnly cookie khỏi trình duyệt và thu hồi token hiện tại."
 )
-async def logout_user(response: Response):
+async def logout_user(
+    response: Response,
+    token: str | None = Depends(cookie_scheme),
+    conn: aiomysql.Connection = Depends(get_db_connection)
+):
+    if token:
+        try:
+            current_user = await verify_token(token)
+        except HTTPException:
+            current_user = None  # Token đã hết hạn/không hợp lệ -> không cần thu hồi
+        if current_user is not None and current_user.jti and current_user.exp:
+            await record_revocation(conn, jti=current_user.jti, expires_at=current_user.exp)
     response.delete_cookie(key=COOKIE_NAME)
     return {"message": "Đăng xuất thành công"}
 
@@ -129,7 +174,7 @@ async def logout_user(response: Response):
 async def register_user(
     user_data: UserRegister, 
     response: Response,
-    conn: aiomysql.Connection = Depends(get_db_connection)
+    conn: aiomysql.Connection = Depends(get_write_connection)  # User mới đọc lại ngay từ primary
 ):
     # 1. Kiểm tra email đã tồn tại chưa
     async with conn.cursor() as cursor:
@@ -138,7 +183,7 @@ async def register_user(
             raise HTTPException(status_code=400, detail="Email đã tồn tại")
 
     # 2. Hash mật khẩu
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     
     # 3. Tạo VARCHAR ID (vì CSDL không tự tăng)
     unique_part = uuid.uuid4().hex[:10]
@@ -179,9 +224,14 @@ async def register_user(
                 # Nếu role không hợp lệ (ví dụ: "ADMIN"), hủy transaction
                 await conn.rollback()
                 raise HTTPException(status_code=400, detail="Vai trò (role) không hợp lệ")
+
+            # Email chào mừng: ghi vào outbox trong cùng transaction (gửi ở nền sau khi commit)
+            await enqueue(cursor, WELCOME_EMAIL, {"email": user_data.email, "first_name": user_data.first_name},
+                          key=f"welcome:{new_user_id}")
             
         # 7. Commit Transaction
         await conn.commit()
+        outbox_worker.notify()
         
         response.status_code = status.HTTP_201_CREATED # 201 Created
         return {"message": "Đăng ký thành công", "user_id": new_user_id, "email": user_data.email}
@@ -228,17 +278,29 @@ async def request_password_reset(
     temp_reset_token = create_reset_token()
     expiry_time = datetime.utcnow() + timedelta(minutes=10) # Hết hạn sau 10p
 
-    async with conn.cursor() as cursor:
-        rows_affected = await cursor.execute(
-            # (STATEFUL) Lưu token và thời hạn vào CSDL
-            "UPDATE Users SET reset_token = %s, reset_expiry = %s WHERE email = %s",
-            (temp_reset_token, expiry_time, request.email)
-        )
-    
-    if rows_affected == 0:
-        raise HTTPException(status_code=404, detail="Email không tìm thấy")
-    
-    # (TODO: Gửi email thật chứa 'otp' cho người dùng)
+    try:
+        await conn.begin()
+        async with conn.cursor() as cursor:
+            rows_affected = await cursor.execute(
+                # (STATEFUL) Lưu token và thời hạn vào CSDL
+                "UPDATE Users SET reset_token = %s, reset_expiry = %s WHERE email = %s",
+                (temp_reset_token, expiry_time, request.email)
+            )
+            if rows_affected == 0:
+                await conn.rollback()
+                raise HTTPException(status_code=404, detail="Email không tìm thấy")
+            # Email chứa OTP: ghi vào outbox cùng transaction, worker nền gửi sau khi commit
+            # (request không phải chờ máy chủ mail)
+            await enqueue(cursor, PASSWORD_RESET_EMAIL,
+                          {"email": request.email, "otp": otp, "expires_minutes": 10},
+                          key=f"password_reset:{uuid.uuid4().hex}")  # Không dùng reset_token (key lưu lại, ghi log)
+        await conn.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Lỗi CSDL khi tạo yêu cầu reset: {e}")
+    outbox_worker.notify()
     
     return {
         "message": "Đã gửi OTP (demo)",
@@ -295,20 +357,71 @@ async def reset_password(
     if not request.token:
         raise HTTPException(status_code=400, detail="Thiếu token reset")
 
-    new_hashed_password = get_password_hash(request.new_password)
+    new_hashed_password = await get_password_hash_async(request.new_password)
     
     async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT user_id FROM Users WHERE reset_token = %s AND reset_expiry > %s",
+            (request.token, datetime.utcnow())
+        )
+        user = await cursor.fetchone()
+        if not user:
+            raise HTTPException(status_code=400, detail="Token reset không hợp lệ hoặc đã hết hạn")
+
         # Cập nhật mật khẩu VÀ xóa token (để dùng 1 lần)
         rows_affected = await cursor.execute(
             """
             UPDATE Users 
             SET password_hash = %s, reset_token = NULL, reset_expiry = NULL
-            WHERE reset_token = %s AND reset_expiry > %s
+            WHERE user_id = %s AND reset_token = %s
             """,
-            (new_hashed_password, request.token, datetime.utcnow())
+            (new_hashed_password, user[0], request.token)
         )
     
     if rows_affected == 0:
         raise HTTPException(status_code=400, detail="Token reset không hợp lệ hoặc đã hết hạn")
 
-    return {"message": "Đã cập nhật mật khẩu thành công"}
\ No newline at end of file
+    # Thu hồi mọi phiên đăng nhập cũ của user (token cấp trước thời điểm này)
+    now = time.time()
+    await record_revocation(
+        conn,
+        user_id=user[0],
+        revoked_before=int(now),
+        expires_at=now + ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+    return {"message": "Đã cập nhật mật khẩu thành công"}
+
+
+# === 4. KHÓA CÔNG KHAI VÀ ĐỒNG BỘ THU HỒI TOKEN (cho service khác và API Gateway) ===
+
+@router.get(
+    "/.well-known/jwks.json",
+    summary="Khóa công khai (JWKS)",
+    description="Khóa công khai để tự xác thực token (chọn theo 'kid' trong header token). "
+                "Gồm cả khóa cũ còn hiệu lực trong quá trình xoay khóa."
+)
+async def read_jwks(response: Response):
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return signing_keys.jwks()
+
+@router.get(
+    "/revocations",
+    summary="Danh sách token bị thu hồi",
+    description="Các sự kiện thu hồi còn hiệu lực có id > since. API Gateway gọi định kỳ "
+                "để tự xác thực token (trả lời /me) mà không bỏ sót token đã đăng xuất. "
+                "Chỉ gọi nội bộ (header X-Internal-Token).",
+    dependencies=[Depends(require_internal)],
+    include_in_schema=False,
+)
+async def list_revocations(since: int = Query(0, ge=0)):
+    return {"last_id": revocations.synced_id, "events": revocations.since(since)}
+
+@router.get(
+    "/token-cache",
+    summary="Số liệu cache token",
+    dependencies=[Depends(require_internal)],
+    include_in_schema=False,
+)
+async def read_token_cache_stats():
+    return {"cache": token_cache.stats(), "revocations": revocations.stats()}
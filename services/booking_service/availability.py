@@ -0,0 +1,523 @@
+# File: /services/booking_service/availability.py
+# Lịch trống của nha sĩ dưới dạng bitmap theo ngày.
+# - 1 ngày chia thành các ô BOOKING_SLOT_MINUTES phút; bit i = ô thứ i tính từ 0h
+# - Lịch làm việc (Dentists.availability_schedule) -> 7 bitmap (thứ 2..CN) cho mỗi nha sĩ
+# - Ô đã đặt nằm trong Dentist_Day_Slots (bitmap đã tính sẵn, cập nhật khi đặt / hủy lịch)
+# - Trống = làm việc AND NOT đã đặt
+#
+# Truy vấn nhiều nha sĩ cùng lúc: ngoài bitmap theo nha sĩ (hàng), chỉ mục giữ thêm dạng "cột":
+# mỗi ô thời gian là 1 số nguyên có bit j = nha sĩ thứ j. "Ai trống 9h-11h" chỉ là vài phép AND
+# trên các số nguyên lớn (Python xử lý theo từng word 64 bit bằng C), không lặp qua từng nha sĩ.
+#
+# Đặt lịch: đọc (booked, version) của ngày -> kiểm tra ô còn trống -> UPDATE ... WHERE version = <đã đọc>
+# cùng transaction với INSERT Appointments. Hai người đặt cùng lúc thì chỉ 1 UPDATE thành công,
+# người còn lại đọc lại và thấy ô đã bị chiếm (409) -> không bao giờ đặt trùng.
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from fastapi import HTTPException, status
+
+from .._shared.db import acquire_connection
+
+logger = logging.getLogger(__name__)
+
+# === 1. CẤU HÌNH ===
+SLOT_MINUTES = int(os.getenv("BOOKING_SLOT_MINUTES", "15"))
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DEFAULT_DURATION_MINUTES = int(os.getenv("BOOKING_DEFAULT_DURATION_MINUTES", "30"))
+BOOKING_MAX_RETRIES = int(os.getenv("BOOKING_MAX_RETRIES", "5"))
+SCHEDULE_POLL_INTERVAL = float(os.getenv("BOOKING_SCHEDULE_POLL_INTERVAL", "30"))
+SCHEDULE_FULL_REFRESH_INTERVAL = float(os.getenv("BOOKING_SCHEDULE_FULL_REFRESH_INTERVAL", "3600"))
+DAY_CACHE_TTL = float(os.getenv("BOOKING_DAY_CACHE_TTL", "5"))      # (giây) Bitmap ngày do instance khác ghi
+DAY_CACHE_SIZE = int(os.getenv("BOOKING_DAY_CACHE_SIZE", "64"))     # Số ngày giữ trong bộ nhớ
+
+# Lịch hẹn còn giữ chỗ
+ACTIVE_STATUSES = ("Pending", "Confirmed")
+
+_WEEKDAYS = {
+    "mon": 0, "monday": 0, "tue": 1, "tuesday": 1, "wed": 2, "wednesday": 2, "thu": 3, "thursday": 3,
+    "fri": 4, "friday": 4, "sat": 5, "saturday": 5, "sun": 6, "sunday": 6,
+}
+
+
+# === 2. BITMAP ===
+def parse_minutes(text: str) -> int:
+    """'HH:MM' -> số phút từ 0h ('24:00' hợp lệ, dùng làm giờ kết thúc)"""
+    hours, minutes = str(text).strip().split(":")
+    value = int(hours) * 60 + int(minutes)
+    if not 0 <= int(minutes) < 60 or not 0 <= value <= 24 * 60:
+        raise ValueError(f"Giờ không hợp lệ: {text}")
+    return value
+
+
+def format_slot(slot: int) -> str:
+    minutes = slot * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def range_mask(start_minute: int, end_minute: int) -> int:
+    """Các ô nằm TRỌN trong [start, end) (giờ làm việc lẻ phút thì ô dở dang không được tính)"""
+    first = -(-start_minute // SLOT_MINUTES)
+    last = min(end_minute // SLOT_MINUTES, SLOTS_PER_DAY)
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def slots_needed(duration_minutes: int) -> int:
+    return max(1, -(-duration_minutes // SLOT_MINUTES))
+
+
+def appointment_mask(start_minute: int, duration_minutes: int) -> int:
+    """Các ô mà 1 lịch hẹn chạm vào (lịch hẹn cũ không khớp ô vẫn được tính chặt)"""
+    first = start_minute // SLOT_MINUTES
+    last = min(-(-(start_minute + max(duration_minutes, 1)) // SLOT_MINUTES), SLOTS_PER_DAY)
+    return ((1 << (last - first)) - 1) << first
+
+
+def iter_bits(value: int):
+    """Chỉ số các bit 1, từ thấp tới cao"""
+    while value:
+        low = value & -value
+        yield low.bit_length() - 1
+        value ^= low
+
+
+def start_slots(free: int, needed: int) -> int:
+    """Bit i = 1 nếu `needed` ô liên tiếp từ i đều trống (AND bitmap với chính nó dịch phải)"""
+    result = free
+    for shift in range(1, needed):
+        result &= free >> shift
+    return result
+
+
+def rescale(bitmap: int, from_minutes: int) -> int:
+    """Đổi bitmap ghi với độ dài ô khác (VD: đổi BOOKING_SLOT_MINUTES) sang ô hiện tại"""
+    if from_minutes == SLOT_MINUTES:
+        return bitmap
+    result = 0
+    for slot in iter_bits(bitmap):
+        result |= appointment_mask(slot * from_minutes, from_minutes)
+    return result
+
+
+def to_bytes(bitmap: int) -> bytes:
+    return bitmap.to_bytes((SLOTS_PER_DAY + 7) // 8, "little")
+
+
+def from_bytes(raw: bytes | None, slot_minutes: int) -> int:
+    return rescale(int.from_bytes(raw or b"", "little"), slot_minutes)
+
+
+def parse_schedule(raw) -> list[int]:
+    """
+    availability_schedule (JSON) -> 7 bitmap giờ làm việc (thứ 2 .. chủ nhật). VD:
+      {"mon": ["08:00-12:00", "13:30-17:00"], "sat": [["08:00", "11:30"]]}
+    Khóa: mon..sun hoặc monday..sunday; mỗi khoảng là "HH:MM-HH:MM", [bắt đầu, kết thúc]
+    hoặc {"start": ..., "end": ...}.
+    """
+    if isinstance(raw, (bytes, str)):
+        raw = json.loads(raw)
+    week = [0] * 7
+    if not raw:
+        return week
+    if not isinstance(raw, dict):
+        raise ValueError("availability_schedule phải là object theo thứ trong tuần")
+    for key, ranges in raw.items():
+        weekday = _WEEKDAYS.get(str(key).strip().lower())
+        if weekday is None:
+            raise ValueError(f"Thứ không hợp lệ: {key}")
+        for item in ranges or []:
+            if isinstance(item, str):
+                start, end = item.split("-")
+            elif isinstance(item, dict):
+                start, end = item["start"], item["end"]
+            else:
+                start, end = item
+            week[weekday] |= range_mask(parse_minutes(start), parse_minutes(end))
+    return week
+
+
+# === 3. CHỈ MỤC TRONG BỘ NHỚ ===
+class _Day:
+    """Ô đã đặt của mọi nha sĩ trong 1 ngày: dạng hàng (theo nha sĩ) và dạng cột (theo ô)"""
+
+    def __init__(self):
+        self.rows: dict[int, int] = {}              # thứ tự nha sĩ -> bitmap ô đã đặt
+        self.columns: list[int] = [0] * SLOTS_PER_DAY
+        self.loaded_at = time.monotonic()
+
+    def set_row(self, ordinal: int, booked: int):
+        bit = 1 << ordinal
+        old = self.rows.get(ordinal, 0)
+        for slot in iter_bits(old & ~booked):
+            self.columns[slot] &= ~bit
+        for slot in iter_bits(booked & ~old):
+            self.columns[slot] |= bit
+        self.rows[ordinal] = booked
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self.dentist_ids: list[str] = []
+        self.ordinals: dict[str, int] = {}
+        self.schedules: dict[str, list[int]] = {}   # nha sĩ -> 7 bitmap giờ làm việc
+        # Dạng cột: _working[thứ][ô] = tập nha sĩ làm việc ở ô đó
+        self._working: list[list[int]] = [[0] * SLOTS_PER_DAY for _ in range(7)]
+        self._days: OrderedDict[date, _Day] = OrderedDict()
+        self._day_locks: dict[date, asyncio.Lock] = {}
+
+    def __len__(self):
+        return len(self.schedules)
+
+    def set_schedule(self, dentist_id: str, week: list[int] | None):
+        """Thêm / đổi / xóa (week = None) lịch làm việc của 1 nha sĩ"""
+        ordinal = self.ordinals.get(dentist_id)
+        if ordinal is None:
+            if not week:
+                return
+            ordinal = self.ordinals[dentist_id] = len(self.dentist_ids)
+            self.dentist_ids.append(dentist_id)
+        bit = 1 << ordinal
+        old = self.schedules.pop(dentist_id, [0] * 7)
+        new = week or [0] * 7
+        for weekday in range(7):
+            columns = self._working[weekday]
+            for slot in iter_bits(old[weekday] & ~new[weekday]):
+                columns[slot] &= ~bit
+            for slot in iter_bits(new[weekday] & ~old[weekday]):
+                columns[slot] |= bit
+        if week:
+            self.schedules[dentist_id] = week
+
+    def mask_of(self, dentist_ids) -> int:
+        """Tập nha sĩ (dạng bit) từ danh sách id; id không có lịch làm việc bị bỏ qua"""
+        mask = 0
+        for dentist_id in dentist_ids:
+            ordinal = self.ordinals.get(dentist_id)
+            if ordinal is not None:
+                mask |= 1 << ordinal
+        return mask
+
+    # --- Ô đã đặt theo ngày ---
+    async def day(self, day: date) -> _Day:
+        cached = self._days.get(day)
+        if cached is not None and time.monotonic() - cached.loaded_at < DAY_CACHE_TTL:
+            self._days.move_to_end(day)
+            return cached
+        # Nhiều request cùng hỏi 1 ngày hết hạn -> chỉ 1 truy vấn CSDL
+        lock = self._day_locks.setdefault(day, asyncio.Lock())
+        async with lock:
+            cached = self._days.get(day)
+            if cached is not None and time.monotonic() - cached.loaded_at < DAY_CACHE_TTL:
+                return cached
+            async with acquire_connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(_DAY_SQL, (day,))
+                    rows = await cursor.fetchall()
+            loaded = _Day()
+            for dentist_id, booked, slot_minutes in rows:
+                ordinal = self.ordinals.get(dentist_id)
+                if ordinal is not None:
+                    loaded.set_row(ordinal, from_bytes(booked, slot_minutes))
+            self._days[day] = loaded
+            self._days.move_to_end(day)
+            while len(self._days) > DAY_CACHE_SIZE:
+                evicted, _ = self._days.popitem(last=False)
+                self._day_locks.pop(evicted, None)
+            self._day_locks.pop(day, None)
+            return loaded
+
+    def update_day(self, dentist_id: str, day: date, booked: int):
+        """Ghi nhận bitmap mới ngay sau khi đặt / hủy (không chờ hết DAY_CACHE_TTL)"""
+        cached, ordinal = self._days.get(day), self.ordinals.get(dentist_id)
+        if cached is not None and ordinal is not None:
+            cached.set_row(ordinal, booked)
+
+    # --- Truy vấn ---
+    async def free_slots(self, dentist_id: str, day: date) -> int:
+        """Bitmap ô trống của 1 nha sĩ trong 1 ngày"""
+        week = self.schedules.get(dentist_id)
+        if not week:
+            return 0
+        loaded = await self.day(day)
+        return week[day.weekday()] & ~loaded.rows.get(self.ordinals[dentist_id], 0)
+
+    async def available(self, day: date, start_slot: int, end_slot: int, needed: int,
+                        candidates: int | None = None) -> dict[str, list[int]]:
+        """
+        Nha sĩ có `needed` ô trống liên tiếp, bắt đầu trong [start_slot, end_slot - needed]
+        -> {nha sĩ: [ô bắt đầu, ...]}. candidates: giới hạn tập nha sĩ (dạng bit), None = tất cả.
+        """
+        loaded = await self.day(day)
+        working = self._working[day.weekday()]
+        everyone = candidates if candidates is not None else (1 << len(self.dentist_ids)) - 1
+        free = [working[slot] & ~loaded.columns[slot] for slot in range(start_slot, end_slot)]
+        result: dict[str, list[int]] = {}
+        for offset in range(0, end_slot - start_slot - needed + 1):
+            # Tập nha sĩ trống đủ `needed` ô từ ô này: AND các cột liên tiếp
+            fits = everyone
+            for k in range(needed):
+                fits &= free[offset + k]
+                if not fits:
+                    break
+            for ordinal in iter_bits(fits):
+                result.setdefault(self.dentist_ids[ordinal], []).append(start_slot + offset)
+        return result
+
+
+index = AvailabilityIndex()
+
+
+# === 4. NẠP LỊCH LÀM VIỆC TỪ CSDL ===
+_SCHEDULE_SQL = "SELECT user_id, availability_schedule, is_verified, updated_at FROM Dentists"
+_DAY_SQL = "SELECT dentist_id, booked, slot_minutes FROM Dentist_Day_Slots WHERE slot_date = %s"
+
+
+def _apply_schedule(target: AvailabilityIndex, row) -> None:
+    dentist_id, raw, is_verified, _ = row
+    week = None
+    if is_verified and raw:
+        try:
+            week = parse_schedule(raw)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Bỏ qua lịch làm việc không hợp lệ của {dentist_id}: {e}")
+    target.set_schedule(dentist_id, week if week and any(week) else None)
+
+
+class ScheduleRefresher:
+    """Nạp toàn bộ lịch làm việc khi khởi động, sau đó định kỳ lấy các dòng có updated_at mới hơn."""
+
+    def __init__(self):
+        self.ready = False
+        self.last_sync = None
+        self.last_full_refresh = 0.0
+        self.last_error: str | None = None
+        self._task: asyncio.Task | None = None
+
+    async def full_refresh(self):
+        global index
+        async with acquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(_SCHEDULE_SQL)
+                rows = await cursor.fetchall()
+        # Dựng chỉ mục mới rồi mới thay thế (thứ tự nha sĩ có thể đổi -> bỏ cache ngày cũ)
+        fresh = AvailabilityIndex()
+        for row in rows:
+            _apply_schedule(fresh, row)
+        index = fresh
+        stamps = [row[3] for row in rows if row[3]]
+        self.last_sync = max(stamps) if stamps else None
+        self.last_full_refresh = time.monotonic()
+        self.ready = True
+        logger.info(f"Đã nạp lịch làm việc của {len(fresh)} nha sĩ")
+
+    async def incremental_refresh(self):
+        if self.last_sync is None:
+            return await self.full_refresh()
+        async with acquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(_SCHEDULE_SQL + " WHERE updated_at >= %s", (self.last_sync,))
+                rows = await cursor.fetchall()
+        known = len(index.dentist_ids)
+        for row in rows:
+            _apply_schedule(index, row)
+        if len(index.dentist_ids) != known:
+            # Nha sĩ mới chưa có trong bitmap ngày đã cache
+            index._days.clear()
+        stamps = [row[3] for row in rows if row[3]]
+        if stamps:
+            self.last_sync = max(self.last_sync, max(stamps))
+
+    async def _run(self):
+        while True:
+            try:
+                if not self.ready or time.monotonic() - self.last_full_refresh > SCHEDULE_FULL_REFRESH_INTERVAL:
+                    await self.full_refresh()
+                else:
+                    await self.incremental_refresh()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Không thể cập nhật lịch làm việc: {e}")
+            await asyncio.sleep(SCHEDULE_POLL_INTERVAL)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "dentists": len(index),
+            "cached_days": len(index._days),
+            "slot_minutes": SLOT_MINUTES,
+            "last_sync": str(self.last_sync) if self.last_sync else None,
+            "last_error": self.last_error,
+        }
+
+
+refresher = ScheduleRefresher()
+
+
+# === 5. ĐẶT / HỦY LỊCH (OPTIMISTIC CONCURRENCY) ===
+_APPOINTMENTS_OF_DAY_SQL = (
+    "SELECT appointment_datetime, duration_minutes FROM Appointments "
+    "WHERE dentist_id = %s AND appointment_datetime >= %s AND appointment_datetime < %s "
+    f"AND status IN ({', '.join(repr(s) for s in ACTIVE_STATUSES)})"
+)
+_SELECT_DAY_ROW_SQL = (
+    "SELECT booked, slot_minutes, version FROM Dentist_Day_Slots WHERE dentist_id = %s AND slot_date = %s"
+)
+_CAS_SQL = (
+    "UPDATE Dentist_Day_Slots SET booked = %s, slot_minutes = %s, version = version + 1 "
+    "WHERE dentist_id = %s AND slot_date = %s AND version = %s"
+)
+
+
+async def booked_from_appointments(cursor, dentist_id: str, day: date) -> int:
+    """Tính bitmap ô đã đặt từ bảng Appointments (dùng index (dentist_id, appointment_datetime))"""
+    start = datetime.combine(day, datetime.min.time())
+    await cursor.execute(_APPOINTMENTS_OF_DAY_SQL, (dentist_id, start, start + timedelta(days=1)))
+    booked = 0
+    for appointment_datetime, duration in await cursor.fetchall():
+        minute = appointment_datetime.hour * 60 + appointment_datetime.minute
+        booked |= appointment_mask(minute, duration or DEFAULT_DURATION_MINUTES)
+    return booked
+
+
+async def _read_day_row(cursor, dentist_id: str, day: date) -> tuple[int, int]:
+    """(bitmap ô đã đặt, version); ngày chưa có dòng thì tạo từ Appointments"""
+    await cursor.execute(_SELECT_DAY_ROW_SQL, (dentist_id, day))
+    row = await cursor.fetchone()
+    if row is None:
+        booked = await booked_from_appointments(cursor, dentist_id, day)
+        # Instance khác có thể vừa tạo cùng dòng -> IGNORE rồi đọc lại
+        await cursor.execute(
+            "INSERT IGNORE INTO Dentist_Day_Slots (dentist_id, slot_date, booked, slot_minutes) "
+            "VALUES (%s, %s, %s, %s)",
+            (dentist_id, day, to_bytes(booked), SLOT_MINUTES),
+        )
+        await cursor.execute(_SELECT_DAY_ROW_SQL, (dentist_id, day))
+        row = await cursor.fetchone()
+    booked, slot_minutes, version = row
+    return from_bytes(booked, slot_minutes), version
+
+
+async def _compare_and_swap(conn, dentist_id: str, day: date, change) -> int:
+    """
+    Vòng lặp optimistic concurrency. change(cursor, booked) -> bitmap mới: được gọi TRONG transaction,
+    ghi các dòng liên quan (Appointments) rồi trả về bitmap cần lưu, hoặc ném HTTPException.
+    Trả về bitmap đã lưu.
+    """
+    for _ in range(BOOKING_MAX_RETRIES):
+        async with conn.cursor() as cursor:
+            booked, version = await _read_day_row(cursor, dentist_id, day)
+            await conn.begin()
+            try:
+                new_booked = await change(cursor, booked)
+                updated = await cursor.execute(
+                    _CAS_SQL, (to_bytes(new_booked), SLOT_MINUTES, dentist_id, day, version)
+                )
+                if not updated:
+                    # Có người vừa đặt / hủy trong cùng ngày -> đọc lại và thử lại
+                    await conn.rollback()
+                    continue
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+        index.update_day(dentist_id, day, new_booked)
+        return new_booked
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Lịch của nha sĩ đang được đặt liên tục, vui lòng thử lại",
+    )
+
+
+async def reserve(conn, dentist_id: str, start: datetime, duration_minutes: int, insert_appointment) -> int:
+    """
+    Giữ các ô của lịch hẹn [start, start + duration) rồi gọi insert_appointment(cursor) trong cùng
+    transaction. Ô ngoài giờ làm việc hoặc đã bị đặt -> 409.
+    """
+    minute = start.hour * 60 + start.minute
+    mask = appointment_mask(minute, duration_minutes)
+    week = index.schedules.get(dentist_id)
+    if not week or week[start.weekday()] & mask != mask:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ngoài giờ làm việc của nha sĩ")
+
+    async def change(cursor, booked: int) -> int:
+        if booked & mask:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Khung giờ này đã có người đặt")
+        await insert_appointment(cursor)
+        return booked | mask
+
+    return await _compare_and_swap(conn, dentist_id, start.date(), change)
+
+
+async def release(conn, dentist_id: str, day: date, update_appointment) -> int:
+    """
+    Gọi update_appointment(cursor) (VD: chuyển sang Cancelled) rồi tính lại bitmap của ngày từ
+    Appointments trong cùng transaction (không chỉ xóa bit: lịch hẹn cũ có thể chồng nhau).
+    """
+    async def change(cursor, booked: int) -> int:
+        await update_appointment(cursor)
+        return await booked_from_appointments(cursor, dentist_id, day)
+
+    return await _compare_and_swap(conn, dentist_id, day, change)
+
+
+# === 6. DỰNG LẠI BITMAP (SAU MIGRATION / SỬA DỮ LIỆU BẰNG TAY) ===
+async def rebuild(conn, since: date) -> int:
+    """Tính lại Dentist_Day_Slots cho mọi (nha sĩ, ngày) có lịch hẹn từ `since` trở đi"""
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT DISTINCT dentist_id, DATE(appointment_datetime) FROM Appointments "
+            "WHERE appointment_datetime >= %s AND dentist_id IS NOT NULL",
+            (datetime.combine(since, datetime.min.time()),),
+        )
+        pairs = await cursor.fetchall()
+        for dentist_id, day in pairs:
+            booked = await booked_from_appointments(cursor, dentist_id, day)
+            await cursor.execute(
+                "INSERT INTO Dentist_Day_Slots (dentist_id, slot_date, booked, slot_minutes) "
+                "VALUES (%s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE booked = VALUES(booked), slot_minutes = VALUES(slot_minutes), "
+                "version = version + 1",
+                (dentist_id, day, to_bytes(booked), SLOT_MINUTES),
+            )
+    return len(pairs)
+
+
+async def _main(args: list[str]):
+    from .._shared.migrate import connect
+
+    if not args or args[0] != "rebuild":
+        print("Cách dùng: python -m services.booking_service.availability rebuild [YYYY-MM-DD]")
+        sys.exit(1)
+    since = date.fromisoformat(args[1]) if len(args) > 1 else date.today()
+    conn = await connect()
+    try:
+        print(f"Đã dựng lại {await rebuild(conn, since)} ngày lịch")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
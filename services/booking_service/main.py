@@ -0,0 +1,61 @@
+# File: /services/booking_service/main.py
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
+from . import routes # Import file routes.py
+from .._shared.db import init_db_pool, close_db_pool, get_pool_stats
+from .._shared.json_response import ORJSONResponse
+from .._shared.metrics import MetricsMiddleware, metrics_response
+from .._shared.security import require_internal
+from .._shared.startup import wait_until_ready
+from .._shared.token_cache import revocation_sync
+from .availability import refresher
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Khởi tạo pool kết nối CSDL trước khi nhận request
+    try:
+        await init_db_pool()
+    except Exception as e:
+        # CSDL chưa sẵn sàng: service vẫn chạy, pool sẽ được tạo lại ở request đầu tiên
+        logger.warning(f"Không thể khởi tạo pool CSDL: {e}")
+    # Nạp lịch làm việc của nha sĩ ở nền (không chặn việc nhận request)
+    refresher.start()
+    # Token bị thu hồi (đăng xuất / đổi mật khẩu) cũng không được đặt lịch
+    revocation_sync.start()
+    # Chạy bằng launcher: chờ lịch làm việc nạp xong rồi mới nhận request
+    await wait_until_ready(refresher)
+    yield
+    await revocation_sync.stop()
+    await refresher.stop()
+    # Đóng pool khi service tắt
+    await close_db_pool()
+
+# Mã hóa JSON bằng orjson; nén response chỉ làm 1 lần ở API Gateway
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Đo thời gian request + mã request (X-Request-ID); đặt ngoài cùng nên thêm sau cùng
+app.add_middleware(MetricsMiddleware)
+
+# Bao gồm các router từ file routes.py
+app.include_router(routes.router)
+
+@app.get("/")
+def read_root():
+    return {"service": "Booking Service (Python-Only)"}
+
+@app.get("/db-pool", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_db_pool_stats():
+    """Số liệu pool kết nối CSDL (in-use, waiters, độ trễ lấy kết nối)"""
+    return get_pool_stats()
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_metrics():
+    """Số liệu dạng Prometheus (độ trễ theo route, truy vấn CSDL, bcrypt...)"""
+    return metrics_response()
+
+if __name__ == "__main__":
+    import uvicorn  # Chỉ cần khi chạy trực tiếp (launcher / uvicorn CLI tự import)
+    uvicorn.run(app, host="127.0.0.1", port=8003)
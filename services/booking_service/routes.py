@@ -0,0 +1,265 @@
+# File: /services/booking_service/routes.py
+from fastapi import APIRouter, Depends, Response, status, HTTPException, Query
+from .._shared.db import get_db_connection, get_write_connection
+from .._shared.security import get_current_user, TokenPayload
+from .._shared.json_response import ORJSONResponse
+from . import availability
+from .availability import (
+    SLOT_MINUTES,
+    DEFAULT_DURATION_MINUTES,
+    ACTIVE_STATUSES,
+    parse_minutes,
+    format_slot,
+    slots_needed,
+    start_slots,
+    iter_bits,
+)
+from pydantic import BaseModel, Field
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import aiomysql
+import uuid
+
+router = APIRouter()
+
+# === 1. ĐỊNH NGHĨA CÁC BASEMODEL ===
+
+class AppointmentCreate(BaseModel):
+    """
+    Body dùng cho API POST /appointments
+    """
+    dentist_id: str
+    clinic_id: str
+    service_id: Optional[str] = None  # Thời lượng lấy từ Services.expected_duration_minutes
+    appointment_datetime: datetime    # Giờ địa phương, phải rơi vào đầu 1 ô (BOOKING_SLOT_MINUTES)
+    notes: Optional[str] = Field(None, max_length=2000)
+
+
+# === 2. HÀM PHỤ TRỢ ===
+
+def _require_ready():
+    if not availability.refresher.ready:
+        raise HTTPException(status_code=503, detail="Lịch làm việc đang được nạp, vui lòng thử lại sau")
+
+
+async def _duration(conn, service_id: Optional[str], duration_minutes: Optional[int]) -> int:
+    """Thời lượng lịch hẹn: theo dịch vụ, hoặc do client chỉ định, hoặc mặc định"""
+    if service_id is None:
+        return duration_minutes or DEFAULT_DURATION_MINUTES
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT expected_duration_minutes FROM Services WHERE service_id = %s", (service_id,)
+        )
+        row = await cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy dịch vụ")
+    return row[0] or DEFAULT_DURATION_MINUTES
+
+
+def _window(start: str, end: str) -> tuple[int, int]:
+    try:
+        start_minute, end_minute = parse_minutes(start), parse_minutes(end)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if end_minute <= start_minute:
+        raise HTTPException(status_code=422, detail="Giờ kết thúc phải sau giờ bắt đầu")
+    # Ô bắt đầu từ start (làm tròn lên), kết thúc trước end (làm tròn xuống)
+    return -(-start_minute // SLOT_MINUTES), end_minute // SLOT_MINUTES
+
+
+def _first_open_slot(day: date) -> int:
+    """
+    Ô đầu tiên của `day` còn đặt được. Hôm nay: bỏ các ô bắt đầu từ bây giờ trở về trước
+    (POST /appointments từ chối chúng với 422).
+    """
+    now = datetime.now()
+    if day != now.date():
+        return 0
+    elapsed = now - datetime.combine(day, datetime.min.time())
+    return int(elapsed.total_seconds() // (SLOT_MINUTES * 60)) + 1
+
+
+# === 3. TRA LỊCH TRỐNG ===
+
+@router.get("/availability")
+async def get_availability(
+    day: date = Query(..., alias="date", description="Ngày cần đặt (YYYY-MM-DD)"),
+    start: str = Query("00:00", description="Bắt đầu tìm từ (HH:MM)"),
+    end: str = Query("24:00", description="Lịch hẹn phải kết thúc trước (HH:MM)"),
+    service_id: Optional[str] = Query(None, max_length=50),
+    duration_minutes: Optional[int] = Query(None, ge=1, le=480, description="Bỏ qua nếu có service_id"),
+    clinic_id: Optional[str] = Query(None, max_length=50, description="Chỉ nha sĩ của phòng khám này"),
+    dentist_id: Optional[List[str]] = Query(None, description="Chỉ các nha sĩ này (lặp lại tham số)"),
+    conn: aiomysql.Connection = Depends(get_db_connection)
+):
+    """
+    Nha sĩ nào trống trong khung giờ của 1 ngày, kèm các giờ bắt đầu có thể đặt.
+    VD: /availability?date=2025-06-10&start=09:00&end=11:00&service_id=serv_1
+    """
+    _require_ready()
+    first_slot, end_slot = _window(start, end)
+    first_slot = max(first_slot, _first_open_slot(day))
+    duration = await _duration(conn, service_id, duration_minutes)
+    needed = slots_needed(duration)
+
+    index = availability.index
+    candidates = None
+    if dentist_id:
+        candidates = index.mask_of(dentist_id)
+    if clinic_id is not None:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT dentist_id FROM Clinic_Dentists WHERE clinic_id = %s", (clinic_id,))
+            clinic_mask = index.mask_of(row[0] for row in await cursor.fetchall())
+        candidates = clinic_mask if candidates is None else candidates & clinic_mask
+
+    found = {}
+    if day >= date.today() and candidates != 0:
+        found = await index.available(day, first_slot, end_slot, needed, candidates)
+    dentists = sorted(found.items(), key=lambda item: (item[1][0], item[0]))
+    return ORJSONResponse({
+        "date": day.isoformat(),
+        "duration_minutes": duration,
+        "slot_minutes": SLOT_MINUTES,
+        "dentists": [
+            {"dentist_id": dentist, "slots": [format_slot(slot) for slot in slots]}
+            for dentist, slots in dentists
+        ],
+    })
+
+
+@router.get("/dentists/{dentist_id}/availability")
+async def get_dentist_availability(
+    dentist_id: str,
+    day: date = Query(..., alias="date"),
+    days: int = Query(1, ge=1, le=31, description="Số ngày liên tiếp kể từ `date`"),
+    service_id: Optional[str] = Query(None, max_length=50),
+    duration_minutes: Optional[int] = Query(None, ge=1, le=480),
+    conn: aiomysql.Connection = Depends(get_db_connection)
+):
+    """Các giờ bắt đầu còn đặt được của 1 nha sĩ, theo từng ngày"""
+    _require_ready()
+    if dentist_id not in availability.index.schedules:
+        raise HTTPException(status_code=404, detail="Nha sĩ không tồn tại hoặc chưa có lịch làm việc")
+    duration = await _duration(conn, service_id, duration_minutes)
+    needed = slots_needed(duration)
+
+    result = []
+    for offset in range(days):
+        current = day + timedelta(days=offset)
+        slots = []
+        if current >= date.today():
+            free = await availability.index.free_slots(dentist_id, current)
+            first_slot = _first_open_slot(current)
+            starts = start_slots(free, needed) >> first_slot << first_slot
+            slots = [format_slot(slot) for slot in iter_bits(starts)]
+        result.append({"date": current.isoformat(), "slots": slots})
+    return ORJSONResponse({"dentist_id": dentist_id, "duration_minutes": duration, "days": result})
+
+
+@router.get("/availability/status")
+async def get_availability_status():
+    """Trạng thái chỉ mục lịch làm việc trong bộ nhớ"""
+    return availability.refresher.status()
+
+
+# === 4. ĐẶT / HỦY LỊCH ===
+
+@router.post("/appointments", status_code=status.HTTP_201_CREATED)
+async def create_appointment(
+    body: AppointmentCreate,
+    response: Response,
+    user: TokenPayload = Depends(get_current_user),
+    conn: aiomysql.Connection = Depends(get_write_connection)
+):
+    """
+    Đặt lịch (khách hàng đã đăng nhập). Ô thời gian được giữ bằng optimistic concurrency
+    trên Dentist_Day_Slots -> 2 người đặt cùng lúc thì 1 người nhận 409.
+    """
+    if user.role != "CUSTOMER":
+        raise HTTPException(status_code=403, detail="Chỉ khách hàng mới được đặt lịch")
+    _require_ready()
+    start = body.appointment_datetime.replace(tzinfo=None, second=0, microsecond=0)
+    minute = start.hour * 60 + start.minute
+    if minute % SLOT_MINUTES:
+        raise HTTPException(status_code=422, detail=f"Giờ hẹn phải là bội số của {SLOT_MINUTES} phút")
+    if start <= datetime.now():
+        raise HTTPException(status_code=422, detail="Không thể đặt lịch trong quá khứ")
+
+    try:
+        duration = await _duration(conn, body.service_id, None)
+        if minute + duration > 24 * 60:
+            raise HTTPException(status_code=422, detail="Lịch hẹn không được kéo sang ngày hôm sau")
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT 1 FROM Clinic_Dentists WHERE clinic_id = %s AND dentist_id = %s",
+                (body.clinic_id, body.dentist_id),
+            )
+            if await cursor.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Nha sĩ không làm việc tại phòng khám này")
+
+        appointment_id = f"app_{uuid.uuid4().hex[:12]}"
+
+        async def insert_appointment(cursor):
+            await cursor.execute(
+                """
+                INSERT INTO Appointments (appointment_id, customer_id, dentist_id, clinic_id, service_id,
+                                          appointment_datetime, duration_minutes, status, notes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'Pending', %s)
+                """,
+                (appointment_id, user.sub, body.dentist_id, body.clinic_id, body.service_id,
+                 start, duration, body.notes),
+            )
+
+        await availability.reserve(conn, body.dentist_id, start, duration, insert_appointment)
+        return {
+            "message": "Đặt lịch thành công",
+            "appointment_id": appointment_id,
+            "appointment_datetime": start.isoformat(),
+            "duration_minutes": duration,
+            "status": "Pending",
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        response.status_code = 500
+        return {"error": "Lỗi đặt lịch", "details": str(e)}
+
+
+@router.post("/appointments/{appointment_id}/cancel")
+async def cancel_appointment(
+    appointment_id: str,
+    response: Response,
+    user: TokenPayload = Depends(get_current_user),
+    conn: aiomysql.Connection = Depends(get_write_connection)
+):
+    """Hủy lịch (khách hàng đã đặt hoặc nha sĩ của lịch hẹn); ô thời gian được trả lại"""
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(
+                "SELECT customer_id, dentist_id, appointment_datetime, status FROM Appointments "
+                "WHERE appointment_id = %s",
+                (appointment_id,),
+            )
+            appointment = await cursor.fetchone()
+        if appointment is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy lịch hẹn")
+        if user.sub not in (appointment["customer_id"], appointment["dentist_id"]) and user.role != "ADMIN":
+            raise HTTPException(status_code=403, detail="Không có quyền hủy lịch hẹn này")
+        if appointment["status"] not in ACTIVE_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Lịch hẹn đang ở trạng thái {appointment['status']}")
+
+        async def mark_cancelled(cursor):
+            await cursor.execute(
+                "UPDATE Appointments SET status = 'Cancelled' WHERE appointment_id = %s",
+                (appointment_id,),
+            )
+
+        await availability.release(
+            conn, appointment["dentist_id"], appointment["appointment_datetime"].date(), mark_cancelled
+        )
+        return {"message": "Đã hủy lịch hẹn", "appointment_id": appointment_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        response.status_code = 500
+        return {"error": "Lỗi hủy lịch", "details": str(e)}
@@ -0,0 +1,329 @@
+# File: /services/search_service/cache.py
+# Bộ đệm (cache) kết quả cho các API đọc nhiều, ít thay đổi (/clinics, /dentists/{id}).
+# - LRU + TTL, lưu giá trị dạng JSON bytes (orjson) nên dùng chung được cho mọi backend
+#   và trả thẳng cho client được (get_or_load_raw)
+# - Single-flight: nhiều request cùng hỏi 1 key chưa có trong cache chỉ gây ra 1 truy vấn CSDL
+# - Backend thay thế được: trong process (mặc định) hoặc server nói giao thức Redis (RESP)
+# - Có hàm invalidate() để xóa chủ động khi dữ liệu thay đổi
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from pydantic_settings import BaseSettings
+
+from .._shared.json_response import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+# === 1. CẤU HÌNH (đọc từ .env giống services/_shared/db.py) ===
+class CacheSettings(BaseSettings):
+    CACHE_BACKEND: str = "memory"        # "memory" hoặc "redis"
+    CACHE_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    CACHE_DEFAULT_TTL: float = 60.0      # (giây)
+    CACHE_MAX_ENTRIES: int = 10000       # Chỉ áp dụng cho backend "memory"
+    CACHE_KEY_PREFIX: str = "fmd:search:"
+    class Config:
+        env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')
+        extra = "ignore"
+
+cache_settings = CacheSettings()
+
+
+# === 2. BACKEND TRONG PROCESS ===
+class MemoryBackend:
+    """LRU có TTL trong bộ nhớ. Mọi thao tác đồng bộ nên an toàn trong 1 event loop."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()  # key -> (hết hạn, giá trị)
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)  # Bỏ key lâu nhất chưa được dùng
+            self.evictions += 1
+
+    async def delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        keys = [key for key in self._data if key.startswith(prefix)]
+        return await self.delete(*keys)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# === 3. BACKEND GIAO THỨC REDIS (RESP) ===
+class RedisProtocolError(Exception):
+    pass
+
+
+class RedisBackend:
+    """
+    Client RESP tối giản (GET / SET PX / DEL / SCAN) trên 1 kết nối asyncio.
+    Làm việc với Redis, Valkey, KeyDB hoặc bất kỳ server giả lập nào nói giao thức RESP.
+    Việc loại bỏ theo LRU/TTL do server đảm nhiệm (cấu hình maxmemory-policy phía server).
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()  # 1 kết nối -> mỗi lúc chỉ 1 lệnh
+        self.errors = 0
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        try:
+            if self.password:
+                await self._roundtrip("AUTH", self.password)
+            if self.db:
+                await self._roundtrip("SELECT", str(self.db))
+        except BaseException:
+            # Chưa AUTH/SELECT xong thì kết nối không dùng được
+            self._drop()
+            raise
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Kết nối tới cache server bị đóng")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisProtocolError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            if count == -1:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RedisProtocolError(f"Phản hồi không hợp lệ: {line!r}")
+
+    async def _roundtrip(self, *args):
+        self._writer.write(self._encode(*args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout)
+
+    async def execute(self, *args):
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._roundtrip(*args)
+            except RedisProtocolError:
+                # Server trả lỗi cho lệnh (-ERR ...): phản hồi đã đọc hết, kết nối vẫn dùng được
+                raise
+            except BaseException as e:
+                # Kết nối hỏng, hoặc lệnh bị hủy (CancelledError/timeout) khi phản hồi chưa đọc xong:
+                # phản hồi đó sẽ bị đọc nhầm thành kết quả của lệnh sau -> bỏ kết nối, lần sau kết nối lại
+                if isinstance(e, Exception):
+                    self.errors += 1
+                self._drop()
+                raise
+
+    def _drop(self):
+        """Bỏ kết nối ngay, không await (dùng được cả khi task đang bị hủy)"""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        writer = self._writer
+        self._drop()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.execute("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.execute("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def delete(self, *keys: str) -> int:
+        if not keys:
+            return 0
+        return await self.execute("DEL", *keys)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        deleted, cursor = 0, "0"
+        while True:
+            cursor, keys = await self.execute("SCAN", cursor, "MATCH", prefix + "*", "COUNT", 500)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else str(cursor)
+            if keys:
+                deleted += await self.delete(*[k.decode() for k in keys])
+            if cursor == "0":
+                return deleted
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "server": f"{self.host}:{self.port}/{self.db}", "errors": self.errors}
+
+
+# === 4. LỚP CACHE DÙNG TRONG ROUTES ===
+class ResponseCache:
+    def __init__(self, backend, default_ttl: float, key_prefix: str = ""):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.key_prefix = key_prefix
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0      # Số request được gộp vào 1 lần nạp đang chạy
+        self.backend_errors = 0
+
+    async def _backend_get(self, key: str):
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            # Cache lỗi không được làm hỏng request -> coi như miss
+            self.backend_errors += 1
+            logger.warning(f"Lỗi đọc cache: {e}")
+            return None
+
+    async def get_or_load(self, key: str, loader, ttl: float | None = None):
+        """
+        Trả về giá trị của key; nếu chưa có thì gọi `await loader()` (chỉ 1 lần cho mọi request
+        đồng thời) và lưu kết quả. Loader ném exception thì không lưu gì và lỗi được trả cho mọi
+        request đang chờ.
+        """
+        return loads(await self.get_or_load_raw(key, loader, ttl))
+
+    async def get_or_load_raw(self, key: str, loader, ttl: float | None = None) -> bytes:
+        """Giống get_or_load nhưng trả về JSON bytes như đã lưu (trả thẳng cho client, không mã hóa lại)"""
+        full_key = self.key_prefix + key
+        raw = await self._backend_get(full_key)
+        if raw is not None:
+            self.hits += 1
+            return raw
+
+        inflight = self._inflight.get(full_key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Request đang nạp bị hủy (client ngắt kết nối) chứ không phải request này -> nạp lại
+                if inflight.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.get_or_load_raw(key, loader, ttl)
+                raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            raw = dumps(await loader())
+            try:
+                await self.backend.set(full_key, raw, ttl or self.default_ttl)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning(f"Lỗi ghi cache: {e}")
+            future.set_result(raw)
+            return raw
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Đánh dấu đã xử lý khi không có request nào khác đang chờ
+            raise
+        finally:
+            self._inflight.pop(full_key, None)
+
+    # --- Hook xóa cache chủ động ---
+    async def invalidate(self, *keys: str) -> int:
+        try:
+            return await self.backend.delete(*[self.key_prefix + key for key in keys])
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Lỗi xóa cache: {e}")
+            return 0
+
+    async def invalidate_prefix(self, prefix: str) -> int:
+        try:
+            return await self.backend.delete_prefix(self.key_prefix + prefix)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Lỗi xóa cache: {e}")
+            return 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "backend_errors": self.backend_errors,
+            "inflight": len(self._inflight),
+            **self.backend.stats(),
+        }
+
+
+def _create_backend():
+    if cache_settings.CACHE_BACKEND == "redis":
+        return RedisBackend(cache_settings.CACHE_REDIS_URL)
+    return MemoryBackend(cache_settings.CACHE_MAX_ENTRIES)
+
+
+response_cache = ResponseCache(
+    _create_backend(), cache_settings.CACHE_DEFAULT_TTL, cache_settings.CACHE_KEY_PREFIX
+)
+
+# Key dùng trong routes (đặt ở đây để các nơi invalidate dùng chung)
+CLINICS_KEY = "clinics"
+
+
+def dentist_key(dentist_id: str) -> str:
+    return f"dentist:{dentist_id}"
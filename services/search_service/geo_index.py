@@ -0,0 +1,127 @@
+# File: /services/search_service/geo_index.py
+# Chỉ mục không gian dạng lưới (grid) cho câu hỏi "phòng khám gần tôi".
+# Mặt phẳng kinh/vĩ độ được chia thành các ô CELL_SIZE_DEG độ; mỗi ô giữ danh sách phòng khám.
+# Truy vấn duyệt các ô theo vòng tròn đồng tâm quanh điểm cần tìm và dừng khi đã đủ k kết quả
+# -> không phụ thuộc tổng số phòng khám.
+# Dữ liệu được nạp/cập nhật cùng lúc với chỉ mục toàn văn (xem text_index.IndexRefresher).
+
+import heapq
+import math
+
+CELL_SIZE_DEG = 0.05     # ~5.5 km mỗi ô theo vĩ độ
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Khoảng cách đường tròn lớn giữa 2 điểm (km)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+_HALF_COLS = round(180 / CELL_SIZE_DEG)  # Số ô theo kinh độ của nửa vòng Trái Đất
+
+
+def _wrap_col(col: int) -> int:
+    """Cột ô trong [-_HALF_COLS, _HALF_COLS): kinh độ 180 và -180 là cùng 1 chỗ (qua đường đổi ngày)"""
+    return (col + _HALF_COLS) % (2 * _HALF_COLS) - _HALF_COLS
+
+
+def _cell(lat: float, lng: float) -> tuple[int, int]:
+    return math.floor(lat / CELL_SIZE_DEG), _wrap_col(math.floor(lng / CELL_SIZE_DEG))
+
+
+class GeoGridIndex:
+    def __init__(self):
+        self.cells: dict[tuple[int, int], set[str]] = {}
+        self.points: dict[str, tuple[float, float]] = {}  # id -> (lat, lng)
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, item_id: str, lat: float, lng: float):
+        self.remove(item_id)
+        self.points[item_id] = (lat, lng)
+        self.cells.setdefault(_cell(lat, lng), set()).add(item_id)
+
+    def remove(self, item_id: str):
+        point = self.points.pop(item_id, None)
+        if point is None:
+            return
+        key = _cell(*point)
+        members = self.cells.get(key)
+        if members is not None:
+            members.discard(item_id)
+            if not members:
+                del self.cells[key]
+
+    def iter_nearest(self, lat: float, lng: float, radius_km: float):
+        """
+        Duyệt các điểm trong bán kính theo thứ tự khoảng cách tăng dần: yield (km, id).
+        Mở rộng dần từng vòng ô quanh ô chứa (lat, lng); 1 điểm chỉ được trả ra khi chắc chắn
+        không còn điểm nào gần hơn ở các vòng chưa duyệt. Người gọi dừng sớm khi đã đủ k kết quả,
+        nên chi phí chỉ phụ thuộc mật độ phòng khám quanh điểm cần tìm.
+        Số ô duyệt không vượt quá số ô đang có dữ liệu (gần cực khung bao rất rộng theo kinh độ).
+        """
+        dlat = radius_km / KM_PER_DEG_LAT
+        center_row, center_col = _cell(lat, lng)
+        # Khung bao (theo số ô) quanh ô chứa điểm cần tìm: ngoài khung không có điểm nào trong bán kính.
+        # Vòng tròn chứa cực -> khung phủ mọi kinh độ
+        if abs(lat) + dlat >= 90.0:
+            col_span = _HALF_COLS
+        else:
+            sin_ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+            dlng = math.degrees(math.asin(min(1.0, sin_ratio)))
+            col_span = min(math.ceil(dlng / CELL_SIZE_DEG) + 1, _HALF_COLS)
+        row_span = math.ceil(dlat / CELL_SIZE_DEG) + 1
+
+        if (2 * row_span + 1) * (2 * col_span + 1) > len(self.cells):
+            # Khung bao nhiều ô hơn số ô đang có dữ liệu (gần cực, dữ liệu thưa) -> duyệt thẳng các ô có dữ liệu:
+            # chi phí không vượt quá số phòng khám thay vì hàng triệu ô rỗng
+            heap = [
+                (distance, item_id)
+                for (row, col), members in self.cells.items()
+                if abs(row - center_row) <= row_span and abs(_wrap_col(col - center_col)) <= col_span
+                for item_id in members
+                if (distance := haversine_km(lat, lng, *self.points[item_id])) <= radius_km
+            ]
+            heapq.heapify(heap)
+            while heap:
+                yield heapq.heappop(heap)
+            return
+
+        max_ring = max(row_span, col_span)
+        # Cạnh ngắn nhất của 1 ô trong khung (km) -> khoảng cách tối thiểu tới vòng ô kế tiếp
+        cell_km = CELL_SIZE_DEG * KM_PER_DEG_LAT * math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+
+        heap: list[tuple[float, str]] = []
+        for ring in range(max_ring + 1):
+            for row in range(center_row - min(ring, row_span), center_row + min(ring, row_span) + 1):
+                if abs(row - center_row) == ring:
+                    offsets = range(-min(ring, col_span), min(ring, col_span) + 1)
+                elif ring <= col_span:
+                    offsets = (-ring, ring)  # Chỉ 2 cạnh bên của vòng
+                else:
+                    continue
+                for offset in offsets:
+                    if offset == _HALF_COLS:
+                        continue  # Trùng với ô -_HALF_COLS (đã duyệt)
+                    for item_id in self.cells.get((row, _wrap_col(center_col + offset)), ()):
+                        p_lat, p_lng = self.points[item_id]
+                        distance = haversine_km(lat, lng, p_lat, p_lng)
+                        if distance <= radius_km:
+                            heapq.heappush(heap, (distance, item_id))
+            safe_distance = ring * cell_km
+            while heap and heap[0][0] <= safe_distance:
+                yield heapq.heappop(heap)
+            if safe_distance > radius_km:
+                break
+        while heap:
+            yield heapq.heappop(heap)
+
+
+# Chỉ mục vị trí các phòng khám đã xác thực
+clinics = GeoGridIndex()
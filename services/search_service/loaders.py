@@ -0,0 +1,195 @@
+# File: /services/search_service/loaders.py
+# Gom truy vấn theo lô (kiểu DataLoader) cho các API trả về tài liệu ghép nhiều bảng.
+# - Mỗi request có 1 bộ Loaders riêng (dependency get_loaders), dùng chung 1 kết nối CSDL;
+#   lô còn dở bị hủy trước khi kết nối được trả về pool
+# - loader.load(key) không truy vấn ngay: mọi key được yêu cầu trong cùng 1 vòng event loop
+#   (VD: trong asyncio.gather) được gom lại thành 1 câu `... WHERE <cột> IN (...)`
+# - Key đã tải được nhớ trong request -> tải lại không tốn truy vấn
+# - Mỗi request chỉ được chạy tối đa LOADER_MAX_BATCHES lô: handler lỡ await từng key trong
+#   vòng lặp (N+1) sẽ lỗi ngay khi phát triển thay vì âm thầm chậm dần theo dữ liệu
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Hashable
+
+import aiomysql
+from fastapi import Depends
+
+from .._shared.db import get_read_connection
+
+LOADER_MAX_BATCHES = int(os.getenv("LOADER_MAX_BATCHES", "12"))
+LOADER_MAX_BATCH_SIZE = int(os.getenv("LOADER_MAX_BATCH_SIZE", "500"))  # Số key tối đa trong 1 IN (...)
+
+
+class TooManyQueriesError(RuntimeError):
+    """Request vượt quá số lô truy vấn cho phép (dấu hiệu N+1)"""
+
+
+class DataLoader:
+    def __init__(self, batch_fn: Callable[[list], Awaitable[dict]], budget: "Loaders", default=None):
+        # batch_fn(keys) -> {key: giá trị}; key không có trong kết quả nhận `default`
+        self._batch_fn = batch_fn
+        self._budget = budget
+        self._default = default
+        self._cache: dict[Hashable, asyncio.Future] = {}
+        self._queue: list[Hashable] = []
+
+    def load(self, key) -> asyncio.Future:
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._cache[key] = loop.create_future()
+            if not self._queue:
+                # Task được giữ trong Loaders để hủy/chờ trước khi kết nối về pool (xem Loaders.aclose)
+                self._budget.track(asyncio.ensure_future(self._dispatch()))
+            self._queue.append(key)
+        return future
+
+    async def load_many(self, keys) -> list:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def cancel(self):
+        """Hủy các key chưa tải xong (request đã kết thúc, không còn ai chờ)"""
+        self._queue = []
+        for future in self._cache.values():
+            if not future.done():
+                future.cancel()
+
+    async def _dispatch(self):
+        # Chờ hết vòng event loop hiện tại để gom các key khác rồi mới truy vấn
+        await asyncio.sleep(0)
+        keys, self._queue = self._queue, []
+        for start in range(0, len(keys), LOADER_MAX_BATCH_SIZE):
+            chunk = keys[start:start + LOADER_MAX_BATCH_SIZE]
+            try:
+                self._budget.spend()
+                results = await self._batch_fn(chunk)
+            except Exception as e:
+                for key in chunk:
+                    if not self._cache[key].done():
+                        self._cache[key].set_exception(e)
+                continue
+            for key in chunk:
+                if not self._cache[key].done():
+                    self._cache[key].set_result(results.get(key, self._default))
+
+
+def _placeholders(keys: list) -> str:
+    return ", ".join(["%s"] * len(keys))
+
+
+def _group(rows, key_column: str) -> dict:
+    """Gom các dòng theo 1 cột (quan hệ 1-nhiều), bỏ cột khóa khỏi từng dòng"""
+    grouped: dict = {}
+    for row in rows:
+        row = dict(row)
+        grouped.setdefault(row.pop(key_column), []).append(row)
+    return grouped
+
+
+# === CÁC TRUY VẤN THEO LÔ ===
+_DENTIST_COLUMNS = (
+    "u.user_id, u.first_name, u.last_name, d.specialization, d.bio, d.years_of_exp, "
+    "d.average_rating, d.rating_count"
+)
+_CLINIC_COLUMNS = (
+    "c.clinic_id, c.name, c.address, c.description, c.images, c.average_rating, c.rating_count, "
+    "c.latitude, c.longitude"
+)
+_SERVICE_COLUMNS = "s.service_id, s.name, s.min_price, s.max_price, s.expected_duration_minutes"
+
+DENTISTS_SQL = (
+    f"SELECT {_DENTIST_COLUMNS} FROM Dentists d JOIN Users u ON u.user_id = d.user_id "
+    "WHERE d.is_verified = TRUE AND d.user_id IN ({})"
+)
+CLINICS_SQL = f"SELECT {_CLINIC_COLUMNS} FROM Clinics c WHERE c.is_verified = TRUE AND c.clinic_id IN ({{}})"
+CLINICS_OF_DENTISTS_SQL = (
+    f"SELECT cd.dentist_id, {_CLINIC_COLUMNS} FROM Clinic_Dentists cd "
+    "JOIN Clinics c ON c.clinic_id = cd.clinic_id "
+    "WHERE c.is_verified = TRUE AND cd.dentist_id IN ({}) ORDER BY c.name"
+)
+DENTISTS_OF_CLINICS_SQL = (
+    f"SELECT cd.clinic_id, {_DENTIST_COLUMNS} FROM Clinic_Dentists cd "
+    "JOIN Dentists d ON d.user_id = cd.dentist_id JOIN Users u ON u.user_id = d.user_id "
+    "WHERE d.is_verified = TRUE AND cd.clinic_id IN ({}) ORDER BY d.rating_score DESC, u.user_id"
+)
+SERVICES_OF_DENTISTS_SQL = (
+    f"SELECT ds.dentist_id, {_SERVICE_COLUMNS} FROM Dentist_Services ds "
+    "JOIN Services s ON s.service_id = ds.service_id WHERE ds.dentist_id IN ({}) ORDER BY s.name"
+)
+SERVICES_OF_CLINICS_SQL = (
+    f"SELECT cs.clinic_id, {_SERVICE_COLUMNS} FROM Clinic_Services cs "
+    "JOIN Services s ON s.service_id = cs.service_id WHERE cs.clinic_id IN ({}) ORDER BY s.name"
+)
+
+
+class Loaders:
+    """Bộ DataLoader của 1 request (không dùng chung giữa các request)"""
+
+    def __init__(self, conn: aiomysql.Connection, max_batches: int = LOADER_MAX_BATCHES):
+        self.conn = conn
+        self.max_batches = max_batches
+        self.batches = 0
+        self._loaders: list[DataLoader] = []
+        self._tasks: set[asyncio.Task] = set()  # Các lô đang chờ/chạy truy vấn
+        self.dentist = self._loader(self._by_key(DENTISTS_SQL, "user_id"))
+        self.clinic = self._loader(self._by_key(CLINICS_SQL, "clinic_id"))
+        self.clinics_of_dentist = self._loader(self._grouped(CLINICS_OF_DENTISTS_SQL, "dentist_id"), [])
+        self.dentists_of_clinic = self._loader(self._grouped(DENTISTS_OF_CLINICS_SQL, "clinic_id"), [])
+        self.services_of_dentist = self._loader(self._grouped(SERVICES_OF_DENTISTS_SQL, "dentist_id"), [])
+        self.services_of_clinic = self._loader(self._grouped(SERVICES_OF_CLINICS_SQL, "clinic_id"), [])
+        # 1 kết nối chỉ chạy được 1 truy vấn tại 1 thời điểm
+        self._lock = asyncio.Lock()
+
+    def _loader(self, batch_fn, default=None) -> DataLoader:
+        loader = DataLoader(batch_fn, self, default)
+        self._loaders.append(loader)
+        return loader
+
+    def track(self, task: asyncio.Task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self):
+        """
+        Hủy các lô còn dở rồi chờ chúng dừng hẳn trước khi kết nối về pool. VD: gather trong handler
+        lỗi ở 1 nhánh (hoặc client ngắt) thì nhánh khác vẫn có thể đang truy vấn trên kết nối này.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for loader in self._loaders:
+            loader.cancel()
+
+    def spend(self):
+        self.batches += 1
+        if self.batches > self.max_batches:
+            raise TooManyQueriesError(
+                f"Vượt quá {self.max_batches} lô truy vấn trong 1 request (await từng key trong vòng lặp?)"
+            )
+
+    async def _fetch(self, sql: str, keys: list) -> list[dict]:
+        async with self._lock:
+            async with self.conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(sql.format(_placeholders(keys)), keys)
+                return await cursor.fetchall()
+
+    def _by_key(self, sql: str, key_column: str):
+        async def batch(keys: list) -> dict:
+            return {row[key_column]: row for row in await self._fetch(sql, keys)}
+        return batch
+
+    def _grouped(self, sql: str, key_column: str):
+        async def batch(keys: list) -> dict:
+            return _group(await self._fetch(sql, keys), key_column)
+        return batch
+
+
+async def get_loaders(conn: aiomysql.Connection = Depends(get_read_connection)):
+    """Dependency của FastAPI: bộ Loaders mới cho mỗi request, dọn các lô còn dở trước khi trả kết nối"""
+    loaders = Loaders(conn)
+    try:
+        yield loaders
+    finally:
+        await loaders.aclose()
@@ -1,9 +1,51 @@
 # File: /services/search_service/main.py
-import uvicorn
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from . import routes # Import file routes.py
+from .._shared.db import init_db_pool, close_db_pool, get_pool_stats
+from .._shared.json_response import ORJSONResponse
+from .._shared.metrics import MetricsMiddleware, metrics_response
+from .._shared.security import require_internal
+from .._shared.startup import wait_until_ready
+from .text_index import refresher
+from .._shared.http_cache import ETagMiddleware
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Khởi tạo pool kết nối CSDL trước khi nhận request
+    try:
+        await init_db_pool()
+    except Exception as e:
+        # CSDL chưa sẵn sàng: service vẫn chạy, pool sẽ được tạo lại ở request đầu tiên
+        logger.warning(f"Không thể khởi tạo pool CSDL: {e}")
+    # Nạp chỉ mục tìm kiếm toàn văn ở nền (không chặn việc nhận request)
+    refresher.start()
+    # Chạy bằng launcher: chờ chỉ mục nạp xong rồi mới nhận request
+    await wait_until_ready(refresher)
+    yield
+    await refresher.stop()
+    # Đóng pool khi service tắt
+    await close_db_pool()
+
+# Mã hóa JSON bằng orjson; nén response chỉ làm 1 lần ở API Gateway
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# ETag + Cache-Control cho các API GET (quy tắc đầu tiên khớp sẽ được dùng)
+app.add_middleware(ETagMiddleware, rules=[
+    ("/cache", "no-store"),
+    ("/db-pool", "no-store"),
+    ("/search/index-status", "no-store"),
+    ("/search", "public, max-age=30"),
+    ("/clinics/nearby", "public, max-age=30"),
+    ("/clinics", "public, max-age=60"),
+    ("/dentists", "public, max-age=60"),
+])
+
+# Đo thời gian request + mã request (X-Request-ID); đặt ngoài cùng nên thêm sau cùng
+app.add_middleware(MetricsMiddleware)
 
 # Bao gồm các router từ file routes.py
 app.include_router(routes.router)
@@ -12,5 +54,16 @@ app.include_router(routes.router)
 def read_root():
     return {"service": "Search Service (Python-Only)"}
 
+@app.get("/db-pool", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_db_pool_stats():
+    """Số liệu pool kết nối CSDL (in-use, waiters, độ trễ lấy kết nối)"""
+    return get_pool_stats()
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_internal)])
+def read_metrics():
+    """Số liệu dạng Prometheus (độ trễ theo route, truy vấn CSDL, bcrypt...)"""
+    return metrics_response()
+
 if __name__ == "__main__":
+    import uvicorn  # Chỉ cần khi chạy trực tiếp (launcher / uvicorn CLI tự import)
     uvicorn.run(app, host="127.0.0.1", port=8002)
\ No newline at end of file
@@ -1,44 +1,111 @@
 # File: /services/search_service/routes.py
-from fastapi import APIRouter, Depends, Response
-from .._shared.db import get_db_connection # Import hàm kết nối
+from fastapi import APIRouter, Depends, Request, Response, HTTPException, Query
+# Search chỉ đọc -> đọc từ read replica (nếu có), user vừa ghi thì đọc primary
+from .._shared.db import get_read_connection, acquire_read_connection, recently_wrote
+from . import geo_index, text_index
+from .cache import response_cache, CLINICS_KEY, dentist_key
+from .loaders import Loaders, get_loaders
+from .._shared.json_response import ORJSONResponse, RawJSONResponse, dumps
+from .._shared.security import require_internal
+from pydantic import BaseModel
+from typing import Literal, Optional
 import aiomysql
+import asyncio
+import base64
+import itertools
+import json
 
 router = APIRouter()
 
-@router.get("/clinics")
-async def get_all_clinics(
-    response: Response, 
-    conn: aiomysql.Connection = Depends(get_db_connection) 
-):
-    """
-    API này lấy tất cả phòng khám đã được xác thực
-    để hiển thị trên trang 'find.html'
-    """
-    try:
+async def _load_verified_clinics(prefer_primary: bool = False):
+    async with acquire_read_connection(prefer_primary) as conn:
         async with conn.cursor(aiomysql.cursors.DictCursor) as cursor:
             # Truy vấn CSDL 
             await cursor.execute(
                 "SELECT clinic_id, name, address, description, images, average_rating "
                 "FROM Clinics WHERE is_verified = TRUE"
             )
-            clinics = await cursor.fetchall()
-            return clinics
+            return await cursor.fetchall()
+
+@router.get("/clinics")
+async def get_all_clinics(request: Request, response: Response):
+    """
+    API này lấy tất cả phòng khám đã được xác thực
+    để hiển thị trên trang 'find.html'
+    (Kết quả được cache, chỉ mượn kết nối CSDL khi cache chưa có;
+    body trả thẳng từ JSON bytes đã lưu, không mã hóa lại)
+    """
+    try:
+        if recently_wrote(request):
+            # User vừa ghi dữ liệu -> bỏ qua cache, đọc primary
+            return ORJSONResponse(await _load_verified_clinics(prefer_primary=True))
+        return RawJSONResponse(await response_cache.get_or_load_raw(CLINICS_KEY, _load_verified_clinics))
             
     except Exception as e:
         response.status_code = 500
         return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
 
-@router.get("/dentists/{dentist_id}")
-async def get_dentist_details(
-    dentist_id: str, # ID là VARCHAR 
-    response: Response, 
-    conn: aiomysql.Connection = Depends(get_db_connection)
+@router.get("/clinics/nearby")
+async def get_nearby_clinics(
+    request: Request,
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5.0, gt=0, le=100, description="Bán kính (km)"),
+    limit: int = Query(20, ge=1, le=100),
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    service: Optional[str] = Query(None, max_length=50, description="service_id"),
 ):
     """
-    API này lấy chi tiết 1 nha sĩ
-    để hiển thị trên trang 'dentist-detail.html'
+    API "phòng khám gần tôi": k phòng khám đã xác thực gần nhất trong bán kính, kèm khoảng cách.
+    Vị trí tìm trên chỉ mục lưới trong bộ nhớ; lọc dịch vụ chỉ truy vấn CSDL trên các ứng viên gần nhất
+    (chỉ khi đó mới mượn kết nối CSDL).
     """
-    try:
+    if not text_index.refresher.ready:
+        response.status_code = 503
+        return {"error": "Chỉ mục vị trí đang được nạp, vui lòng thử lại sau"}
+
+    def candidates():
+        # Phòng khám theo thứ tự gần -> xa, đã lọc theo điểm đánh giá
+        for distance, clinic_id in geo_index.clinics.iter_nearest(lat, lng, radius):
+            doc = text_index.get_doc("clinic", clinic_id)
+            if doc is None:
+                continue
+            if min_rating is not None and (doc["average_rating"] or 0) < min_rating:
+                continue
+            yield distance, doc
+
+    if not service:
+        results = list(itertools.islice(candidates(), limit))
+    else:
+        # Kiểm tra dịch vụ theo từng lô ứng viên gần nhất cho tới khi đủ limit
+        results, stream, batch_size = [], candidates(), max(limit * 2, 50)
+        try:
+            async with acquire_read_connection(recently_wrote(request)) as conn, conn.cursor() as cursor:
+                while len(results) < limit:
+                    batch = list(itertools.islice(stream, batch_size))
+                    if not batch:
+                        break
+                    ids = [doc["clinic_id"] for _, doc in batch]
+                    await cursor.execute(
+                        f"SELECT clinic_id FROM Clinic_Services WHERE service_id = %s "
+                        f"AND clinic_id IN ({', '.join(['%s'] * len(ids))})",
+                        [service] + ids
+                    )
+                    offered = {row[0] for row in await cursor.fetchall()}
+                    results += [c for c in batch if c[1]["clinic_id"] in offered]
+        except Exception as e:
+            response.status_code = 500
+            return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
+
+    return ORJSONResponse({
+        "items": [
+            {**doc, "distance_km": round(distance, 3)} for distance, doc in results[:limit]
+        ]
+    })
+
+async def _load_dentist(dentist_id: str, prefer_primary: bool = False):
+    async with acquire_read_connection(prefer_primary) as conn:
         async with conn.cursor(aiomysql.cursors.DictCursor) as cursor:
             # Truy vấn kết hợp bảng Users và Dentists 
             await cursor.execute(
@@ -52,14 +119,386 @@ async def get_dentist_details(
                 """, 
                 (dentist_id,)
             )
-            dentist = await cursor.fetchone()
-            
-            if not dentist:
-                response.status_code = 404
-                return {"error": "Không tìm thấy nha sĩ"}
-                
-            return dentist
+            # None (không tìm thấy) cũng được cache để chặn truy vấn lặp lại với ID sai
+            return await cursor.fetchone()
+
+@router.get("/dentists/{dentist_id}")
+async def get_dentist_details(
+    dentist_id: str, # ID là VARCHAR 
+    request: Request,
+    response: Response
+):
+    """
+    API này lấy chi tiết 1 nha sĩ
+    để hiển thị trên trang 'dentist-detail.html'
+    """
+    try:
+        if recently_wrote(request):
+            # User vừa ghi dữ liệu -> bỏ qua cache, đọc primary
+            dentist = dumps(await _load_dentist(dentist_id, prefer_primary=True))
+        else:
+            dentist = await response_cache.get_or_load_raw(
+                dentist_key(dentist_id), lambda: _load_dentist(dentist_id)
+            )
+    except Exception as e:
+        response.status_code = 500
+        return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
+
+    if dentist == b"null":
+        response.status_code = 404
+        return {"error": "Không tìm thấy nha sĩ"}
             
+    return RawJSONResponse(dentist)
+
+
+# === TÀI LIỆU GHÉP (TRANG SO SÁNH / DANH SÁCH) ===
+# Mọi bảng liên quan được tải theo lô qua Loaders (loaders.py): số truy vấn cố định,
+# không phụ thuộc số nha sĩ / phòng khám trong kết quả.
+MAX_BULK_IDS = 50
+
+
+def _parse_ids(ids: str) -> list[str]:
+    """'a, b,a' -> ['a', 'b'] (bỏ trùng, giữ thứ tự)"""
+    return list(dict.fromkeys(part.strip() for part in ids.split(",") if part.strip()))
+
+
+async def _compose_dentists(loaders: Loaders, dentists: list[dict]) -> list[dict]:
+    """Nha sĩ + phòng khám + dịch vụ: 2 truy vấn cho cả danh sách"""
+    dentist_ids = [d["user_id"] for d in dentists]
+    clinics, services = await asyncio.gather(
+        loaders.clinics_of_dentist.load_many(dentist_ids),
+        loaders.services_of_dentist.load_many(dentist_ids),
+    )
+    return [
+        {**dentist, "clinics": dentist_clinics, "services": dentist_services}
+        for dentist, dentist_clinics, dentist_services in zip(dentists, clinics, services)
+    ]
+
+
+@router.get("/dentists")
+async def get_dentists_bulk(
+    response: Response,
+    ids: str = Query(..., max_length=2000, description=f"Danh sách user_id, cách nhau bởi dấu phẩy (tối đa {MAX_BULK_IDS})"),
+    loaders: Loaders = Depends(get_loaders)
+):
+    """
+    API lấy nhiều nha sĩ cùng lúc (trang 'compare.html', danh sách kết quả), mỗi nha sĩ kèm
+    phòng khám và dịch vụ. Luôn 3 truy vấn CSDL dù hỏi 1 hay 50 nha sĩ.
+    """
+    dentist_ids = _parse_ids(ids)
+    if not dentist_ids or len(dentist_ids) > MAX_BULK_IDS:
+        raise HTTPException(status_code=422, detail=f"Cần từ 1 đến {MAX_BULK_IDS} id")
+    try:
+        dentists = await loaders.dentist.load_many(dentist_ids)
+        found = [dentist for dentist in dentists if dentist]
+        items = await _compose_dentists(loaders, found)
+    except Exception as e:
+        response.status_code = 500
+        return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
+    return ORJSONResponse({
+        "items": items,
+        "missing": [dentist_id for dentist_id, dentist in zip(dentist_ids, dentists) if not dentist],
+    })
+
+
+@router.get("/clinics/{clinic_id}/full")
+async def get_clinic_full(
+    clinic_id: str,
+    response: Response,
+    loaders: Loaders = Depends(get_loaders)
+):
+    """
+    API lấy 1 phòng khám kèm dịch vụ và các nha sĩ (mỗi nha sĩ kèm dịch vụ của mình)
+    trong 1 lần gọi: 4 truy vấn CSDL, không phụ thuộc số nha sĩ.
+    """
+    try:
+        clinic = await loaders.clinic.load(clinic_id)
+        if not clinic:
+            response.status_code = 404
+            return {"error": "Không tìm thấy phòng khám"}
+        dentists, services = await asyncio.gather(
+            loaders.dentists_of_clinic.load(clinic_id),
+            loaders.services_of_clinic.load(clinic_id),
+        )
+        dentist_services = await loaders.services_of_dentist.load_many([d["user_id"] for d in dentists])
     except Exception as e:
         response.status_code = 500
-        return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
\ No newline at end of file
+        return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
+    return ORJSONResponse({
+        **clinic,
+        "services": services,
+        "dentists": [
+            {**dentist, "services": own_services} for dentist, own_services in zip(dentists, dentist_services)
+        ],
+    })
+
+
+class CacheInvalidateRequest(BaseModel):
+    """
+    Body dùng cho API /cache/invalidate
+    """
+    keys: list[str] = []      # VD: ["clinics", "dentist:dent1"]
+    prefixes: list[str] = []  # VD: ["dentist:"]
+
+@router.post("/cache/invalidate", include_in_schema=False, dependencies=[Depends(require_internal)])
+async def invalidate_cache(request: CacheInvalidateRequest):
+    """Xóa cache chủ động (gọi sau khi admin/nha sĩ sửa dữ liệu; chỉ gọi nội bộ, cần X-Internal-Token)"""
+    deleted = await response_cache.invalidate(*request.keys) if request.keys else 0
+    for prefix in request.prefixes:
+        deleted += await response_cache.invalidate_prefix(prefix)
+    return {"deleted": deleted}
+
+@router.get("/cache/stats", include_in_schema=False, dependencies=[Depends(require_internal)])
+async def get_cache_stats():
+    """Số liệu cache: hit / miss / gộp request / số key bị loại bỏ"""
+    return response_cache.stats()
+
+
+# === API TÌM KIẾM (LỌC / SẮP XẾP / PHÂN TRANG PHÍA SERVER) ===
+
+# Cột dùng để sắp xếp của từng loại kết quả.
+# rating: điểm Bayes duy trì tăng dần (services/_shared/ratings.py), kiểu DECIMAL nên so sánh bằng
+# chính xác với giá trị trong cursor và đọc thẳng từ index (is_verified, rating_score, id).
+_SORT_COLUMNS = {
+    "clinic": {
+        "rating": "c.rating_score",
+        "name": "c.name",
+    },
+    "dentist": {
+        "rating": "d.rating_score",
+        "name": "CONCAT_WS(' ', u.last_name, u.first_name)",
+    },
+}
+_ID_COLUMNS = {"clinic": "c.clinic_id", "dentist": "d.user_id"}
+_FROM_CLAUSES = {
+    "clinic": "FROM Clinics c",
+    "dentist": "FROM Dentists d JOIN Users u ON u.user_id = d.user_id",
+}
+_SELECT_COLUMNS = {
+    "clinic": "c.clinic_id, c.name, c.address, c.description, c.images, c.average_rating, c.rating_count",
+    "dentist": (
+        "u.user_id, u.first_name, u.last_name, d.specialization, d.bio, "
+        "d.years_of_exp, d.average_rating, d.rating_count"
+    ),
+}
+
+
+def _like(text: str) -> str:
+    """Escape ký tự đặc biệt của LIKE rồi bọc trong %...%"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _encode_cursor(kind: str, sort_value, row_id: str) -> str:
+    # kind = "<type>:<sort>" để cursor không bị dùng nhầm cho kiểu tìm kiếm khác
+    raw = json.dumps([kind, sort_value, row_id], ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(kind: str, cursor: str):
+    try:
+        cursor_kind, sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    if cursor_kind != kind:
+        raise HTTPException(status_code=400, detail="Cursor không khớp với type/sort của truy vấn")
+    return sort_value, row_id
+
+
+# Số kết quả tối đa lấy từ chỉ mục toàn văn để lọc tiếp bằng SQL (IN (...)).
+# Nhiều hơn mức này thì quay lại dùng LIKE.
+MAX_INDEX_MATCHES = 1000
+
+
+def _text_condition(type: str, q: str, id_column: str, like_columns: list[str]):
+    """
+    Điều kiện lọc theo từ khóa: ưu tiên chỉ mục trong bộ nhớ (không quét bảng),
+    nếu chỉ mục chưa sẵn sàng hoặc quá nhiều kết quả thì dùng LIKE.
+    """
+    if text_index.refresher.ready:
+        matches = text_index.search(type, q, limit=MAX_INDEX_MATCHES + 1)
+        if not matches:
+            return "FALSE", []
+        if len(matches) <= MAX_INDEX_MATCHES:
+            ids = [doc_id for doc_id, _ in matches]
+            return f"{id_column} IN ({', '.join(['%s'] * len(ids))})", ids
+    condition = "(" + " OR ".join(f"{column} LIKE %s" for column in like_columns) + ")"
+    return condition, [_like(q)] * len(like_columns)
+
+
+def _build_search_filters(
+    type: str,
+    q: Optional[str],
+    specialization: Optional[str],
+    service: Optional[str],
+    min_rating: Optional[float],
+    min_price: Optional[float],
+    max_price: Optional[float],
+):
+    """
+    Tạo mệnh đề WHERE (danh sách điều kiện + tham số) cho /search.
+    Dùng tham số %s của aiomysql, không ghép chuỗi giá trị vào SQL.
+    """
+    conditions, params = [], []
+
+    if type == "clinic":
+        conditions.append("c.is_verified = TRUE")
+        if q:
+            condition, values = _text_condition(
+                type, q, "c.clinic_id", ["c.name", "c.address", "c.description"]
+            )
+            conditions.append(condition)
+            params += values
+        if min_rating is not None:
+            conditions.append("c.average_rating >= %s")
+            params.append(min_rating)
+        if specialization:
+            # Phòng khám có ít nhất 1 nha sĩ đúng chuyên môn
+            conditions.append(
+                "EXISTS (SELECT 1 FROM Clinic_Dentists cd JOIN Dentists d2 ON d2.user_id = cd.dentist_id "
+                "WHERE cd.clinic_id = c.clinic_id AND d2.specialization LIKE %s)"
+            )
+            params.append(_like(specialization))
+        service_link = "SELECT 1 FROM Clinic_Services x JOIN Services s ON s.service_id = x.service_id WHERE x.clinic_id = c.clinic_id"
+    else:
+        conditions.append("d.is_verified = TRUE")
+        if q:
+            condition, values = _text_condition(
+                type, q, "d.user_id", ["u.first_name", "u.last_name", "d.specialization", "d.bio"]
+            )
+            conditions.append(condition)
+            params += values
+        if min_rating is not None:
+            conditions.append("d.average_rating >= %s")
+            params.append(min_rating)
+        if specialization:
+            conditions.append("d.specialization LIKE %s")
+            params.append(_like(specialization))
+        service_link = "SELECT 1 FROM Dentist_Services x JOIN Services s ON s.service_id = x.service_id WHERE x.dentist_id = d.user_id"
+
+    # Lọc theo dịch vụ và/hoặc khoảng giá: cần ít nhất 1 dịch vụ thỏa mãn
+    if service or min_price is not None or max_price is not None:
+        service_conditions = []
+        if service:
+            service_conditions.append("(s.service_id = %s OR s.name LIKE %s)")
+            params += [service, _like(service)]
+        if min_price is not None:
+            service_conditions.append("s.max_price >= %s")
+            params.append(min_price)
+        if max_price is not None:
+            service_conditions.append("s.min_price <= %s")
+            params.append(max_price)
+        conditions.append(f"EXISTS ({service_link} AND {' AND '.join(service_conditions)})")
+
+    return conditions, params
+
+
+def _build_search_sql(type: str, sort: str, conditions: list, params: list, after, limit: int):
+    """
+    Trả về ((SQL trang, tham số), (SQL đếm, tham số)) cho /search.
+    after = (giá trị sắp xếp, id) của dòng cuối trang trước (giải mã từ cursor) hoặc None.
+    (Dùng chung với services/_shared/explain_check.py để EXPLAIN đúng câu SQL thật.)
+    """
+    sort_column = _SORT_COLUMNS[type][sort]
+    id_column = _ID_COLUMNS[type]
+    # rating: cao -> thấp, name: A -> Z; id luôn tăng dần để thứ tự ổn định
+    direction, compare = ("DESC", "<") if sort == "rating" else ("ASC", ">")
+
+    page_conditions, page_params = list(conditions), list(params)
+    if after is not None:
+        last_value, last_id = after
+        page_conditions.append(
+            f"({sort_column} {compare} %s OR ({sort_column} = %s AND {id_column} > %s))"
+        )
+        page_params += [last_value, last_value, last_id]
+
+    where = " AND ".join(conditions)
+    page_where = " AND ".join(page_conditions)
+    page_sql = (
+        f"SELECT {_SELECT_COLUMNS[type]}, {sort_column} AS sort_value "
+        f"{_FROM_CLAUSES[type]} WHERE {page_where} "
+        f"ORDER BY sort_value {direction}, {id_column} ASC LIMIT %s"
+    )
+    count_sql = f"SELECT COUNT(*) AS total {_FROM_CLAUSES[type]} WHERE {where}"
+    return (page_sql, page_params + [limit + 1]), (count_sql, list(params))
+
+
+@router.get("/search")
+async def search(
+    response: Response,
+    q: Optional[str] = Query(None, max_length=100, description="Từ khóa (tên, địa chỉ, mô tả...)"),
+    type: Literal["clinic", "dentist"] = Query("clinic", description="Tìm phòng khám hay nha sĩ"),
+    specialization: Optional[str] = Query(None, max_length=100),
+    service: Optional[str] = Query(None, max_length=100, description="service_id hoặc tên dịch vụ"),
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: Literal["rating", "name"] = Query("rating"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Giá trị next_cursor của trang trước"),
+    conn: aiomysql.Connection = Depends(get_read_connection)
+):
+    """
+    API tìm kiếm cho trang 'find.html': lọc, sắp xếp và phân trang ngay trên CSDL.
+    Phân trang theo keyset (cursor) thay vì OFFSET, nên trang sau không phải quét lại các trang trước.
+    """
+    conditions, params = _build_search_filters(
+        type, q, specialization, service, min_rating, min_price, max_price
+    )
+    after = _decode_cursor(f"{type}:{sort}", cursor) if cursor else None
+    (page_sql, page_params), (count_sql, count_params) = _build_search_sql(
+        type, sort, conditions, params, after, limit
+    )
+
+    try:
+        async with conn.cursor(aiomysql.cursors.DictCursor) as cur:
+            await cur.execute(page_sql, page_params)
+            rows = await cur.fetchall()
+
+            await cur.execute(count_sql, count_params)
+            total = (await cur.fetchone())["total"]
+    except Exception as e:
+        response.status_code = 500
+        return {"error": "Lỗi truy vấn CSDL", "details": str(e)}
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        row_id = last["clinic_id"] if type == "clinic" else last["user_id"]
+        next_cursor = _encode_cursor(f"{type}:{sort}", last["sort_value"], row_id)
+    for row in rows:
+        row.pop("sort_value", None)
+
+    return ORJSONResponse({"items": rows, "total": total, "limit": limit, "next_cursor": next_cursor})
+
+
+@router.get("/search/text")
+async def search_text(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100, description="Từ khóa (không cần gõ dấu)"),
+    type: Literal["clinic", "dentist"] = Query("clinic"),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Tìm nhanh theo từ khóa (gợi ý khi gõ) - trả lời hoàn toàn từ chỉ mục trong bộ nhớ,
+    không truy vấn CSDL. Kết quả xếp theo điểm BM25.
+    """
+    if not text_index.refresher.ready:
+        response.status_code = 503
+        return {"error": "Chỉ mục tìm kiếm đang được nạp, vui lòng thử lại sau"}
+
+    items = []
+    for doc_id, score in text_index.search(type, q, limit):
+        doc = text_index.get_doc(type, doc_id)
+        if doc is not None:
+            items.append({**doc, "score": round(score, 4)})
+    return ORJSONResponse({"items": items})
+
+
+@router.get("/search/index-status")
+async def get_index_status():
+    """Trạng thái chỉ mục toàn văn (số tài liệu, lần đồng bộ cuối, lỗi gần nhất)"""
+    return text_index.refresher.status()
@@ -0,0 +1,395 @@
+# File: /services/search_service/text_index.py
+# Chỉ mục toàn văn (inverted index) nằm trong bộ nhớ của search_service.
+# - Tách từ không phân biệt dấu tiếng Việt ("Sài Gòn" == "sai gon")
+# - Tìm theo tiền tố ("nie" -> "nieng") và chịu lỗi gõ 1 ký tự ("nieng" ~ "nienq")
+# - Xếp hạng BM25
+# Chỉ mục được nạp từ CSDL khi service khởi động, sau đó cập nhật dần bằng cách
+# định kỳ lấy các dòng có `updated_at` mới hơn lần đồng bộ trước.
+
+import asyncio
+import bisect
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import Counter
+
+import aiomysql
+
+from .._shared.db import acquire_connection
+from . import geo_index
+from .cache import response_cache, CLINICS_KEY, dentist_key
+
+logger = logging.getLogger(__name__)
+
+# === 1. CẤU HÌNH ===
+INDEX_POLL_INTERVAL = 30            # (giây) Chu kỳ lấy các dòng thay đổi
+INDEX_FULL_REFRESH_INTERVAL = 3600  # (giây) Chu kỳ nạp lại toàn bộ (để bắt các dòng bị xóa hẳn)
+MAX_PREFIX_EXPANSIONS = 50          # Số từ tối đa mở rộng từ 1 tiền tố
+MIN_FUZZY_LENGTH = 4                # Từ ngắn hơn mức này không sửa lỗi gõ
+
+# Trọng số khi từ trong truy vấn khớp theo kiểu khác nhau
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+# === 2. TÁCH TỪ (KHÔNG PHÂN BIỆT DẤU) ===
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường: 'Nha khoa Sài Gòn' -> 'nha khoa sai gon'"""
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text) -> list[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize(str(text)))
+
+
+def _deletes(term: str) -> set[str]:
+    """Các biến thể xóa đúng 1 ký tự của term (dùng cho tìm kiếm chịu lỗi kiểu SymSpell)"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+# === 3. CHỈ MỤC ===
+class TextIndex:
+    """
+    Inverted index cho 1 loại tài liệu (phòng khám hoặc nha sĩ).
+    Mọi thao tác đều đồng bộ (không await) nên an toàn trong 1 event loop.
+    """
+
+    def __init__(self):
+        self.postings: dict[str, dict[str, int]] = {}  # term -> {doc_id: tần suất}
+        self.doc_terms: dict[str, Counter] = {}         # doc_id -> Counter(term)
+        self.doc_len: dict[str, int] = {}
+        self.docs: dict[str, dict] = {}                 # doc_id -> dữ liệu trả về cho client
+        self.vocab: list[str] = []                      # Danh sách term đã sắp xếp (tìm tiền tố)
+        self.delete_map: dict[str, set[str]] = {}       # biến thể xóa 1 ký tự -> {term}
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    # --- Cập nhật ---
+    def add(self, doc_id: str, fields: list[tuple[str, float]], payload: dict):
+        """
+        Thêm (hoặc thay thế) 1 tài liệu.
+        fields: danh sách (nội dung, trọng số) - VD tên phòng khám nặng hơn mô tả.
+        """
+        if doc_id in self.docs:
+            self.remove(doc_id)
+
+        counts = Counter()
+        for text, weight in fields:
+            for term in tokenize(text):
+                counts[term] += weight
+        self.doc_terms[doc_id] = counts
+        self.docs[doc_id] = payload
+        length = sum(counts.values())
+        self.doc_len[doc_id] = length
+        self.total_len += length
+
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                bisect.insort(self.vocab, term)
+                for variant in _deletes(term):
+                    self.delete_map.setdefault(variant, set()).add(term)
+            posting[doc_id] = tf
+
+    def remove(self, doc_id: str):
+        counts = self.doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        self.docs.pop(doc_id, None)
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+        for term in counts:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                # Term không còn tài liệu nào -> xóa khỏi từ điển
+                del self.postings[term]
+                i = bisect.bisect_left(self.vocab, term)
+                if i < len(self.vocab) and self.vocab[i] == term:
+                    del self.vocab[i]
+                for variant in _deletes(term):
+                    terms = self.delete_map.get(variant)
+                    if terms:
+                        terms.discard(term)
+                        if not terms:
+                            del self.delete_map[variant]
+
+    def clear(self):
+        self.__init__()
+
+    # --- Truy vấn ---
+    def _expand(self, token: str) -> dict[str, float]:
+        """Tìm các term trong từ điển khớp với token: chính xác, theo tiền tố, hoặc sai 1 ký tự."""
+        matches: dict[str, float] = {}
+        if token in self.postings:
+            matches[token] = EXACT_WEIGHT
+
+        # Tiền tố: các term đứng liền sau token trong vocab đã sắp xếp
+        i = bisect.bisect_left(self.vocab, token)
+        expanded = 0
+        while i < len(self.vocab) and expanded < MAX_PREFIX_EXPANSIONS:
+            term = self.vocab[i]
+            if not term.startswith(token):
+                break
+            matches.setdefault(term, PREFIX_WEIGHT)
+            expanded += 1
+            i += 1
+
+        # Sai 1 ký tự (thiếu, thừa, sai hoặc đảo vị trí) - chỉ khi không khớp chính xác
+        if token not in self.postings and len(token) >= MIN_FUZZY_LENGTH:
+            candidates = set(self.delete_map.get(token, ()))       # token thiếu 1 ký tự
+            for variant in _deletes(token):
+                if variant in self.postings:                       # token thừa 1 ký tự
+                    candidates.add(variant)
+                candidates.update(self.delete_map.get(variant, ()))  # sai / đảo 1 ký tự
+            for term in candidates:
+                matches.setdefault(term, FUZZY_WEIGHT)
+        return matches
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings[term])
+        n = len(self.docs)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 20) -> list[tuple[str, float]]:
+        """
+        Trả về [(doc_id, điểm BM25)] giảm dần theo điểm.
+        Tài liệu phải khớp TẤT CẢ các từ trong truy vấn (mỗi từ có thể khớp theo tiền tố/sai 1 ký tự).
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self.docs:
+            return []
+        avg_len = self.total_len / len(self.docs) or 1.0
+
+        scores: dict[str, float] | None = None
+        for token in tokens:
+            token_scores: dict[str, float] = {}
+            for term, weight in self._expand(token).items():
+                idf = self._idf(term)
+                for doc_id, tf in self.postings[term].items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc_id] / avg_len)
+                    score = weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    # 1 từ trong truy vấn chỉ tính điểm của term khớp tốt nhất
+                    if score > token_scores.get(doc_id, 0.0):
+                        token_scores[doc_id] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {d: s + token_scores[d] for d, s in scores.items() if d in token_scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+# Mỗi loại tài liệu có chỉ mục riêng (IDF tính riêng)
+indexes = {"clinic": TextIndex(), "dentist": TextIndex()}
+
+
+# === 4. NẠP DỮ LIỆU TỪ CSDL ===
+_CLINIC_SQL = (
+    "SELECT clinic_id, name, address, description, average_rating, latitude, longitude, "
+    "is_verified, updated_at "
+    "FROM Clinics"
+)
+_DENTIST_SQL = (
+    "SELECT u.user_id, u.first_name, u.last_name, d.specialization, d.bio, d.years_of_exp, "
+    "d.average_rating, d.is_verified, GREATEST(u.updated_at, d.updated_at) AS updated_at "
+    "FROM Dentists d JOIN Users u ON u.user_id = d.user_id"
+)
+
+
+def _index_clinic(row: dict):
+    index = indexes["clinic"]
+    if not row["is_verified"]:
+        index.remove(row["clinic_id"])
+        geo_index.clinics.remove(row["clinic_id"])
+        return
+    # Vị trí (nếu có) được đưa vào chỉ mục không gian cho /clinics/nearby
+    if row["latitude"] is not None and row["longitude"] is not None:
+        geo_index.clinics.add(row["clinic_id"], float(row["latitude"]), float(row["longitude"]))
+    else:
+        geo_index.clinics.remove(row["clinic_id"])
+    index.add(
+        row["clinic_id"],
+        [(row["name"], 3.0), (row["address"], 1.5), (row["description"], 1.0)],
+        {
+            "clinic_id": row["clinic_id"],
+            "name": row["name"],
+            "address": row["address"],
+            "average_rating": row["average_rating"],
+        },
+    )
+
+
+def _index_dentist(row: dict):
+    index = indexes["dentist"]
+    if not row["is_verified"]:
+        index.remove(row["user_id"])
+        return
+    index.add(
+        row["user_id"],
+        [
+            (f"{row['last_name'] or ''} {row['first_name'] or ''}", 3.0),
+            (row["specialization"], 2.0),
+            (row["bio"], 1.0),
+        ],
+        {
+            "user_id": row["user_id"],
+            "first_name": row["first_name"],
+            "last_name": row["last_name"],
+            "specialization": row["specialization"],
+            "years_of_exp": row["years_of_exp"],
+            "average_rating": row["average_rating"],
+        },
+    )
+
+
+class IndexRefresher:
+    """Nạp toàn bộ chỉ mục khi khởi động và chạy vòng lặp nền cập nhật dần."""
+
+    def __init__(self):
+        self.ready = False
+        self.last_sync = None         # Mốc updated_at lớn nhất đã thấy (theo giờ CSDL)
+        self.last_full_refresh = 0.0
+        self.last_error: str | None = None
+        self._task: asyncio.Task | None = None
+
+    async def full_refresh(self):
+        start = time.perf_counter()
+        async with acquire_connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(_CLINIC_SQL)
+                clinics = await cursor.fetchall()
+                await cursor.execute(_DENTIST_SQL)
+                dentists = await cursor.fetchall()
+
+        # Dựng chỉ mục mới rồi mới thay thế -> truy vấn đang chạy không thấy chỉ mục "nửa vời"
+        global indexes
+        old, old_geo = indexes, geo_index.clinics
+        indexes = {"clinic": TextIndex(), "dentist": TextIndex()}
+        geo_index.clinics = geo_index.GeoGridIndex()
+        try:
+            for row in clinics:
+                _index_clinic(row)
+            for row in dentists:
+                _index_dentist(row)
+        except Exception:
+            indexes, geo_index.clinics = old, old_geo
+            raise
+
+        stamps = [r["updated_at"] for r in list(clinics) + list(dentists) if r["updated_at"]]
+        self.last_sync = max(stamps) if stamps else None
+        self.last_full_refresh = time.monotonic()
+        if self.ready:
+            # Nạp lại định kỳ có thể phát hiện dòng bị xóa hẳn -> làm mới cache đọc
+            await response_cache.invalidate(CLINICS_KEY)
+            await response_cache.invalidate_prefix(dentist_key(""))
+        self.ready = True
+        logger.info(
+            f"Đã nạp chỉ mục tìm kiếm: {len(indexes['clinic'])} phòng khám, "
+            f"{len(indexes['dentist'])} nha sĩ ({(time.perf_counter() - start) * 1000:.0f} ms)"
+        )
+
+    async def incremental_refresh(self):
+        """Chỉ lấy các dòng có updated_at >= lần đồng bộ trước (>= để không sót dòng cùng giây)."""
+        if self.last_sync is None:
+            return await self.full_refresh()
+        async with acquire_connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(_CLINIC_SQL + " WHERE updated_at >= %s", (self.last_sync,))
+                clinics = await cursor.fetchall()
+                # OR giữa 2 bảng không dùng được index -> UNION 2 truy vấn theo idx_*_updated_at
+                await cursor.execute(
+                    f"({_DENTIST_SQL} WHERE d.updated_at >= %s) UNION ({_DENTIST_SQL} WHERE u.updated_at >= %s)",
+                    (self.last_sync, self.last_sync),
+                )
+                dentists = await cursor.fetchall()
+        for row in clinics:
+            _index_clinic(row)
+        for row in dentists:
+            _index_dentist(row)
+        stamps = [r["updated_at"] for r in list(clinics) + list(dentists) if r["updated_at"]]
+        if stamps:
+            newest = max(stamps)
+            if newest > self.last_sync:
+                # Có dòng thay đổi thật sự -> xóa cache các API đọc liên quan
+                await self._invalidate_cache(clinics, dentists)
+            self.last_sync = max(self.last_sync, newest)
+
+    async def _invalidate_cache(self, clinics, dentists):
+        changed = [r for r in dentists if r["updated_at"] and r["updated_at"] > self.last_sync]
+        if any(r["updated_at"] and r["updated_at"] > self.last_sync for r in clinics):
+            await response_cache.invalidate(CLINICS_KEY)
+        if changed:
+            await response_cache.invalidate(*[dentist_key(r["user_id"]) for r in changed])
+
+    async def _run(self):
+        while True:
+            try:
+                if not self.ready or time.monotonic() - self.last_full_refresh > INDEX_FULL_REFRESH_INTERVAL:
+                    await self.full_refresh()
+                else:
+                    await self.incremental_refresh()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # CSDL lỗi: giữ nguyên chỉ mục cũ, thử lại ở chu kỳ sau
+                self.last_error = str(e)
+                logger.warning(f"Không thể cập nhật chỉ mục tìm kiếm: {e}")
+            await asyncio.sleep(INDEX_POLL_INTERVAL)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "clinics": len(indexes["clinic"]),
+            "dentists": len(indexes["dentist"]),
+            "terms": {kind: len(index.postings) for kind, index in indexes.items()},
+            "geo_clinics": len(geo_index.clinics),
+            "last_sync": str(self.last_sync) if self.last_sync else None,
+            "last_error": self.last_error,
+        }
+
+
+refresher = IndexRefresher()
+
+
+def search(kind: str, query: str, limit: int = 20) -> list[tuple[str, float]]:
+    """Truy vấn chỉ mục hiện hành (luôn đọc qua biến module vì full_refresh thay cả dict)."""
+    return indexes[kind].search(query, limit)
+
+
+def get_doc(kind: str, doc_id: str) -> dict | None:
+    return indexes[kind].docs.get(doc_id)
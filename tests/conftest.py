@@ -0,0 +1,11 @@
+# File: /tests/conftest.py
+# Cho phép test import cả package "services" (gốc repo) lẫn các module phẳng của api-gateway
+# Chạy: python -m pytest -q tests
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "api-gateway")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
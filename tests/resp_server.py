@@ -0,0 +1,154 @@
+# File: /tests/resp_server.py
+# Server giả nói giao thức Redis (RESP) tối giản, đủ cho các client trong repo:
+# GET / SET [PX] / DEL / SCAN MATCH COUNT / INCR / DECR / PEXPIRE / AUTH / SELECT / PING
+# - Dữ liệu trong bộ nhớ, hết hạn theo PX/PEXPIRE
+# - `delays` (lệnh -> giây) làm chậm phản hồi để test timeout / hủy request
+
+import asyncio
+import bisect
+import fnmatch
+import itertools
+import time
+
+
+class RespServer:
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}  # key -> (giá trị, hết hạn monotonic)
+        self.delays: dict[str, float] = {}
+        self.commands: list[list[bytes]] = []
+        self._cursors: dict[int, bytes] = {}  # cursor SCAN -> key cuối của trang đã trả
+        self._cursor_ids = itertools.count(1)
+        self.connections = 0
+        self._server: asyncio.AbstractServer | None = None
+        self.port = 0
+
+    async def start(self) -> "RespServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    # --- Giao thức ---
+    @staticmethod
+    async def _read_command(reader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ValueError(f"Lệnh không hợp lệ: {line!r}")
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @classmethod
+    def _encode(cls, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, Exception):
+            return b"-ERR %s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(cls._encode(item) for item in value)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                self.commands.append(args)
+                name = args[0].decode().upper()
+                delay = self.delays.get(name)
+                if delay:
+                    await asyncio.sleep(delay)
+                try:
+                    reply = getattr(self, f"_cmd_{name.lower()}")(*args[1:])
+                except Exception as e:
+                    reply = e
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # --- Lệnh ---
+    def _live(self, key: bytes) -> bytes | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _cmd_ping(self, *args):
+        return "PONG"
+
+    def _cmd_auth(self, *args):
+        return "OK"
+
+    def _cmd_select(self, db):
+        return "OK"
+
+    def _cmd_get(self, key):
+        return self._live(key)
+
+    def _cmd_set(self, key, value, *options):
+        expires_at = None
+        if options:
+            if options[0].upper() != b"PX":
+                raise ValueError("chỉ hỗ trợ PX")
+            expires_at = time.monotonic() + int(options[1]) / 1000
+        self.data[key] = (value, expires_at)
+        return "OK"
+
+    def _cmd_del(self, *keys):
+        return sum(1 for key in keys if self._live(key) is not None and self.data.pop(key))
+
+    def _cmd_scan(self, cursor, *options):
+        pattern, count = b"*", 10
+        for name, value in zip(options[::2], options[1::2]):
+            if name.upper() == b"MATCH":
+                pattern = value
+            elif name.upper() == b"COUNT":
+                count = int(value)
+        # Cursor trỏ tới key cuối của trang trước (như Redis: xóa key giữa các lần SCAN không làm sót key khác)
+        keys = sorted(self.data)
+        start = bisect.bisect_right(keys, self._cursors.pop(int(cursor))) if int(cursor) else 0
+        page = keys[start:start + count]
+        next_cursor = 0
+        if start + count < len(keys):
+            next_cursor = next(self._cursor_ids)
+            self._cursors[next_cursor] = page[-1]
+        matched = [key for key in page if self._live(key) is not None and fnmatch.fnmatchcase(key, pattern)]
+        return [str(next_cursor).encode(), matched]
+
+    def _cmd_incr(self, key):
+        return self._cmd_incrby(key, 1)
+
+    def _cmd_decr(self, key):
+        return self._cmd_incrby(key, -1)
+
+    def _cmd_incrby(self, key, amount):
+        value = int(self._live(key) or 0) + int(amount)
+        self.data[key] = (str(value).encode(), self.data.get(key, (None, None))[1])
+        return value
+
+    def _cmd_pexpire(self, key, ms):
+        if self._live(key) is None:
+            return 0
+        self.data[key] = (self.data[key][0], time.monotonic() + int(ms) / 1000)
+        return 1
@@ -0,0 +1,44 @@
+# File: /tests/test_booking_availability.py
+# Tra lịch trống (services/booking_service/routes.py): hôm nay không trả các ô đã bắt đầu
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.booking_service import routes
+from services.booking_service.availability import SLOT_MINUTES
+
+
+def _freeze(monkeypatch, now: datetime):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(routes, "datetime", FrozenDatetime)
+
+
+@pytest.mark.parametrize("now,expected", [
+    (datetime(2026, 3, 2, 9, 0, 0), 9 * 60 // SLOT_MINUTES + 1),       # Đúng đầu ô -> ô đó đã qua
+    (datetime(2026, 3, 2, 9, 0, 0, 1), 9 * 60 // SLOT_MINUTES + 1),
+    (datetime(2026, 3, 2, 0, 0, 0), 1),
+])
+def test_first_open_slot_today(monkeypatch, now, expected):
+    _freeze(monkeypatch, now)
+    assert routes._first_open_slot(now.date()) == expected
+
+
+def test_first_open_slot_future_day(monkeypatch):
+    now = datetime(2026, 3, 2, 23, 59)
+    _freeze(monkeypatch, now)
+    assert routes._first_open_slot(now.date() + timedelta(days=1)) == 0
+
+
+def test_first_open_slot_matches_booking_rule(monkeypatch):
+    """Ô đầu tiên được trả về phải được POST /appointments chấp nhận (start > now), ô trước đó thì không"""
+    now = datetime(2026, 3, 2, 14, 7, 31)
+    _freeze(monkeypatch, now)
+    first = routes._first_open_slot(now.date())
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    assert midnight + timedelta(minutes=first * SLOT_MINUTES) > now
+    assert midnight + timedelta(minutes=(first - 1) * SLOT_MINUTES) <= now
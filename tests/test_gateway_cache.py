@@ -0,0 +1,62 @@
+# File: /tests/test_gateway_cache.py
+# Cache dùng chung của gateway (api-gateway/main.py + response_cache.py): revalidate bằng ETag
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main as gateway
+from response_cache import gateway_cache
+
+
+@pytest.fixture
+def search_service(monkeypatch):
+    """Thay service search bằng handler giả; trả về danh sách request service nhận được"""
+    received = []
+    replies = []
+
+    def handler(request):
+        received.append(request)
+        return replies.pop(0)
+
+    upstream = gateway.upstreams["search"]
+    monkeypatch.setattr(upstream, "client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(gateway_cache, "_data", type(gateway_cache._data)())
+    return received, replies
+
+
+def _expire(key: str):
+    gateway_cache.get(key).expires_at = 0
+
+
+def test_stale_entry_revalidated_with_gateway_etag(search_service):
+    received, replies = search_service
+    client = TestClient(gateway.app)
+    headers = {"cache-control": "public, max-age=60", "etag": '"v1"', "content-length": "7"}
+    replies.append(httpx.Response(200, headers=headers, stream=httpx.ByteStream(b'{"a":1}')))
+    assert client.get("/api/search/clinics").content == b'{"a":1}'
+
+    _expire("search:/clinics")
+    replies.append(httpx.Response(304, headers={"cache-control": "public, max-age=60", "etag": '"v1"'}))
+    response = client.get("/api/search/clinics")
+    assert response.status_code == 200 and response.content == b'{"a":1}'
+    assert received[-1].headers["if-none-match"] == '"v1"'
+    assert gateway_cache.get("search:/clinics").fresh
+
+
+def test_client_304_passes_through_when_entry_has_no_etag(search_service):
+    received, replies = search_service
+    client = TestClient(gateway.app)
+    headers = {"cache-control": "public, max-age=60", "content-length": "7"}
+    replies.append(httpx.Response(200, headers=headers, stream=httpx.ByteStream(b'{"a":1}')))
+    client.get("/api/search/clinics")
+
+    _expire("search:/clinics")
+    revalidated = gateway_cache.revalidated
+    # Service trả 304 cho ETag của client chứ không phải cho entry của gateway
+    replies.append(httpx.Response(304, headers={"etag": '"client"'}, stream=httpx.ByteStream(b"")))
+    response = client.get("/api/search/clinics", headers={"if-none-match": '"client"'})
+    assert response.status_code == 304
+    assert received[-1].headers["if-none-match"] == '"client"'
+    entry = gateway_cache.get("search:/clinics")
+    assert not entry.fresh and gateway_cache.revalidated == revalidated
@@ -0,0 +1,45 @@
+# File: /tests/test_internal_routes.py
+# API quản trị / số liệu của các service chỉ gọi được khi có X-Internal-Token đúng
+
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services._shared import security
+
+INTERNAL_ROUTES = [
+    ("auth", "/metrics"),
+    ("search", "/metrics"),
+    ("booking", "/metrics"),
+    ("auth", "/db-pool"),
+    ("search", "/db-pool"),
+    ("booking", "/db-pool"),
+    ("auth", "/password-hasher"),
+    ("auth", "/outbox"),
+]
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(security, "INTERNAL_API_TOKEN", "test-token")
+    return "test-token"
+
+
+def _client(service: str) -> TestClient:
+    # Không dùng "with" -> không chạy lifespan (không cần CSDL)
+    return TestClient(importlib.import_module(f"services.{service}_service.main").app)
+
+
+@pytest.mark.parametrize("service,path", INTERNAL_ROUTES)
+def test_internal_route_requires_token(service, path, token):
+    client = _client(service)
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"x-internal-token": "wrong"}).status_code == 403
+    assert client.get(path, headers={"x-internal-token": token}).status_code == 200
+
+
+@pytest.mark.parametrize("service,path", INTERNAL_ROUTES)
+def test_internal_route_denied_without_configured_token(service, path, monkeypatch):
+    monkeypatch.setattr(security, "INTERNAL_API_TOKEN", "")
+    assert _client(service).get(path, headers={"x-internal-token": ""}).status_code == 403
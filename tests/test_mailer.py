@@ -0,0 +1,60 @@
+# File: /tests/test_mailer.py
+# Mailer (services/_shared/mailer.py) gửi vào máy chủ SMTP giả StandInSMTP
+
+import asyncio
+
+from services._shared.mailer import Mailer, StandInSMTP, build_message, mail_settings
+
+
+class CountingSMTP(StandInSMTP):
+    def __init__(self):
+        super().__init__(directory="")
+        self.open = 0
+
+    async def handle(self, reader, writer):
+        self.open += 1
+        try:
+            await super().handle(reader, writer)
+        finally:
+            self.open -= 1
+
+
+def test_shutdown_closes_every_connection(monkeypatch):
+    async def scenario():
+        smtp = CountingSMTP()
+        server = await smtp.serve("127.0.0.1", 0)
+        monkeypatch.setattr(mail_settings, "SMTP_HOST", "127.0.0.1")
+        monkeypatch.setattr(mail_settings, "SMTP_PORT", server.sockets[0].getsockname()[1])
+        monkeypatch.setattr(mail_settings, "SMTP_CONNECTIONS", 3)
+
+        mailer = Mailer()
+        await asyncio.gather(*(
+            mailer.send(build_message(f"user{i}@example.com", "Test", "Nội dung", f"test:{i}"))
+            for i in range(12)
+        ))
+        assert len(smtp.received) == 12 and mailer.sent == 12
+        assert 1 <= len(mailer._connections) <= 3
+
+        # Event loop vẫn chạy trong lúc đóng kết nối (shutdown không chặn loop)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        await mailer.shutdown()
+        task.cancel()
+        assert ticks > 0
+        assert mailer._connections == []
+        for _ in range(100):
+            if smtp.open == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert smtp.open == 0
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
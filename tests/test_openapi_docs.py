@@ -0,0 +1,30 @@
+# File: /tests/test_openapi_docs.py
+# merged_openapi.json (bản gộp đi kèm repo, api-gateway/openapi_docs.py) phải khớp spec hiện tại
+# của các service và không công bố API nội bộ.
+# Sinh lại: gộp app.openapi() của từng service bằng merge_specs rồi ghi với orjson OPT_INDENT_2
+
+import importlib
+
+import orjson
+import pytest
+
+from openapi_docs import DOCS_SEED, merge_specs
+
+SERVICES = ["auth", "search", "booking"]
+
+
+@pytest.fixture(scope="module")
+def seed() -> dict:
+    with open(DOCS_SEED, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def test_seed_matches_services(seed):
+    specs = {s: importlib.import_module(f"services.{s}_service.main").app.openapi() for s in SERVICES}
+    assert seed == merge_specs(specs, {s: f"/api/{s}" for s in SERVICES})
+
+
+def test_seed_has_no_internal_routes(seed):
+    internal = ("revocations", "token-cache", "cache/invalidate", "cache/stats", "db-pool",
+                "password-hasher", "outbox", "metrics")
+    assert [path for path in seed["paths"] if path.endswith(internal)] == []
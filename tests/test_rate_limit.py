@@ -0,0 +1,84 @@
+# File: /tests/test_rate_limit.py
+# Rate limit của gateway (api-gateway/rate_limit.py): chỉ tính request khi mọi rule cho qua,
+# giới hạn theo email áp dụng cả cho body chunked
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main as gateway
+from rate_limit import MAX_BODY_FOR_EMAIL, MemoryBackend, RedisBackend, rate_limiter
+
+from resp_server import RespServer
+
+LIMITS = [("rl:a:1", 5, 60), ("rl:b:1", 1, 60)]
+
+
+def test_memory_denied_request_consumes_no_token():
+    async def scenario():
+        backend = MemoryBackend(100)
+        assert await backend.hit_all(LIMITS) == [0.0, 0.0]
+        for _ in range(3):
+            waits = await backend.hit_all(LIMITS)
+            assert waits[0] == 0 and waits[1] > 0
+        # Rule "a" không bị trừ token bởi các request đã bị rule "b" chặn
+        assert backend._buckets["rl:a:1"][0] == pytest.approx(4, abs=0.01)
+
+    asyncio.run(scenario())
+
+
+def test_redis_denied_request_consumes_no_token():
+    async def scenario():
+        server = await RespServer().start()
+        backend = RedisBackend(server.url)
+        try:
+            assert await backend.hit_all(LIMITS) == [0.0, 0.0]
+            for _ in range(3):
+                waits = await backend.hit_all(LIMITS)
+                assert waits[0] == 0 and waits[1] > 0
+            counters = {key.rsplit(b":", 1)[0]: int(value) for key, (value, _) in server.data.items()}
+            assert counters == {b"rl:a:1": 1, b"rl:b:1": 1}
+        finally:
+            backend._writer.close()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "backend", MemoryBackend(1000))
+    upstream = gateway.upstreams["auth"]
+    bodies = []
+
+    async def handler(request):
+        bodies.append(await request.aread())
+        return httpx.Response(401, stream=httpx.ByteStream('{"detail":"Sai mật khẩu"}'.encode()))
+
+    monkeypatch.setattr(upstream, "client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    test_client = TestClient(gateway.app)
+    test_client.bodies = bodies
+    return test_client
+
+
+def _chunked(body: bytes):
+    # Iterator -> httpx gửi Transfer-Encoding: chunked, không có Content-Length
+    yield body[:10]
+    yield body[10:]
+
+
+def test_email_limit_applies_to_chunked_body(client):
+    body = b'{"email": "A@example.com", "password": "x"}'
+    statuses = [client.post("/api/auth/login", content=_chunked(body)).status_code for _ in range(6)]
+    assert statuses == [401] * 5 + [429]
+    # Body đã đọc để lấy email vẫn được chuyển tiếp nguyên vẹn
+    assert client.bodies == [body] * 5
+
+
+def test_oversized_body_rejected_on_email_routes(client):
+    body = b'{"email": "a@example.com", "pad": "' + b"x" * MAX_BODY_FOR_EMAIL + b'"}'
+    assert client.post("/api/auth/login", content=_chunked(body)).status_code == 413
+    assert client.post("/api/auth/login", content=body).status_code == 413
+    assert client.bodies == []
@@ -0,0 +1,120 @@
+# File: /tests/test_search_cache.py
+# Test RedisBackend / ResponseCache (services/search_service/cache.py) với server RESP giả (tests/resp_server.py)
+
+import asyncio
+
+from services.search_service.cache import RedisBackend, ResponseCache
+
+from resp_server import RespServer
+
+
+def _run(scenario):
+    """Chạy scenario(server, backend) trên 1 server RESP giả mới"""
+    async def main():
+        server = await RespServer().start()
+        backend = RedisBackend(server.url, timeout=0.5)
+        try:
+            await scenario(server, backend)
+        finally:
+            await backend.close()
+            await server.stop()
+
+    asyncio.run(main())
+
+
+def test_get_set_px_del():
+    async def scenario(server, backend):
+        assert await backend.get("a") is None
+        await backend.set("a", b'{"x":1}', ttl=60)
+        assert await backend.get("a") == b'{"x":1}'
+        assert [b"SET", b"a", b'{"x":1}', b"PX", b"60000"] in server.commands
+
+        assert await backend.delete("a", "missing") == 1
+        assert await backend.get("a") is None
+        assert await backend.delete() == 0
+
+    _run(scenario)
+
+
+def test_set_px_expires():
+    async def scenario(server, backend):
+        await backend.set("short", b"1", ttl=0.05)
+        assert await backend.get("short") == b"1"
+        await asyncio.sleep(0.1)
+        assert await backend.get("short") is None
+
+    _run(scenario)
+
+
+def test_delete_prefix_scans_every_page():
+    async def scenario(server, backend):
+        for i in range(1200):  # Nhiều hơn COUNT 500 -> phải đi hết các trang SCAN
+            await backend.set(f"fmd:dentist:{i}", b"1", ttl=60)
+        await backend.set("fmd:clinics", b"1", ttl=60)
+        await backend.set("other:dentist:1", b"1", ttl=60)
+
+        assert await backend.delete_prefix("fmd:dentist:") == 1200
+        assert sorted(server.data) == [b"fmd:clinics", b"other:dentist:1"]
+        assert sum(1 for command in server.commands if command[0] == b"SCAN") > 1
+
+    _run(scenario)
+
+
+def test_cancelled_get_does_not_desync_connection():
+    async def scenario(server, backend):
+        await backend.set("a", b"value-a", ttl=60)
+        await backend.set("b", b"value-b", ttl=60)
+
+        server.delays["GET"] = 0.2
+        task = asyncio.create_task(backend.get("a"))
+        await asyncio.sleep(0.05)  # Lệnh GET a đã gửi, phản hồi chưa tới
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        server.delays.clear()
+
+        # Phản hồi của GET a (tới muộn) không được bị đọc thành kết quả của GET b
+        assert await backend.get("b") == b"value-b"
+        assert server.connections == 2
+        assert backend.errors == 0
+
+    _run(scenario)
+
+
+def test_timed_out_get_reconnects():
+    async def scenario(server, backend):
+        await backend.set("a", b"value-a", ttl=60)
+        await backend.set("b", b"value-b", ttl=60)
+
+        server.delays["GET"] = 0.7  # > timeout 0.5s của backend
+        try:
+            await backend.get("a")
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError("GET chậm hơn timeout phải ném TimeoutError")
+        server.delays.clear()
+
+        assert await backend.get("b") == b"value-b"
+        assert backend.errors == 1
+
+    _run(scenario)
+
+
+def test_response_cache_over_resp_backend():
+    async def scenario(server, backend):
+        cache = ResponseCache(backend, default_ttl=60, key_prefix="fmd:")
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return {"clinics": [1, 2]}
+
+        assert await cache.get_or_load("clinics", loader) == {"clinics": [1, 2]}
+        assert await cache.get_or_load("clinics", loader) == {"clinics": [1, 2]}
+        assert len(calls) == 1 and cache.hits == 1
+
+        assert await cache.invalidate_prefix("clin") == 1
+        assert await cache.get_or_load("clinics", loader) == {"clinics": [1, 2]}
+        assert len(calls) == 2
+
+    _run(scenario)
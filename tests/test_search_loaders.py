@@ -0,0 +1,85 @@
+# File: /tests/test_search_loaders.py
+# DataLoader / Loaders (services/search_service/loaders.py) với kết nối CSDL giả
+
+import asyncio
+
+from services.search_service.loaders import Loaders
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, args):
+        self.conn.queries.append((sql, list(args)))
+        self.conn.running += 1
+        try:
+            await self.conn.gate.wait()
+        finally:
+            self.conn.running -= 1
+        self.rows = [{"clinic_id": key, "name": f"Clinic {key}"} for key in args if key != "missing"]
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, blocked: bool = False):
+        self.queries = []
+        self.running = 0
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+
+def test_loads_in_same_tick_share_one_query():
+    async def scenario():
+        conn = FakeConnection()
+        loaders = Loaders(conn)
+        found = await asyncio.gather(loaders.clinic.load("c1"), loaders.clinic.load_many(["c2", "missing", "c1"]))
+        assert found[0]["name"] == "Clinic c1"
+        assert [row and row["clinic_id"] for row in found[1]] == ["c2", None, "c1"]
+        assert len(conn.queries) == 1 and sorted(conn.queries[0][1]) == ["c1", "c2", "missing"]
+        await loaders.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_aclose_cancels_running_dispatch_before_release():
+    async def scenario():
+        conn = FakeConnection(blocked=True)
+        loaders = Loaders(conn)
+        pending = loaders.clinic.load("c1")
+        await asyncio.sleep(0.01)
+        assert conn.running == 1  # Lô đang truy vấn trên kết nối
+
+        await loaders.aclose()
+        # Sau aclose không còn truy vấn nào dùng kết nối, key chưa tải bị hủy
+        assert conn.running == 0
+        assert pending.cancelled()
+        assert not loaders._tasks
+
+    asyncio.run(scenario())
+
+
+def test_aclose_cancels_dispatch_not_started_yet():
+    async def scenario():
+        conn = FakeConnection()
+        loaders = Loaders(conn)
+        pending = loaders.dentist.load("d1")  # Lô chưa kịp chạy (còn chờ gom key)
+        await loaders.aclose()
+        await asyncio.sleep(0.01)
+        assert conn.queries == []
+        assert pending.cancelled()
+
+    asyncio.run(scenario())
@@ -0,0 +1,106 @@
+# File: /tests/test_upstream.py
+# Test Upstream.send (api-gateway/upstream.py): bộ đếm và circuit breaker khi request bị hủy giữa chừng
+
+import asyncio
+
+import httpx
+
+from upstream import CircuitBreaker, CircuitOpenError, Upstream, UpstreamConfig
+
+
+def _upstream(handler, **config) -> Upstream:
+    config = UpstreamConfig(health_interval=0, backoff_max=0, **config)
+    upstream = Upstream("test", ["http://instance"], config)
+    upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return upstream
+
+
+async def _hang(request):
+    await asyncio.sleep(3600)
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    async def scenario():
+        upstream = _upstream(_hang)
+        instance = upstream.instances[0]
+        # Đưa breaker về half-open: mạch đã mở và hết thời gian chờ
+        instance.breaker._open()
+        instance.breaker.opened_at -= instance.breaker.reset_timeout
+
+        task = asyncio.create_task(upstream.send("GET", "/", headers={}))
+        await asyncio.sleep(0.01)
+        assert instance.breaker.state == CircuitBreaker.HALF_OPEN
+        assert instance.breaker.half_open_inflight == 1
+        assert instance.outstanding == 1
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("send phải ném lại CancelledError")
+
+        assert instance.outstanding == 0
+        assert instance.breaker.half_open_inflight == 0
+        # Bị hủy không phải lỗi của instance -> vẫn nhận request dò tiếp theo
+        assert instance.available()
+        await upstream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_request_is_not_a_failure():
+    async def scenario():
+        upstream = _upstream(_hang)
+        instance = upstream.instances[0]
+        task = asyncio.create_task(upstream.send("GET", "/", headers={}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert instance.outstanding == 0
+        assert instance.failures == 0
+        assert instance.breaker.consecutive_failures == 0
+        assert instance.breaker.state == CircuitBreaker.CLOSED
+        await upstream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_service_503_is_retried_but_does_not_open_circuit():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    async def scenario():
+        upstream = _upstream(handler, failure_threshold=2)
+        instance = upstream.instances[0]
+        for _ in range(3):
+            response = await upstream.send("GET", "/", headers={}, stream=False)
+            assert response.status_code == 503
+        assert len(calls) == 3 * (upstream.config.max_retries + 1)
+        assert instance.breaker.state == CircuitBreaker.CLOSED
+        assert instance.outstanding == 0
+        await upstream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_gateway_errors_open_circuit():
+    async def scenario():
+        upstream = _upstream(lambda request: httpx.Response(502), failure_threshold=2)
+        instance = upstream.instances[0]
+        # Lần thử thứ 2 mở mạch -> lần retry tiếp theo bị từ chối ngay
+        try:
+            await upstream.send("GET", "/", headers={}, stream=False)
+        except CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("502 liên tiếp phải mở circuit breaker")
+        assert instance.breaker.state == CircuitBreaker.OPEN
+        await upstream.aclose()
+
+    asyncio.run(scenario())